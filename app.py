@@ -1,13 +1,41 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import calendar
+import csv
+import hashlib
+import io
+import itertools
 import os
 import re
+import tempfile
+import time
 
 import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from werkzeug.utils import secure_filename
+
+from flask import (
+    Flask,
+    flash,
+    get_flashed_messages,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_template,
+    url_for,
+)
 
-from flask import Flask, flash, jsonify, redirect, render_template, request, session, url_for
-
-from database import init_db
+from availability import DIAS_SEMANA, TURNOS, availability_for, compile_availability
+import booking_queue
+import live_slots
+import migrations
+import rate_limit
+from repositories import events, instrumentation, unit_of_work
+from repositories.idempotency import idempotent
+from repositories.base import connect, month_range
+from repositories.cache import SharedCache
 from repositories.areas_repository import (
     create_area,
     delete_area as repo_delete_area,
@@ -16,18 +44,24 @@ from repositories.areas_repository import (
     update_area,
 )
 from repositories.errors import DuplicatePhoneError, RepositoryError
+from repositories.dashboard_repository import get_dashboard_snapshot
+from repositories.fila_repository import enqueue_booking, get_booking_ticket
 from repositories.escalas_repository import (
+    book_slots,
     count_agendados_non_responsavel,
     create_escala,
     delete_escala as repo_delete_escala,
     escala_exists,
-    get_dashboard_data,
+    get_escala_by_id,
     get_resumo_vagas,
+    iter_escalas_export,
 )
 from repositories.voluntarios_repository import (
     count_inativos,
     create_voluntario,
+    create_voluntarios,
     delete_voluntario as repo_delete_voluntario,
+    get_existing_phones,
     get_voluntario_area_ids,
     get_voluntario_by_id,
     get_voluntario_by_phone,
@@ -37,7 +71,6 @@ from repositories.voluntarios_repository import (
     update_voluntario,
     voluntario_has_area,
     search_voluntarios,
-    get_voluntarios_nao_escalados,
 )
 
 app = Flask(__name__)
@@ -45,7 +78,56 @@ app.secret_key = os.environ.get("SECRET_KEY", "chave_secreta_padrao_admin")
 
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin123")
 
-init_db()
+IMPORT_BATCH_SIZE = 500
+# Tamanhos das colunas voluntarios.nome e voluntarios.telefone
+NOME_MAX_CHARS = 100
+TELEFONE_MAX_DIGITS = 20
+
+# Resumos de vagas prontos (JSON e ETag) por (áreas, meses), no backend de
+# CACHE_BACKEND. Escritas invalidam os carimbos afetados depois do commit
+# (eventos), o que vale para todos os workers que compartilham o backend; com
+# o backend local, os outros workers podem mostrar um resumo até
+# RESUMO_CACHE_TTL_SECONDS desatualizado, o que só afeta a exibição: agendar
+# sempre revalida a vaga com os contadores travados.
+RESUMO_CACHE_TTL_SECONDS = float(os.environ.get("RESUMO_CACHE_TTL_SECONDS", 30))
+resumo_cache = SharedCache("resumo", RESUMO_CACHE_TTL_SECONDS)
+# Limites de /api/resumo_vagas?area_ids=...&meses=...
+RESUMO_MAX_AREAS = 20
+RESUMO_MAX_MESES = 3
+
+# O esquema é criado/atualizado no release (`python manage.py migrate` ou o
+# hook on_starting do gunicorn.conf.py), nunca na importação do app.
+_WORKER_STARTED = time.monotonic()
+_first_request_done = False
+
+rate_limit.init_app(app)
+instrumentation.init_app(app)
+unit_of_work.init_app(app)
+
+
+@app.before_request
+def _verificar_esquema():
+    if request.endpoint == "static":
+        return
+    try:
+        migrations.verify_once(connect)
+    except Exception as err:
+        # Tenta de novo na próxima requisição; a rota em si reporta o erro de banco
+        app.logger.warning("Não foi possível verificar a versão do esquema: %s", err)
+
+
+@app.after_request
+def _medir_primeira_requisicao(response):
+    global _first_request_done
+    if not _first_request_done:
+        _first_request_done = True
+        app.logger.info(
+            "Primeira requisição (%s) atendida %.0f ms após o início do worker %s.",
+            request.path,
+            (time.monotonic() - _WORKER_STARTED) * 1000,
+            os.getpid(),
+        )
+    return response
 
 
 def get_domingos_mes(ano, mes):
@@ -63,43 +145,11 @@ def get_domingos_mes(ano, mes):
 def get_dates_for_area(area_config, ano, mes):
     """
     Returns a list of dates and shifts available for a given area config.
-    area_config is a string like "0_Manhã,0_Noite,3_Noite"
+    area_config is a string like "0_Manhã,0_Noite,3_Noite"; the parsed config
+    and each month's dates are memoized in availability.py, so the items are
+    read-only.
     """
-    if not area_config:
-        return []
-
-    config_parts = area_config.split(",")
-    # map day_idx -> list of shifts
-    allowed = {}
-    for part in config_parts:
-        if "_" in part:
-            d_idx, shift = part.split("_")
-            allowed.setdefault(int(d_idx), []).append(shift)
-
-    cal = calendar.monthcalendar(ano, mes)
-    dates = []
-    
-    # calendar.monthcalendar: 0 is Monday, 6 is Sunday
-    # Our UI: 0 is Sunday, 1 is Monday ... 6 is Saturday
-    # Python's weekday(): 0 is Monday, 6 is Sunday
-    
-    for week in cal:
-        for day_idx_in_week, day in enumerate(week):
-            if day == 0:
-                continue
-            
-            # Convert day_idx_in_week (0=Mon, 6=Sun) to our UI idx (0=Sun, 1=Mon, ..., 6=Sat)
-            ui_idx = (day_idx_in_week + 1) % 7
-            
-            if ui_idx in allowed:
-                data_iso = f"{ano}-{mes:02d}-{day:02d}"
-                data_br = f"{day:02d}/{mes:02d}/{ano}"
-                dates.append({
-                    "iso": data_iso, 
-                    "br": data_br, 
-                    "turnos": allowed[ui_idx]
-                })
-    return sorted(dates, key=lambda x: x["iso"])
+    return list(compile_availability(area_config).dates(ano, mes))
 
 
 @app.template_filter("data_br")
@@ -112,6 +162,73 @@ def format_data_br(data_iso):
     return data_iso
 
 
+def _ano_mes(data):
+    if hasattr(data, "year"):
+        return data.year, data.month
+    return int(str(data)[:4]), int(str(data)[5:7])
+
+
+def _carimbo_mes(area_id, ano, mes):
+    return f"{area_id}:{ano}-{mes:02d}"
+
+
+def _carimbos_resumo(area_ids, meses):
+    carimbos = ["todos"]
+    for area_id in area_ids:
+        carimbos.append(f"area:{area_id}")
+        carimbos.extend(_carimbo_mes(area_id, ano, mes) for ano, mes in meses)
+    return tuple(carimbos)
+
+
+def _invalidar_resumos(slots=None, **_):
+    if slots is None:
+        resumo_cache.bump("todos")
+        return
+    afetados = {(int(area_id), *_ano_mes(data)) for area_id, data in slots}
+    resumo_cache.bump(*sorted(_carimbo_mes(*chave) for chave in afetados))
+
+
+def _invalidar_resumos_da_area(area_id=None, **_):
+    # Área nova não tem resumo guardado (área inexistente não entra no cache)
+    if area_id is not None:
+        resumo_cache.bump(f"area:{int(area_id)}")
+
+
+events.subscribe("escalas_changed", _invalidar_resumos)
+events.subscribe("areas_changed", _invalidar_resumos_da_area)
+
+# Vagas ao vivo (/api/resumo_vagas/stream): mesmos resumos e carimbos do resumo_cache
+live_vagas = live_slots.LiveSlots(
+    load=lambda area_ids, meses: montar_resumos_vagas(area_ids, meses),
+    stamps=lambda area_id, ano, mes: _carimbos_resumo([area_id], [(ano, mes)]),
+    counters=resumo_cache.versions,
+)
+events.subscribe("escalas_changed", live_vagas.escalas_changed)
+events.subscribe("areas_changed", live_vagas.areas_changed)
+
+
+def json_com_etag(payload):
+    """Serializa uma vez; o ETag forte é o hash dos próprios bytes."""
+    body = app.json.dumps(payload)
+    return body, hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]
+
+
+def resposta_condicional(body, etag, privada=False):
+    """
+    Resposta JSON com ETag que o navegador deve revalidar a cada uso
+    (Cache-Control: no-cache); If-None-Match igual vira 304 sem corpo.
+    privada=True para dados de um voluntário, que não podem ficar em caches compartilhados.
+    """
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    if privada:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response.make_conditional(request)
+
+
 def check_auth():
     return session.get("admin_logged_in") is True
 
@@ -131,7 +248,60 @@ def index():
     return render_template("index.html", areas=areas, domingos=domingos)
 
 
+def processar_agendamento(telefone, area_id, slots):
+    """
+    Valida e grava os horários pedidos. Retorna (payload, status_code).
+    Usado por /agendar no modo direto e pelos workers da fila (booking_queue).
+    """
+    voluntario = get_voluntario_by_phone(telefone)
+    if not voluntario:
+        return {"status": "error", "message": "Voluntário não cadastrado no sistema."}, 400
+
+    if not voluntario_has_area(voluntario["id"], area_id):
+        return {"status": "error", "message": "Você não está habilitado(a) para servir nesta área."}, 400
+
+    erros = []
+    pedidos = []
+    for slot in slots:
+        # Forma canônica: as vagas e as escalas já gravadas são comparadas com o que o MySQL devolve
+        try:
+            data_val, turno_val = slot.split("|")
+            data_val = date.fromisoformat(data_val).isoformat()
+        except ValueError:
+            erros.append(f"Formato de horário inválido: {slot}")
+            continue
+        if turno_val not in TURNOS:
+            erros.append(f"Formato de horário inválido: {slot}")
+            continue
+        if (data_val, turno_val) not in pedidos:
+            pedidos.append((data_val, turno_val))
+
+    resultados = []
+    if pedidos:
+        resultados = book_slots(voluntario["id"], area_id, pedidos)
+        if resultados is None:
+            return {"status": "error", "message": "Área inválida."}, 400
+
+    sucessos = 0
+    for resultado in resultados:
+        data_val, turno_val = resultado["data"], resultado["turno"]
+        if resultado["status"] == "lotado":
+            erros.append(f"Vagas esgotadas para {data_val} ({turno_val}).")
+        elif resultado["status"] == "duplicado":
+            erros.append(f"Você já está escalado(a) em {data_val} ({turno_val}).")
+        else:
+            sucessos += 1
+
+    if sucessos > 0:
+        msg = f"{sucessos} agendamento(s) realizado(s) com sucesso!"
+        if erros:
+            msg += " Alguns horários não puderam ser marcados: " + "; ".join(erros)
+        return {"status": "success", "message": msg}, 200
+    return {"status": "error", "message": "Não foi possível realizar nenhum agendamento: " + "; ".join(erros)}, 400
+
+
 @app.route("/agendar", methods=["POST"])
+@idempotent("agendar")
 def agendar():
     telefone = request.form.get("telefone")
     area_id = request.form.get("area_id")
@@ -147,50 +317,47 @@ def agendar():
     if not slots:
         return jsonify({"status": "error", "message": "Nenhum horário selecionado."}), 400
 
-    try:
-        voluntario = get_voluntario_by_phone(telefone)
-        if not voluntario:
-            return jsonify({"status": "error", "message": "Voluntário não cadastrado no sistema."}), 400
-
-        if not voluntario_has_area(voluntario["id"], area_id):
-            return jsonify({"status": "error", "message": "Você não está habilitado(a) para servir nesta área."}), 400
-
-        area = get_area_by_id(area_id)
-        if not area:
-            return jsonify({"status": "error", "message": "Área inválida."}), 400
+    if booking_queue.enabled():
+        # Só validação barata aqui; o resto acontece no worker, por ordem de chegada
+        if not telefone or not (area_id or "").isdigit():
+            return jsonify({"status": "error", "message": "Telefone e área são obrigatórios."}), 400
+        try:
+            ticket = enqueue_booking(telefone, int(area_id), slots)
+        except RepositoryError:
+            return jsonify({"status": "error", "message": "Erro interno ao processar agendamento."}), 500
+        booking_queue.start_workers(app, processar_agendamento)
+        booking_queue.notify()
+        return jsonify({
+            "status": "queued",
+            "message": "Pedido recebido! Estamos confirmando seus horários.",
+            "ticket": ticket,
+            "status_url": url_for("agendar_status", ticket=ticket),
+        }), 202
 
-        sucessos = 0
-        erros = []
+    try:
+        payload, status_code = processar_agendamento(telefone, area_id, slots)
+    except RepositoryError:
+        return jsonify({"status": "error", "message": "Erro interno ao processar agendamento."}), 500
+    return jsonify(payload), status_code
 
-        for slot in slots:
-            try:
-                data_val, turno_val = slot.split("|")
-            except ValueError:
-                erros.append(f"Formato de horário inválido: {slot}")
-                continue
 
-            agendados = count_agendados_non_responsavel(area_id, data_val, turno_val)
-            if agendados >= area["max_pessoas"]:
-                erros.append(f"Vagas esgotadas para {data_val} ({turno_val}).")
-                continue
+@app.route("/api/agendar/<ticket>", methods=["GET"])
+def agendar_status(ticket):
+    try:
+        pedido = get_booking_ticket(ticket)
+    except RepositoryError:
+        return jsonify({"status": "error", "message": "Erro interno ao consultar agendamento."}), 500
 
-            if escala_exists(voluntario["id"], data_val, turno_val):
-                erros.append(f"Você já está escalado(a) em {data_val} ({turno_val}).")
-                continue
+    if not pedido:
+        return jsonify({"status": "error", "message": "Pedido não encontrado."}), 404
 
-            create_escala(voluntario["id"], area_id, data_val, turno_val)
-            sucessos += 1
+    if pedido["status"] != "concluido":
+        resposta = {"status": pedido["status"], "ticket": ticket}
+        if "posicao" in pedido:
+            resposta["posicao"] = pedido["posicao"]
+        return jsonify(resposta), 202
 
-        if sucessos > 0:
-            msg = f"{sucessos} agendamento(s) realizado(s) com sucesso!"
-            if erros:
-                msg += " Alguns horários não puderam ser marcados: " + "; ".join(erros)
-            return jsonify({"status": "success", "message": msg})
-        else:
-            return jsonify({"status": "error", "message": "Não foi possível realizar nenhum agendamento: " + "; ".join(erros)}), 400
-
-    except RepositoryError:
-        return jsonify({"status": "error", "message": "Erro interno ao processar agendamento."}), 500
+    return app.response_class(pedido["resposta"], status=pedido["status_code"], mimetype="application/json")
 
 
 @app.route("/api/voluntario/areas", methods=["GET"])
@@ -207,7 +374,9 @@ def get_voluntario_areas():
     if not voluntario:
         return jsonify({"status": "error", "message": "Voluntário não cadastrado."}), 404
 
-    return jsonify({"status": "success", "nome": voluntario["nome"], "areas": areas})
+    return resposta_condicional(
+        *json_com_etag({"status": "success", "nome": voluntario["nome"], "areas": areas}), privada=True
+    )
 
 
 @app.route("/api/vagas", methods=["GET"])
@@ -229,79 +398,154 @@ def check_vagas():
         return jsonify({"vagas_disponiveis": 0, "lotado": True}), 500
 
 
+def _mes_inicial():
+    """(ano, mes) de ?inicio=AAAA-MM, ou o próximo mês. ValueError se inválido."""
+    if request.args.get("inicio"):
+        inicio = datetime.strptime(request.args["inicio"], "%Y-%m")
+        return inicio.year, inicio.month
+    hoje = datetime.now()
+    return (hoje.year, hoje.month + 1) if hoje.month < 12 else (hoje.year + 1, 1)
+
+
+def _meses_seguidos(ano, mes, quantidade):
+    meses = []
+    for _ in range(quantidade):
+        meses.append((ano, mes))
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return meses
+
+
 @app.route("/api/resumo_vagas", methods=["GET"])
 def resumo_vagas():
+    """
+    ?area_id=N: {"max_pessoas", "datas"} da área.
+    ?area_ids=1,2,3: {"areas": [{"id", "max_pessoas", "datas"}, ...]} das áreas
+    que existem, na ordem pedida, numa consulta só.
+    Nos dois casos, meses=N (até RESUMO_MAX_MESES) junta em "datas" os N meses
+    a partir de inicio=AAAA-MM (padrão: o próximo mês).
+    """
     area_id = request.args.get("area_id")
-    if not area_id:
+    lista = request.args.get("area_ids")
+    if not area_id and not lista:
         return jsonify({"area": "Area cadastrada"})
 
-    hoje = datetime.now()
-    prox_mes = hoje.month + 1 if hoje.month < 12 else 1
-    prox_ano = hoje.year if hoje.month < 12 else hoje.year + 1
+    try:
+        ano, mes = _mes_inicial()
+        quantidade = int(request.args.get("meses", 1))
+    except ValueError:
+        return jsonify({"error": "Período inválido."}), 400
+    if not 1 <= quantidade <= RESUMO_MAX_MESES:
+        return jsonify({"error": f"meses deve estar entre 1 e {RESUMO_MAX_MESES}."}), 400
+    meses = _meses_seguidos(ano, mes, quantidade)
+
+    if lista:
+        partes = [parte.strip() for parte in lista.split(",") if parte.strip()]
+        if not partes or not all(parte.isdigit() for parte in partes):
+            return jsonify({"error": "Lista de áreas inválida."}), 400
+        area_ids = list(dict.fromkeys(int(parte) for parte in partes))
+        if len(area_ids) > RESUMO_MAX_AREAS:
+            return jsonify({"error": f"Máximo de {RESUMO_MAX_AREAS} áreas por consulta."}), 400
+    elif area_id.isdigit():
+        area_ids = [int(area_id)]
+    else:
+        area_ids = []
+
+    def carregar():
+        resumos = montar_resumos_vagas(area_ids, meses)
+        if lista:
+            return json_com_etag({"areas": [{"id": id, **resumos[id]} for id in area_ids if id in resumos]})
+        return json_com_etag(resumos[area_ids[0]]) if resumos else None
 
     try:
-        max_p, agrupado, agrupado_responsavel = get_resumo_vagas(area_id, prox_ano, prox_mes)
+        if area_ids:
+            # Com o resumo guardado, um If-None-Match igual responde 304 sem consultar o banco
+            chave = ("areas" if lista else "area", "-".join(map(str, area_ids)), ano, mes, quantidade)
+            resumo = resumo_cache.get_or_load(chave, carregar, stamps=_carimbos_resumo(area_ids, meses))
+        else:
+            resumo = None
     except RepositoryError:
         return jsonify({"error": "Erro ao gerar resumo"}), 500
 
-    if max_p is None:
+    if resumo is None:
         app.logger.error("Area not found")
         return jsonify({"error": "Area not found"})
 
-    resultado = {}
-    for r in agrupado:
-        d = r["data"].strftime("%Y-%m-%d") if hasattr(r["data"], "strftime") else str(r["data"])
-        t = r["turno"]
-        resultado.setdefault(d, {})[t] = r["total"]
+    return resposta_condicional(*resumo)
 
-    resultado_responsavel = {}
-    for r in agrupado_responsavel:
-        d = r["data"].strftime("%Y-%m-%d") if hasattr(r["data"], "strftime") else str(r["data"])
-        t = r["turno"]
-        resultado_responsavel.setdefault(d, {})[t] = r["total"]
 
-    area = get_area_by_id(area_id)
-    if not area:
+@app.route("/api/resumo_vagas/stream", methods=["GET"])
+def resumo_vagas_stream():
+    """
+    Server-Sent Events da área (?area_id=N, inicio=AAAA-MM e meses=N como em
+    /api/resumo_vagas). Cada evento traz "mes" (AAAA-MM): "resumo" com
+    max_pessoas e datas do mês ao conectar (e sempre que as datas oferecidas
+    mudarem), "vagas" só com os turnos que mudaram; "fim" se a área for
+    excluída. Ver live_slots.
+    """
+    area_id = request.args.get("area_id", "")
+    try:
+        ano, mes = _mes_inicial()
+        quantidade = int(request.args.get("meses", 1))
+    except ValueError:
+        return jsonify({"error": "Período inválido."}), 400
+    if not 1 <= quantidade <= RESUMO_MAX_MESES:
+        return jsonify({"error": f"meses deve estar entre 1 e {RESUMO_MAX_MESES}."}), 400
+    if not area_id.isdigit():
         return jsonify({"error": "Area not found"}), 404
 
-    availability = area.get("dias_disponiveis", "0_Manhã,0_Noite") # Default to Sundays if empty
-    dates_config = get_dates_for_area(availability, prox_ano, prox_mes)
-    
-    resumo_final = []
-
-    for item in dates_config:
-        d_iso = item["iso"]
-        d_br = item["br"][:5]
-        turnos_permitidos = item["turnos"]
-
-        dias = ['segunda', 'terça', 'quarta', 'quinta', 'sexta', 'sábado', 'domingo']
-
-        # --- Lógica para o dia da semana ---
-        data_obj = datetime.strptime(d_iso, "%Y-%m-%d")
-        dia_semana = dias[data_obj.weekday()] # Pega "Segunda" de "Segunda-feira"
-        # -----------------------------------
-
-        res_item = {
-            "iso": d_iso,
-            "br": d_br,
-            "dia_semana": dia_semana,
-            "turnos": []
-        }
-
-        for t in ["Manhã", "Noite"]:
-            if t in turnos_permitidos:
-                esc = resultado.get(d_iso, {}).get(t, 0)
-                resp = resultado_responsavel.get(d_iso, {}).get(t, 0)
-                res_item["turnos"].append({
-                    "nome": t,
-                    "escalados": esc,
-                    "responsavel": resp,
-                    "vagas_livres": max(0, max_p - esc)
-                })
-        
-        resumo_final.append(res_item)
+    try:
+        sub = live_vagas.subscribe(int(area_id), _meses_seguidos(ano, mes, quantidade))
+    except RepositoryError:
+        return jsonify({"error": "Erro ao gerar resumo"}), 500
+    if sub is None:
+        response = jsonify({"status": "error", "message": "Muitas conexões ao vivo. Tente novamente em instantes."})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+    if sub is False:
+        return jsonify({"error": "Area not found"}), 404
+
+    # Gerador sem stream_with_context: a conexão do banco da requisição já foi devolvida
+    return app.response_class(
+        live_vagas.stream(sub),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return jsonify({"max_pessoas": max_p, "datas": resumo_final})
+
+def montar_resumos_vagas(area_ids, meses):
+    """
+    {area_id: {"max_pessoas", "datas"}} das áreas que existem, com as datas de
+    todos os `meses` em ordem; uma consulta para todas as áreas.
+    vagas_livres é só para exibição e pode vir do resumo_cache: nenhuma
+    decisão de vaga deve usá-lo (book_slots confere os contadores travados).
+    """
+    resumos = {}
+    for area_id, (area, ocupacao) in get_resumo_vagas(area_ids, meses).items():
+        max_p = area["max_pessoas"]
+        disponibilidade = availability_for(area)
+        resumo_final = []
+        for ano, mes in meses:
+            for item in disponibilidade.dates(ano, mes):
+                res_item = {
+                    "iso": item["iso"],
+                    "br": item["br"][:5],
+                    "dia_semana": item["dia_semana"],
+                    "turnos": []
+                }
+
+                for t in item["turnos"]:
+                    esc, resp = ocupacao.get((item["iso"], t), (0, 0))
+                    res_item["turnos"].append({
+                        "nome": t,
+                        "escalados": esc,
+                        "responsavel": resp,
+                        "vagas_livres": max(0, max_p - esc)
+                    })
+
+                resumo_final.append(res_item)
+        resumos[area_id] = {"max_pessoas": max_p, "datas": resumo_final}
+    return resumos
 
 
 @app.route("/admin/login", methods=["GET", "POST"])
@@ -322,111 +566,151 @@ def admin_logout():
     return redirect(url_for("index"))
 
 
-def _build_dashboard_context(is_admin):
-    """Build the template context for the dashboard / escala page."""
-    area_filter = request.args.get("area_id")
-    month_year = request.args.get("month_year")
+MESES_NOMES = [
+    "",
+    "janeiro",
+    "fevereiro",
+    "março",
+    "abril",
+    "maio",
+    "junho",
+    "julho",
+    "agosto",
+    "setembro",
+    "outubro",
+    "novembro",
+    "dezembro",
+]
+
+# Pedaços do dashboard enviados juntos; o marcador (no template, antes de cada
+# parte que consulta o banco) manda na hora o que já foi renderizado
+DASHBOARD_CHUNK_CHARS = 16 * 1024
+DASHBOARD_FLUSH = "<!-- flush -->"
+
+
+def _em_blocos(partes, tamanho=DASHBOARD_CHUNK_CHARS, marcador=DASHBOARD_FLUSH):
+    buffer, total = [], 0
+    for parte in partes:
+        buffer.append(parte)
+        total += len(parte)
+        if total >= tamanho or marcador in parte:
+            yield "".join(buffer)
+            buffer, total = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _internar(indices, nome):
+    return indices.setdefault(nome, len(indices))
+
+
+def _colunas_nao_escalados(grade, indices):
+    vols = grade["nao_escalados"]
+    return {
+        "id": [vol["id"] for vol in vols],
+        "nome": [_internar(indices, vol["nome"]) for vol in vols],
+        "telefone": [vol["telefone"] for vol in vols],
+    }
+
+
+def _dashboard_colunar(area_id, ano, mes, grade):
+    """
+    Grade do mês (get_dashboard_snapshot) em colunas, para o dashboard montar no navegador:
+    {"area_id", "mes", "dias": [iso], "turnos": [nome], "nomes": [nome], "max_rows",
+     "escalas": {"id", "dia", "turno", "nome", "responsavel"}, "nao_escalados": {"id", "nome", "telefone"}}.
+    dia/turno/nome são índices em dias/turnos/nomes; cada nome aparece uma vez.
+    Dentro de um turno as escalas vêm na ordem da grade: responsáveis, depois equipe.
+    """
+    indices = {}
+    dias = [item["iso"] for item in grade["datas"]]
+    escalas = {"id": [], "dia": [], "turno": [], "nome": [], "responsavel": []}
+    for dia, iso in enumerate(dias):
+        for turno, nome_turno in enumerate(TURNOS):
+            celula = grade["dias"][iso][nome_turno]
+            for responsavel, grupo in ((1, "responsavel"), (0, "equipe")):
+                for item in celula[grupo]:
+                    escalas["id"].append(item["id"])
+                    escalas["dia"].append(dia)
+                    escalas["turno"].append(turno)
+                    escalas["nome"].append(_internar(indices, item["nome"]))
+                    escalas["responsavel"].append(responsavel)
+    nao_escalados = _colunas_nao_escalados(grade, indices)
+    return {
+        "area_id": area_id,
+        "mes": f"{ano}-{mes:02d}",
+        "dias": dias,
+        "turnos": list(TURNOS),
+        "nomes": list(indices),
+        "max_rows": grade["max_rows"],
+        "escalas": escalas,
+        "nao_escalados": nao_escalados,
+    }
+
+
+def _dashboard_celula(area_id, ano, mes, grade, iso, turno):
+    """
+    Só o turno alterado, no formato de _dashboard_colunar (nomes próprios da
+    resposta), mais o que muda junto: dias, max_rows e não escalados.
+    """
+    indices = {}
+    celula = grade["dias"].get(iso, {}).get(turno, {"responsavel": [], "equipe": []})
+    escalas = {"id": [], "nome": [], "responsavel": []}
+    for responsavel, grupo in ((1, "responsavel"), (0, "equipe")):
+        for item in celula[grupo]:
+            escalas["id"].append(item["id"])
+            escalas["nome"].append(_internar(indices, item["nome"]))
+            escalas["responsavel"].append(responsavel)
+    nao_escalados = _colunas_nao_escalados(grade, indices)
+    return {
+        "area_id": area_id,
+        "mes": f"{ano}-{mes:02d}",
+        "dia": iso,
+        "turno": turno,
+        "dias": [item["iso"] for item in grade["datas"]],
+        "nomes": list(indices),
+        "max_rows": grade["max_rows"],
+        "escalas": escalas,
+        "nao_escalados": nao_escalados,
+    }
+
+
+def _dashboard_grids(areas, ano, mes):
+    """(nome, grade em colunas) de cada área, lida (get_dashboard_snapshot) só quando o template chega nela."""
+    for area in areas:
+        try:
+            yield area["nome"], _dashboard_colunar(area["id"], ano, mes, get_dashboard_snapshot(area, ano, mes))
+        except RepositoryError:
+            yield area["nome"], {"area_id": area["id"], "erro": "Erro ao carregar dashboard."}
 
+
+def _mes_do_dashboard():
+    """(ano, mes) de ?month_year=AAAA-MM; o mês atual se ausente ou inválido."""
     hoje = datetime.now()
+    month_year = request.args.get("month_year")
     if month_year:
         try:
             ano, mes = map(int, month_year.split("-"))
+            if 1 <= mes <= 12:
+                return ano, mes
         except Exception:
-            ano, mes = hoje.year, hoje.month
-    else:
-        ano, mes = hoje.year, hoje.month
-
-    try:
-        areas, escalas = get_dashboard_data(ano, mes, area_filter)
-    except RepositoryError:
-        flash("Erro ao carregar dashboard.", "danger")
-        return render_template(
-            "admin/dashboard.html", areas=[], grids={}, domingos=[], mes_str="",
-            max_rows={}, lista_meses=[], my_sel="", area_sel=None, is_admin=is_admin,
-            nao_escalados=[],
-        )
-
-    if not area_filter and areas:
-        area_filter = str(areas[0]["id"])
-
-    nao_escalados = []
-    if is_admin and area_filter:
-        try:
-            nao_escalados = get_voluntarios_nao_escalados(ano, mes, int(area_filter))
-        except RepositoryError:
             pass
+    return hoje.year, hoje.month
 
-    # Get unique dates for the grid based on the area's availability
-    area_objs = {str(a["id"]): a for a in areas}
-    
-    # If a filter is selected, we only show that area's dates. 
-    # If no filter (showing all), we might still want to show all days that have assignments or Sundays as default.
-    grid_dates = []
-    if area_filter and area_filter in area_objs:
-        target_area = area_objs[area_filter]
-        availability = target_area.get("dias_disponiveis", "0_Manhã,0_Noite")
-        grid_dates = get_dates_for_area(availability, ano, mes)
-    else:
-        # Default fallback to Sundays if no area filter or multi-area view
-        grid_dates = get_domingos_mes(ano, mes)
-
-    # Ensure dates from existing escalas are also included if they fall outside standard config (safety)
-    existing_iso_dates = set(d["iso"] for d in grid_dates)
-    for escala in escalas:
-        d_escala = escala["data"]
-        d_iso = d_escala.strftime("%Y-%m-%d") if hasattr(d_escala, "strftime") else str(d_escala)
-        if d_iso not in existing_iso_dates:
-            # We don't have the BR format easily here without a helper, but let's try to keeping it consistent
-            d_dt = datetime.strptime(d_iso, "%Y-%m-%d")
-            existing_iso_dates.add(d_iso)
-            grid_dates.append({"iso": d_iso, "br": d_dt.strftime("%d/%m/%Y")})
-    
-    grid_dates = sorted(grid_dates, key=lambda x: x["iso"])
 
-    grids = {}
-    for area in areas:
-        if area_filter and str(area["id"]) != str(area_filter):
-            continue
-        grids[area["nome"]] = {
-            "id": area["id"],
-            "dias": {
-                dia["iso"]: {"Manhã": {"responsavel": [], "equipe": []}, "Noite": {"responsavel": [], "equipe": []}}
-                for dia in grid_dates
-            }
-        }
-
-    for escala in escalas:
-        area_nome = escala["area_nome"]
-        data_escala = escala["data"]
-        data_iso = data_escala.strftime("%Y-%m-%d") if hasattr(data_escala, "strftime") else data_escala
-        turno = escala["turno"]
-        if area_nome in grids and data_iso in grids[area_nome]["dias"]:
-            grupo = "responsavel" if escala["responsavel"] else "equipe"
-            grids[area_nome]["dias"][data_iso][turno][grupo].append({"id": escala["id"], "nome": escala["voluntario_nome"]})
-
-    max_rows = {}
-    for area_nome, dados in grids.items():
-        maior = 0
-        for turnos in dados["dias"].values():
-            maior = max(maior, len(turnos["Manhã"]["equipe"]), len(turnos["Noite"]["equipe"]))
-        max_rows[area_nome] = max(maior + 2, 2)
-
-    meses_nomes = [
-        "",
-        "janeiro",
-        "fevereiro",
-        "março",
-        "abril",
-        "maio",
-        "junho",
-        "julho",
-        "agosto",
-        "setembro",
-        "outubro",
-        "novembro",
-        "dezembro",
-    ]
-    mes_str = f"{meses_nomes[mes]} / {ano}"
+def _build_dashboard_context(is_admin):
+    """
+    Dashboard / escala do mês. O cabeçalho (só o catálogo de áreas, em cache)
+    sai primeiro; a grade de cada área, com a lista de não escalados, vem de
+    dashboard_snapshots e segue no corpo como JSON em colunas
+    (_dashboard_colunar), montado em tabela pelo navegador. Adicionar e
+    remover escalas usam PATCH /admin/api/dashboard, que devolve só o turno
+    alterado.
+    """
+    area_filter = request.args.get("area_id")
+    hoje = datetime.now()
+    ano, mes = _mes_do_dashboard()
+
+    mes_str = f"{MESES_NOMES[mes]} / {ano}"
 
     lista_meses = []
     curr_dt = datetime(hoje.year, hoje.month, 1)
@@ -438,7 +722,7 @@ def _build_dashboard_context(is_admin):
 
     curr_m, curr_y = curr_dt.month, curr_dt.year
     for _ in range(12):
-        lista_meses.append({"val": f"{curr_y}-{curr_m:02d}", "nome": f"{meses_nomes[curr_m].capitalize()} {curr_y}"})
+        lista_meses.append({"val": f"{curr_y}-{curr_m:02d}", "nome": f"{MESES_NOMES[curr_m].capitalize()} {curr_y}"})
         curr_m += 1
         if curr_m > 12:
             curr_m = 1
@@ -446,19 +730,33 @@ def _build_dashboard_context(is_admin):
 
     my_sel = f"{ano}-{mes:02d}"
 
-    return render_template(
+    try:
+        areas = list_areas()
+    except RepositoryError:
+        flash("Erro ao carregar dashboard.", "danger")
+        return render_template(
+            "admin/dashboard.html", areas=[], grids=[], mes_str="", lista_meses=[], my_sel="",
+            area_sel=None, is_admin=is_admin,
+        )
+
+    if not area_filter and areas:
+        area_filter = str(areas[0]["id"])
+    selecionadas = [area for area in areas if str(area["id"]) == str(area_filter)]
+
+    # Tira as mensagens da sessão agora: o cookie sai com os cabeçalhos, antes do corpo
+    get_flashed_messages(with_categories=True)
+
+    corpo = stream_template(
         "admin/dashboard.html",
         areas=areas,
-        grids=grids,
-        domingos=grid_dates, # renamed to match template expectation but contains flex dates
+        grids=_dashboard_grids(selecionadas, ano, mes),
         mes_str=mes_str,
-        max_rows=max_rows,
         lista_meses=lista_meses,
         my_sel=my_sel,
         area_sel=area_filter,
         is_admin=is_admin,
-        nao_escalados=nao_escalados,
     )
+    return app.response_class(_em_blocos(corpo), mimetype="text/html")
 
 
 # @app.route("/escala")
@@ -530,6 +828,31 @@ def admin_voluntarios():
     )
 
 
+def _importar_voluntarios(lote):
+    """
+    Grava um lote da importação numa transação própria, fora da unidade de
+    trabalho da requisição: um lote com erro não desfaz os anteriores. Se o
+    lote falhar (telefone cadastrado por outro admin no meio tempo, por
+    exemplo), refaz linha a linha. Retorna (importados, erros).
+    """
+    # Contexto de app novo: sem g.db_uow, o repositório usa conexão e commit próprios
+    try:
+        with app.app_context():
+            return create_voluntarios(lote), 0
+    except RepositoryError as err:
+        app.logger.warning("Lote de %d voluntários falhou, importando um a um: %s", len(lote), err)
+
+    importados = 0
+    erros = 0
+    for candidato in lote:
+        try:
+            with app.app_context():
+                importados += create_voluntarios([candidato])
+        except RepositoryError:
+            erros += 1
+    return importados, erros
+
+
 @app.route("/admin/voluntarios/import", methods=["POST"])
 def admin_voluntarios_import():
     if not check_auth():
@@ -573,6 +896,8 @@ def admin_voluntarios_import():
         importados = 0
         existentes = 0
         erros = 0
+        candidatos = []
+        telefones_vistos = set()
 
         for index, row in df.iterrows():
             nome_val = row.get("nome")
@@ -589,19 +914,15 @@ def admin_voluntarios_import():
                 
             telefone = re.sub(r'\D', '', telefone_bruto)
 
-            if not nome or not telefone:
+            if not nome or not telefone or len(nome) > NOME_MAX_CHARS or len(telefone) > TELEFONE_MAX_DIGITS:
                 erros += 1
                 continue
 
-            # Check if phone exists
-            try:
-                existente = get_voluntario_by_phone(telefone)
-                if existente:
-                    existentes += 1
-                    continue
-            except RepositoryError:
-                erros += 1
+            # Same phone twice in the file: the first row wins
+            if telefone in telefones_vistos:
+                existentes += 1
                 continue
+            telefones_vistos.add(telefone)
 
             # Parse 'responsavel' / 'lider'
             responsavel = 0
@@ -625,11 +946,21 @@ def admin_voluntarios_import():
                                 areas_selecionadas.append(str(areas_map[nome_area]))
                     break
 
+            candidatos.append((nome, telefone, responsavel, areas_selecionadas))
+
+        # Constant number of queries per batch instead of two per row
+        for inicio in range(0, len(candidatos), IMPORT_BATCH_SIZE):
+            lote = candidatos[inicio:inicio + IMPORT_BATCH_SIZE]
             try:
-                create_voluntario(nome, telefone, responsavel, areas_selecionadas)
-                importados += 1
-            except (DuplicatePhoneError, RepositoryError):
-                erros += 1
+                cadastrados = get_existing_phones([c[1] for c in lote])
+            except RepositoryError:
+                erros += len(lote)
+                continue
+            novos = [c for c in lote if c[1] not in cadastrados]
+            existentes += len(lote) - len(novos)
+            gravados, falhas = _importar_voluntarios(novos)
+            importados += gravados
+            erros += falhas
 
         flash(f"Importação concluída: {importados} importados, {existentes} já existiam, {erros} com erro.", "success")
 
@@ -830,6 +1161,90 @@ def delete_escala(id):
     return redirect(request.referrer or url_for("admin_dashboard"))
 
 
+@app.route("/admin/api/dashboard", methods=["GET"])
+def api_admin_dashboard():
+    """Grade do mês de uma área em colunas (?month_year=AAAA-MM&area_id=N); ver _dashboard_colunar."""
+    if not check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    ano, mes = _mes_do_dashboard()
+    try:
+        area = get_area_by_id(request.args.get("area_id", type=int))
+        if not area:
+            return jsonify({"error": "Area not found"}), 404
+        grade = get_dashboard_snapshot(area, ano, mes)
+    except RepositoryError:
+        return jsonify({"error": "Erro ao carregar dashboard."}), 500
+
+    body, etag = json_com_etag(_dashboard_colunar(area["id"], ano, mes, grade))
+    return resposta_condicional(body, etag, privada=True)
+
+
+@app.route("/admin/api/dashboard", methods=["PATCH"])
+def api_admin_dashboard_patch():
+    """
+    Uma alteração na grade, em JSON:
+    {"op": "add", "voluntario_id", "area_id", "data": "AAAA-MM-DD", "turno"} ou
+    {"op": "remove", "escala_id"}. Responde com o turno alterado (_dashboard_celula).
+    """
+    if not check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    dados = request.get_json(silent=True) or {}
+    op = dados.get("op")
+    try:
+        if op == "add":
+            try:
+                voluntario_id = int(dados["voluntario_id"])
+                area_id = int(dados["area_id"])
+                data = datetime.strptime(str(dados["data"]), "%Y-%m-%d").strftime("%Y-%m-%d")
+                turno = dados["turno"]
+            except (KeyError, TypeError, ValueError):
+                return jsonify({"error": "Voluntário, área, data e turno são obrigatórios."}), 400
+            if turno not in TURNOS:
+                return jsonify({"error": "Turno inválido."}), 400
+            area = get_area_by_id(area_id)
+            if not area:
+                return jsonify({"error": "Area not found"}), 404
+            if not get_voluntario_by_id(voluntario_id):
+                return jsonify({"error": "Voluntário não encontrado."}), 404
+            if not voluntario_has_area(voluntario_id, area_id):
+                return jsonify({"error": "O voluntário não está habilitado para servir nesta área."}), 400
+            if escala_exists(voluntario_id, data, turno):
+                return jsonify({"error": "O voluntário selecionado já está escalado neste dia e turno."}), 409
+            create_escala(voluntario_id, area_id, data, turno)
+            status = 201
+        elif op == "remove":
+            try:
+                escala_id = int(dados["escala_id"])
+            except (KeyError, TypeError, ValueError):
+                return jsonify({"error": "escala_id é obrigatório."}), 400
+            # A área é conferida antes de excluir: um 404 aqui não pode deixar a exclusão para o commit
+            escala = get_escala_by_id(escala_id)
+            if escala is None:
+                return jsonify({"error": "Agendamento não encontrado."}), 404
+            area = get_area_by_id(escala["area_id"])
+            if not area:
+                return jsonify({"error": "Area not found"}), 404
+            removida = repo_delete_escala(escala_id)
+            if removida is None:
+                return jsonify({"error": "Agendamento não encontrado."}), 404
+            data = removida["data"]
+            data = data.strftime("%Y-%m-%d") if hasattr(data, "strftime") else str(data)
+            turno = removida["turno"]
+            status = 200
+        else:
+            return jsonify({"error": "op deve ser add ou remove."}), 400
+
+        # A escrita invalidou a grade do mês na mesma transação: esta leitura já a remonta
+        ano, mes = _ano_mes(data)
+        grade = get_dashboard_snapshot(area, ano, mes)
+    except RepositoryError:
+        return jsonify({"error": "Erro ao salvar agendamento no banco de dados."}), 500
+
+    return jsonify(_dashboard_celula(area["id"], ano, mes, grade, data, turno)), status
+
+
 @app.route("/admin/api/voluntarios/search", methods=["GET"])
 def api_admin_voluntarios_search():
     if not check_auth():
@@ -887,6 +1302,125 @@ def admin_escala_add():
     return redirect(url_for("admin_dashboard"))
 
 
+# Exportação da escala (/admin/export/escala): linhas lidas do banco em lotes
+# e escritas direto no CSV ou na planilha, sem montar o período em memória
+EXPORT_COLUNAS = ("Área", "Data", "Dia", "Turno", "Função", "Voluntário", "Telefone")
+EXPORT_CSV_CHUNK_ROWS = 500
+EXPORT_XLSX_CHUNK_BYTES = 64 * 1024
+
+
+def _periodo_export(valor):
+    """(inicio, fim, rótulo) de AAAA-MM (o mês) ou AAAA (o ano). ValueError se inválido."""
+    if re.fullmatch(r"\d{4}", valor):
+        ano = int(valor)
+        return date(ano, 1, 1), date(ano + 1, 1, 1), valor
+    inicio = datetime.strptime(valor, "%Y-%m")
+    return (*month_range(inicio.year, inicio.month), inicio.strftime("%Y-%m"))
+
+
+def _linhas_export(escalas):
+    for row in escalas:
+        data = row["data"]
+        yield [
+            row["area"],
+            data,
+            DIAS_SEMANA[data.weekday()],
+            row["turno"],
+            "Responsável" if row["responsavel"] else "Equipe",
+            row["voluntario"],
+            row["telefone"] or "",
+        ]
+
+
+def _csv_em_blocos(linhas, tamanho=EXPORT_CSV_CHUNK_ROWS):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # BOM: o Excel só reconhece o CSV como UTF-8 com ele
+    buffer.write("\ufeff")
+    escritor.writerow(EXPORT_COLUNAS)
+    for i, linha in enumerate(linhas, 1):
+        linha[1] = linha[1].strftime("%d/%m/%Y")
+        escritor.writerow(linha)
+        if i % tamanho == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _xlsx_em_blocos(linhas, tamanho=EXPORT_XLSX_CHUNK_BYTES):
+    """
+    Planilha write-only: cada linha vai direto para o arquivo temporário do
+    openpyxl. O .xlsx é um zip que só fica completo no save(), então os bytes
+    saem depois dele, em blocos, de outro arquivo temporário.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Escala")
+    for coluna, largura in zip("ABCDEFG", (20, 12, 10, 8, 12, 30, 15)):
+        sheet.column_dimensions[coluna].width = largura
+    sheet.append(EXPORT_COLUNAS)
+    for linha in linhas:
+        data = WriteOnlyCell(sheet, value=linha[1])
+        data.number_format = "DD/MM/YYYY"
+        linha[1] = data
+        sheet.append(linha)
+    with tempfile.TemporaryFile() as arquivo:
+        workbook.save(arquivo)
+        arquivo.seek(0)
+        while True:
+            bloco = arquivo.read(tamanho)
+            if not bloco:
+                break
+            yield bloco
+
+
+@app.route("/admin/export/escala", methods=["GET"])
+def admin_export_escala():
+    """
+    Escala do período em CSV ou XLSX (?formato=), de uma área (?area_id=) ou
+    de todas. month_year=AAAA-MM exporta o mês; AAAA, o ano inteiro.
+    """
+    if not check_auth():
+        return redirect(url_for("admin_login"))
+
+    formato = request.args.get("formato", "xlsx")
+    if formato not in ("csv", "xlsx"):
+        return "Formato inválido: use csv ou xlsx.", 400
+    hoje = datetime.now()
+    try:
+        inicio, fim, periodo = _periodo_export(request.args.get("month_year") or f"{hoje.year}-{hoje.month:02d}")
+        area_id = int(request.args["area_id"]) if request.args.get("area_id") else None
+    except ValueError:
+        return "Período ou área inválidos: use month_year=AAAA-MM ou AAAA.", 400
+
+    nome = f"escala_{periodo}"
+    try:
+        if area_id is not None:
+            area = get_area_by_id(area_id)
+            if not area:
+                return "Área não encontrada.", 404
+            nome += "_" + (secure_filename(area["nome"]) or str(area_id))
+        escalas = iter_escalas_export(inicio, fim, area_id)
+        # Roda a consulta antes dos cabeçalhos: erro de banco ainda vira 500
+        primeira = next(escalas, None)
+    except RepositoryError:
+        return "Erro ao exportar escalas.", 500
+
+    linhas = _linhas_export(itertools.chain([primeira] if primeira else [], escalas))
+    if formato == "csv":
+        response = app.response_class(_csv_em_blocos(linhas), mimetype="text/csv")
+    else:
+        response = app.response_class(
+            _xlsx_em_blocos(linhas),
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+    response.headers.set("Content-Disposition", "attachment", filename=f"{nome}.{formato}")
+    response.headers["X-Accel-Buffering"] = "no"
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+
 if __name__ == "__main__":
     host = os.environ.get("FLASK_RUN_HOST", "0.0.0.0")
     port = int(os.environ.get("PORT", 5001))
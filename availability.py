@@ -0,0 +1,73 @@
+"""
+Disponibilidade das áreas (coluna areas.dias_disponiveis) já interpretada.
+
+O texto "0_Manhã,0_Noite,3_Noite" (dia da semana da interface, 0 = domingo,
+e turno) vira um AreaAvailability imutável uma única vez por configuração
+distinta: um bitmask dia × turno. As datas de cada mês ficam memorizadas por
+(bitmask, ano, mês), já com ISO, BR e o nome do dia da semana, e são
+compartilhadas entre requisições (por isso são somente leitura).
+
+Partes malformadas ou com turno desconhecido são ignoradas.
+"""
+import calendar
+from functools import lru_cache
+from types import MappingProxyType
+from typing import NamedTuple
+
+TURNOS = ("Manhã", "Noite")
+# Indexado por date.weekday() (0 = segunda)
+DIAS_SEMANA = ("segunda", "terça", "quarta", "quinta", "sexta", "sábado", "domingo")
+DEFAULT_AVAILABILITY = "0_Manhã,0_Noite"
+
+
+def _bit(dia_ui, turno):
+    return 1 << (dia_ui * len(TURNOS) + TURNOS.index(turno))
+
+
+class AreaAvailability(NamedTuple):
+    config: str
+    mask: int
+
+    def allows(self, dia_ui, turno):
+        """dia_ui: 0 = domingo ... 6 = sábado."""
+        return turno in TURNOS and 0 <= dia_ui <= 6 and bool(self.mask & _bit(dia_ui, turno))
+
+    def turnos(self, dia_ui):
+        return tuple(turno for turno in TURNOS if self.allows(dia_ui, turno))
+
+    def dates(self, ano, mes):
+        """Tupla de {"iso", "br", "dia_semana", "turnos"} (somente leitura), em ordem de data."""
+        return _month_dates(self.mask, ano, mes)
+
+
+@lru_cache(maxsize=256)
+def compile_availability(config):
+    mask = 0
+    for parte in (config or "").split(","):
+        dia, sep, turno = parte.strip().partition("_")
+        if sep and dia.isdigit() and int(dia) <= 6 and turno in TURNOS:
+            mask |= _bit(int(dia), turno)
+    return AreaAvailability(config or "", mask)
+
+
+def availability_for(area):
+    return compile_availability(area.get("dias_disponiveis", DEFAULT_AVAILABILITY))
+
+
+@lru_cache(maxsize=512)
+def _month_dates(mask, ano, mes):
+    primeiro_weekday, total = calendar.monthrange(ano, mes)
+    datas = []
+    for dia in range(1, total + 1):
+        weekday = (primeiro_weekday + dia - 1) % 7
+        # weekday() começa na segunda; a interface começa no domingo
+        dia_ui = (weekday + 1) % 7
+        turnos = tuple(turno for turno in TURNOS if mask & _bit(dia_ui, turno))
+        if turnos:
+            datas.append(MappingProxyType({
+                "iso": f"{ano}-{mes:02d}-{dia:02d}",
+                "br": f"{dia:02d}/{mes:02d}/{ano}",
+                "dia_semana": DIAS_SEMANA[weekday],
+                "turnos": turnos,
+            }))
+    return tuple(datas)
@@ -0,0 +1,147 @@
+"""
+Workers do modo de agendamento em fila (AGENDAR_MODE=fila).
+
+No pico de abertura da escala, /agendar só grava o pedido em
+fila_agendamentos e devolve um ticket. Um pequeno pool de threads por
+processo (BOOKING_QUEUE_WORKERS) drena a fila por ordem de chegada, em lotes
+de até BOOKING_QUEUE_BATCH pedidos por transação, o que limita quantas
+conexões de escrita disputam as mesmas linhas de slot_ocupacao.
+
+Para drenar a fila num processo separado: `python manage.py booking-worker`.
+"""
+import json
+import logging
+import os
+import threading
+
+from flask import g
+
+from repositories.errors import RepositoryError
+from repositories.fila_repository import claim_bookings, complete_bookings, requeue_stale_bookings
+from repositories.unit_of_work import UnitOfWork
+
+logger = logging.getLogger(__name__)
+
+BOOKING_MODE = os.environ.get("AGENDAR_MODE", "direto")
+BOOKING_QUEUE_WORKERS = int(os.environ.get("BOOKING_QUEUE_WORKERS", 1))
+BOOKING_QUEUE_BATCH = int(os.environ.get("BOOKING_QUEUE_BATCH", 25))
+BOOKING_QUEUE_POLL_SECONDS = float(os.environ.get("BOOKING_QUEUE_POLL_SECONDS", 1.0))
+# Pedidos reservados há mais tempo que isso voltam para a fila (worker morreu no meio do lote)
+BOOKING_QUEUE_STALE_SECONDS = int(os.environ.get("BOOKING_QUEUE_STALE_SECONDS", 300))
+
+ERRO_INTERNO = {"status": "error", "message": "Erro interno ao processar agendamento."}
+
+_state = {"pid": None, "threads": [], "wake": threading.Event(), "stop": threading.Event()}
+_state_lock = threading.Lock()
+
+
+def enabled():
+    return BOOKING_MODE == "fila"
+
+
+def _run_in_unit_of_work(app, processor, pedidos):
+    """
+    Processa os pedidos numa única transação. Retorna False (com tudo
+    desfeito) se algum repositório pediu rollback no meio do lote.
+    """
+    with app.app_context():
+        uow = UnitOfWork()
+        g.db_uow = uow
+        try:
+            resultados = []
+            for pedido in pedidos:
+                try:
+                    payload, status_code = processor(pedido["telefone"], pedido["area_id"], pedido["slots"])
+                except RepositoryError:
+                    payload, status_code = ERRO_INTERNO, 500
+                if status_code >= 500 or uow.rollback_only:
+                    uow.rollback()
+                    return False
+                resultados.append((pedido["id"], status_code, json.dumps(payload, ensure_ascii=False)))
+            complete_bookings(resultados)
+            uow.commit()
+            return not uow.rollback_only
+        except Exception:
+            uow.rollback()
+            raise
+        finally:
+            g.pop("db_uow", None)
+            uow.close()
+
+
+def process_batch(app, processor, limit=None):
+    """
+    Reserva e processa um lote. `processor(telefone, area_id, slots)` devolve
+    (payload, status_code), o mesmo par que /agendar responde no modo direto.
+    Se o lote falhar como um todo, cada pedido é refeito na própria transação
+    para que um pedido com erro não derrube os outros. Retorna o número de
+    pedidos processados.
+    """
+    with app.app_context():
+        pedidos = claim_bookings(limit or BOOKING_QUEUE_BATCH)
+    if not pedidos:
+        return 0
+
+    if len(pedidos) > 1:
+        try:
+            if _run_in_unit_of_work(app, processor, pedidos):
+                return len(pedidos)
+        except Exception as err:
+            logger.exception("Erro no lote de %d pedidos da fila, refazendo um a um: %s", len(pedidos), err)
+
+    for pedido in pedidos:
+        try:
+            ok = _run_in_unit_of_work(app, processor, [pedido])
+        except Exception as err:
+            logger.exception("Erro ao processar pedido %s da fila: %s", pedido["ticket"], err)
+            ok = False
+        if not ok:
+            with app.app_context():
+                complete_bookings([(pedido["id"], 500, json.dumps(ERRO_INTERNO, ensure_ascii=False))])
+    return len(pedidos)
+
+
+def drain(app, processor, stop=None):
+    """Laço de um worker: processa lotes enquanto houver pedidos, senão espera um aviso ou o poll."""
+    stop = stop or _state["stop"]
+    wake = _state["wake"]
+    while not stop.is_set():
+        try:
+            with app.app_context():
+                requeue_stale_bookings(BOOKING_QUEUE_STALE_SECONDS)
+            while not stop.is_set() and process_batch(app, processor):
+                pass
+        except Exception as err:
+            logger.exception("Erro no worker da fila de agendamentos: %s", err)
+        wake.wait(BOOKING_QUEUE_POLL_SECONDS)
+        wake.clear()
+
+
+def start_workers(app, processor):
+    """Inicia os workers deste processo, uma vez por pid (os forks do gunicorn começam sem threads)."""
+    with _state_lock:
+        if _state["pid"] == os.getpid() and all(t.is_alive() for t in _state["threads"]):
+            return
+        _state["pid"] = os.getpid()
+        _state["stop"].clear()
+        _state["threads"] = []
+        for i in range(BOOKING_QUEUE_WORKERS):
+            thread = threading.Thread(
+                target=drain, args=(app, processor), name=f"booking-queue-{i}", daemon=True
+            )
+            thread.start()
+            _state["threads"].append(thread)
+        logger.info("%d worker(s) da fila de agendamentos iniciados no pid %s.", BOOKING_QUEUE_WORKERS, os.getpid())
+
+
+def notify():
+    """Acorda os workers deste processo logo após um novo pedido."""
+    _state["wake"].set()
+
+
+def stop_workers(timeout=5):
+    _state["stop"].set()
+    _state["wake"].set()
+    for thread in _state["threads"]:
+        thread.join(timeout)
+    _state["threads"] = []
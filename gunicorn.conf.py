@@ -0,0 +1,30 @@
+import os
+
+bind = "0.0.0.0:5001"
+# Threads por worker: as conexões de vagas ao vivo (SSE) ficam abertas, cada uma
+# numa thread; live_slots.LIVE_MAX_CONNECTIONS deve ficar bem abaixo disso
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+
+
+def on_starting(server):
+    """
+    Aplica as migrações uma vez, no processo master, antes de criar os workers.
+    No Fly o release_command já faz isso; lá MIGRATE_ON_START=0.
+    """
+    if os.environ.get("MIGRATE_ON_START", "1") != "1":
+        return
+    from database import init_db
+
+    init_db()
+
+
+def post_worker_init(worker):
+    """Carrega o diretório de voluntários antes do primeiro pedido do worker."""
+    from repositories.voluntarios_directory import directory
+
+    try:
+        directory.refresh()
+    except Exception as err:
+        # Sem banco agora, a primeira requisição tenta de novo
+        worker.log.warning("Diretório de voluntários não carregado: %s", err)
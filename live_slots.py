@@ -0,0 +1,334 @@
+"""
+Vagas ao vivo (Server-Sent Events) por área e mês.
+
+As conexões de /api/resumo_vagas/stream assinam canais (area_id, ano, mes)
+no LiveSlots do processo, um por mês exibido. Recebem o resumo completo de
+cada mês ao conectar e, a cada mudança, só os turnos cuja ocupação mudou.
+Quem lê o banco é uma thread por processo (pump), nunca as conexões: ela recalcula os canais sujos de uma vez
+(uma consulta por mês) e compara com o último resumo enviado.
+
+Um canal fica sujo:
+- no próprio processo, com "escalas_changed"/"areas_changed" depois do
+  commit (criar/excluir escala, agendar, alterar área): aviso imediato;
+- em qualquer processo, quando mudam os carimbos do resumo_cache no backend
+  de cache, conferidos a cada LIVE_POLL_SECONDS numa leitura só para todos
+  os canais assinados. Com backend compartilhado (CACHE_BACKEND sqlite ou
+  redis) é isso que leva a mudança de um worker aos outros;
+- a cada LIVE_RESYNC_SECONDS, como rede de segurança (backend local,
+  escritas fora do app).
+
+Memória por conexão ociosa: uma thread do gthread e uma fila de no máximo
+LIVE_QUEUE_SIZE eventos; cliente que não acompanha tem a fila descartada e
+recebe o resumo completo de novo. Cada processo aceita até
+LIVE_MAX_CONNECTIONS conexões (as demais recebem 503) e cada conexão dura no
+máximo LIVE_MAX_SECONDS; o EventSource reconecta sozinho.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+LIVE_MAX_CONNECTIONS = int(os.environ.get("LIVE_MAX_CONNECTIONS", 8))
+LIVE_MAX_SECONDS = float(os.environ.get("LIVE_MAX_SECONDS", 300))
+LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", 16))
+LIVE_POLL_SECONDS = float(os.environ.get("LIVE_POLL_SECONDS", 1))
+LIVE_RESYNC_SECONDS = float(os.environ.get("LIVE_RESYNC_SECONDS", 15))
+LIVE_HEARTBEAT_SECONDS = float(os.environ.get("LIVE_HEARTBEAT_SECONDS", 15))
+LIVE_RETRY_MS = int(os.environ.get("LIVE_RETRY_MS", 3000))
+
+# Marcadores na fila de uma assinatura
+RESYNC = "resync"
+CLOSED = "closed"
+
+
+def _ano_mes(data):
+    if hasattr(data, "year"):
+        return data.year, data.month
+    return int(str(data)[:4]), int(str(data)[5:7])
+
+
+def _turnos(payload):
+    """{(iso, turno): turno} de um resumo {"max_pessoas", "datas"}."""
+    return {(item["iso"], turno["nome"]): turno for item in payload["datas"] for turno in item["turnos"]}
+
+
+def diff(anterior, atual):
+    """
+    Turnos que mudaram de `anterior` para `atual`, como
+    [{"iso", "nome", "escalados", "responsavel", "vagas_livres"}], ou None se
+    mudaram as datas/turnos oferecidos (aí vale mandar o resumo inteiro).
+    """
+    antes, depois = _turnos(anterior), _turnos(atual)
+    if antes.keys() != depois.keys():
+        return None
+    return [{"iso": iso, **turno} for (iso, _), turno in depois.items() if antes[(iso, turno["nome"])] != turno]
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """Fila limitada de eventos de uma conexão, que assina um ou mais canais."""
+
+    def __init__(self, channels, limit=LIVE_QUEUE_SIZE):
+        self.channels = tuple(channels)
+        self._limit = limit
+        self._events = deque()
+        self._resync = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def push(self, event):
+        with self._cond:
+            if len(self._events) >= self._limit:
+                # Cliente lento: em vez de acumular deltas, manda o resumo de novo
+                self._events.clear()
+                self._resync = True
+            else:
+                self._events.append(event)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def next(self, timeout):
+        """Próximo evento, RESYNC, CLOSED, ou None depois de `timeout` segundos sem nada."""
+        with self._cond:
+            if not (self._events or self._resync or self._closed):
+                self._cond.wait(timeout)
+            if self._closed:
+                return CLOSED
+            if self._resync:
+                self._resync = False
+                return RESYNC
+            return self._events.popleft() if self._events else None
+
+
+def _mes(channel):
+    return f"{channel[1]}-{channel[2]:02d}"
+
+
+class LiveSlots:
+    """
+    load(area_ids, meses) -> {area_id: {"max_pessoas", "datas"}} (montar_resumos_vagas);
+    stamps(area_id, ano, mes) -> nomes dos carimbos do resumo do canal;
+    counters(nomes) -> valores atuais desses carimbos no backend de cache.
+    Um canal é (area_id, ano, mes).
+    """
+
+    def __init__(self, load, stamps=None, counters=None, max_connections=LIVE_MAX_CONNECTIONS,
+                 queue_size=LIVE_QUEUE_SIZE, poll_interval=LIVE_POLL_SECONDS,
+                 resync_interval=LIVE_RESYNC_SECONDS, clock=time.monotonic):
+        self._load = load
+        self._stamps = stamps
+        self._counters = counters
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.resync_interval = resync_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._subs = defaultdict(set)
+        self._connections = 0
+        self._payloads = {}
+        self._versions = {}
+        self._dirty = set()
+        self._resynced_at = clock()
+        self._wake = threading.Event()
+        self._pump_pid = None
+
+    @property
+    def connections(self):
+        return self._connections
+
+    def subscribe(self, area_id, meses):
+        """
+        Assina a área nos meses [(ano, mes), ...]. Retorna a Subscription, None
+        se o processo já está no limite de conexões, ou False se a área não existe.
+        """
+        channels = [(int(area_id), int(ano), int(mes)) for ano, mes in meses]
+        with self._lock:
+            if self._connections >= self.max_connections:
+                return None
+            faltando = [channel for channel in channels if channel not in self._payloads]
+        carregados = {}
+        if faltando:
+            # Carimbos lidos antes da carga: uma mudança no meio do caminho ainda suja o canal
+            versions = self._read_versions(faltando)
+            for channel in faltando:
+                payload = self._load([channel[0]], [channel[1:]]).get(channel[0])
+                if payload is None:
+                    return False
+                carregados[channel] = payload
+        sub = Subscription(channels, self.queue_size)
+        with self._lock:
+            if self._connections >= self.max_connections:
+                return None
+            for channel, payload in carregados.items():
+                if channel not in self._payloads:
+                    self._payloads[channel] = payload
+                    if channel in versions:
+                        self._versions[channel] = versions[channel]
+            for channel in channels:
+                self._subs[channel].add(sub)
+            self._connections += 1
+        self._ensure_pump()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if not any(sub in self._subs.get(channel, ()) for channel in sub.channels):
+                return
+            self._connections -= 1
+            for channel in sub.channels:
+                subs = self._subs.get(channel)
+                if subs is None:
+                    continue
+                subs.discard(sub)
+                if not subs:
+                    # Sem assinantes, o canal não custa nada: nem memória nem consulta
+                    del self._subs[channel]
+                    self._payloads.pop(channel, None)
+                    self._versions.pop(channel, None)
+                    self._dirty.discard(channel)
+
+    def snapshot(self, sub):
+        """Eventos "resumo" de todos os canais da assinatura."""
+        with self._lock:
+            payloads = [(channel, self._payloads.get(channel)) for channel in sub.channels]
+        return [("resumo", {"mes": _mes(channel), **payload}) for channel, payload in payloads if payload]
+
+    def escalas_changed(self, slots=None, **_):
+        with self._lock:
+            if slots is None:
+                self._dirty.update(self._subs)
+            else:
+                afetados = {(int(area_id), *_ano_mes(data)) for area_id, data in slots}
+                self._dirty.update(afetados & self._subs.keys())
+        self._wake.set()
+
+    def areas_changed(self, area_id=None, **_):
+        with self._lock:
+            self._dirty.update(
+                channel for channel in self._subs if area_id is None or channel[0] == int(area_id)
+            )
+        self._wake.set()
+
+    def _ensure_pump(self):
+        # Um pump por processo; os forks do gunicorn começam sem threads
+        with self._lock:
+            if self._pump_pid == os.getpid():
+                return
+            self._pump_pid = os.getpid()
+        threading.Thread(target=self._run, name="live-slots", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.pump()
+            except Exception as err:
+                logger.exception("Erro ao atualizar vagas ao vivo: %s", err)
+
+    def pump(self):
+        """Uma rodada: descobre os canais sujos e envia o que mudou. Chamado pela thread do pump."""
+        with self._lock:
+            channels = list(self._subs)
+            dirty, self._dirty = self._dirty & set(channels), set()
+        if not channels:
+            return
+
+        versions = self._read_versions(channels)
+        with self._lock:
+            for channel, version in versions.items():
+                if channel not in self._subs:
+                    continue
+                if self._versions.get(channel) not in (None, version):
+                    dirty.add(channel)
+                self._versions[channel] = version
+        now = self._clock()
+        if now - self._resynced_at >= self.resync_interval:
+            dirty.update(channels)
+            self._resynced_at = now
+        if dirty:
+            self._refresh(dirty)
+
+    def _read_versions(self, channels):
+        if self._stamps is None or self._counters is None:
+            return {}
+        nomes = {channel: self._stamps(*channel) for channel in channels}
+        try:
+            valores = self._counters([nome for lista in nomes.values() for nome in lista])
+        except Exception as err:
+            logger.warning("Carimbos das vagas ao vivo indisponíveis: %s", err)
+            return {}
+        versions, inicio = {}, 0
+        for channel, lista in nomes.items():
+            versions[channel] = tuple(valores[inicio:inicio + len(lista)])
+            inicio += len(lista)
+        return versions
+
+    def _refresh(self, channels):
+        por_mes = defaultdict(list)
+        for area_id, ano, mes in channels:
+            por_mes[(ano, mes)].append(area_id)
+        for (ano, mes), area_ids in sorted(por_mes.items()):
+            resumos = self._load(sorted(area_ids), [(ano, mes)])
+            for area_id in area_ids:
+                self._publish((area_id, ano, mes), resumos.get(area_id))
+
+    def _publish(self, channel, atual):
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+            anterior = self._payloads.get(channel)
+            if not subs:
+                return
+            if atual is None:
+                # Área excluída: encerra as conexões do canal
+                for sub in subs:
+                    sub.close()
+                return
+            self._payloads[channel] = atual
+        turnos = diff(anterior, atual) if anterior is not None else None
+        if turnos is None:
+            evento = ("resumo", {"mes": _mes(channel), **atual})
+        elif turnos:
+            evento = ("vagas", {"mes": _mes(channel), "max_pessoas": atual["max_pessoas"], "turnos": turnos})
+        else:
+            return
+        for sub in subs:
+            sub.push(evento)
+
+    def stream(self, sub, heartbeat=LIVE_HEARTBEAT_SECONDS, max_seconds=LIVE_MAX_SECONDS):
+        """Corpo text/event-stream de uma conexão; remove a assinatura ao terminar."""
+        fim = self._clock() + max_seconds
+        try:
+            yield f"retry: {LIVE_RETRY_MS}\n\n"
+            for evento in self.snapshot(sub):
+                yield sse(*evento)
+            while True:
+                restante = fim - self._clock()
+                if restante <= 0:
+                    return
+                evento = sub.next(min(heartbeat, restante))
+                if evento is CLOSED:
+                    yield sse("fim", {})
+                    return
+                if evento is None:
+                    # Comentário: mantém proxies abertos e revela conexões mortas
+                    yield ": ping\n\n"
+                elif evento is RESYNC:
+                    for resumo in self.snapshot(sub):
+                        yield sse(*resumo)
+                else:
+                    yield sse(*evento)
+        finally:
+            self.unsubscribe(sub)
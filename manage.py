@@ -0,0 +1,98 @@
+"""
+Comandos de manutenção do Pronto.
+
+    python manage.py migrate [--to VERSAO]
+    python manage.py schema-status
+    python manage.py slots rebuild|verify
+    python manage.py booking-worker [--once]
+"""
+import argparse
+import sys
+
+import migrations
+from repositories.errors import RepositoryError
+
+
+def cmd_migrate(args):
+    aplicadas = migrations.upgrade(target=args.to)
+    print(f"Migrações aplicadas: {aplicadas}" if aplicadas else "Esquema já está atualizado.")
+    return 0
+
+
+def cmd_schema_status(args):
+    atual, pendentes = migrations.status()
+    print(f"Versão atual: {atual}")
+    print(f"Pendentes: {pendentes}" if pendentes else "Nenhuma migração pendente.")
+    return 1 if pendentes else 0
+
+
+def cmd_slots(args):
+    from repositories.ocupacao_repository import rebuild_ocupacao, verify_ocupacao
+
+    if args.action == "rebuild":
+        total = rebuild_ocupacao()
+        print(f"Ocupação recalculada: {total} horário(s).")
+        return 0
+
+    divergencias = verify_ocupacao()
+    for d in divergencias:
+        print(
+            f"area={d['area_id']} {d['data']} {d['turno']}: "
+            f"equipe esperado/gravado={d['equipe'][0]}/{d['equipe'][1]}, "
+            f"responsáveis esperado/gravado={d['responsaveis'][0]}/{d['responsaveis'][1]}"
+        )
+    print(f"{len(divergencias)} divergência(s)." if divergencias else "Contadores de ocupação conferem.")
+    return 1 if divergencias else 0
+
+
+def cmd_booking_worker(args):
+    import booking_queue
+    from app import app, processar_agendamento
+
+    if args.once:
+        total = 0
+        while True:
+            processados = booking_queue.process_batch(app, processar_agendamento)
+            if not processados:
+                break
+            total += processados
+        print(f"{total} pedido(s) processado(s).")
+        return 0
+
+    print("Processando a fila de agendamentos (Ctrl+C para sair)...")
+    try:
+        booking_queue.drain(app, processar_agendamento)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="manage.py", description="Comandos de manutenção do Pronto.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    migrate = sub.add_parser("migrate", help="Aplica as migrações pendentes do esquema.")
+    migrate.add_argument("--to", type=int, default=None, help="Versão máxima a aplicar.")
+    migrate.set_defaults(func=cmd_migrate)
+
+    schema_status = sub.add_parser("schema-status", help="Mostra a versão do esquema e as migrações pendentes.")
+    schema_status.set_defaults(func=cmd_schema_status)
+
+    slots = sub.add_parser("slots", help="Recalcula ou confere os contadores de slot_ocupacao.")
+    slots.add_argument("action", choices=["rebuild", "verify"])
+    slots.set_defaults(func=cmd_slots)
+
+    worker = sub.add_parser("booking-worker", help="Processa a fila de agendamentos (AGENDAR_MODE=fila).")
+    worker.add_argument("--once", action="store_true", help="Esvazia a fila e sai.")
+    worker.set_defaults(func=cmd_booking_worker)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except (migrations.MigrationError, RepositoryError) as err:
+        print(f"Erro: {err}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
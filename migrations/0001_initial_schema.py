@@ -0,0 +1,47 @@
+DESCRIPTION = "Tabelas iniciais (areas, voluntarios, escalas, voluntario_areas)"
+
+
+def upgrade(cursor):
+    # Tabela de Áreas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS areas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(100) NOT NULL,
+            max_pessoas INT DEFAULT 2,
+            dias_disponiveis TEXT
+        ) ENGINE=InnoDB;
+    ''')
+
+    # Tabela de Voluntários
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS voluntarios (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            nome VARCHAR(100) NOT NULL,
+            telefone VARCHAR(20) UNIQUE NOT NULL,
+            responsavel TINYINT(1) DEFAULT 0
+        ) ENGINE=InnoDB;
+    ''')
+
+    # Tabela de Escalas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS escalas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            voluntario_id INT,
+            area_id INT,
+            data DATE,
+            turno VARCHAR(20),
+            FOREIGN KEY (voluntario_id) REFERENCES voluntarios(id) ON DELETE CASCADE,
+            FOREIGN KEY (area_id) REFERENCES areas(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB;
+    ''')
+
+    # Tabela de Relacionamento Voluntário x Áreas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS voluntario_areas (
+            voluntario_id INT,
+            area_id INT,
+            PRIMARY KEY (voluntario_id, area_id),
+            FOREIGN KEY (voluntario_id) REFERENCES voluntarios(id) ON DELETE CASCADE,
+            FOREIGN KEY (area_id) REFERENCES areas(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB;
+    ''')
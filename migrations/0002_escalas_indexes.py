@@ -0,0 +1,10 @@
+from migrations import create_index
+
+DESCRIPTION = "Índices compostos das consultas de vagas e dashboard em escalas"
+
+
+def upgrade(cursor):
+    # count_agendados_non_responsavel / get_resumo_vagas: area + dia + turno
+    create_index(cursor, "escalas", "idx_escalas_area_data_turno", ["area_id", "data", "turno"])
+    # get_dashboard_data / list_inativos / não escalados: faixa de datas -> voluntário
+    create_index(cursor, "escalas", "idx_escalas_data_voluntario", ["data", "voluntario_id"])
@@ -0,0 +1,46 @@
+import logging
+
+from migrations import create_index
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTION = "Impede o mesmo voluntário duas vezes no mesmo dia e turno"
+
+BACKUP_TABLE = "escalas_duplicadas"
+
+
+def upgrade(cursor):
+    # Mantém o agendamento mais antigo de cada duplicata antes de criar o índice único
+    cursor.execute('''
+        SELECT e1.id, e1.voluntario_id, e1.data, e1.turno, MIN(e2.id) AS mantida
+        FROM escalas e1
+        JOIN escalas e2
+          ON e1.voluntario_id = e2.voluntario_id
+         AND e1.data = e2.data
+         AND e1.turno = e2.turno
+         AND e1.id > e2.id
+        GROUP BY e1.id, e1.voluntario_id, e1.data, e1.turno
+        ORDER BY e1.id
+    ''')
+    duplicadas = cursor.fetchall()
+    if duplicadas:
+        # Roda sozinha no release: as linhas removidas ficam copiadas em BACKUP_TABLE
+        ids = [row["id"] for row in duplicadas]
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {BACKUP_TABLE} LIKE escalas")
+        cursor.execute(f"INSERT IGNORE INTO {BACKUP_TABLE} SELECT * FROM escalas WHERE id IN ({placeholders})", ids)
+        cursor.execute(f"DELETE FROM escalas WHERE id IN ({placeholders})", ids)
+        logger.warning(
+            "%d escala(s) duplicada(s) removida(s) antes do índice único e copiada(s) para %s: %s",
+            len(duplicadas),
+            BACKUP_TABLE,
+            "; ".join(
+                f"id {row['id']} (voluntário {row['voluntario_id']}, {row['data']} {row['turno']}, mantida {row['mantida']})"
+                for row in duplicadas
+            ),
+        )
+
+    # Também atende escala_exists: voluntário + dia + turno
+    create_index(
+        cursor, "escalas", "uq_escalas_voluntario_data_turno", ["voluntario_id", "data", "turno"], unique=True
+    )
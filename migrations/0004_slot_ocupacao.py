@@ -0,0 +1,29 @@
+DESCRIPTION = "Tabela slot_ocupacao com a ocupação de cada área/dia/turno"
+
+
+def upgrade(cursor):
+    # Contadores mantidos pelos repositórios; substituem o COUNT em escalas nas checagens de vaga
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS slot_ocupacao (
+            area_id INT NOT NULL,
+            data DATE NOT NULL,
+            turno VARCHAR(20) NOT NULL,
+            equipe INT NOT NULL DEFAULT 0,
+            responsaveis INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (area_id, data, turno),
+            FOREIGN KEY (area_id) REFERENCES areas(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB;
+    ''')
+
+    # Carga inicial a partir das escalas existentes (mesma regra de ocupacao_repository.rebuild_ocupacao)
+    cursor.execute("DELETE FROM slot_ocupacao")
+    cursor.execute('''
+        INSERT INTO slot_ocupacao (area_id, data, turno, equipe, responsaveis)
+        SELECT e.area_id, e.data, e.turno,
+               SUM(v.responsavel = 0 OR v.responsavel IS NULL),
+               SUM(v.responsavel = 1)
+        FROM escalas e
+        JOIN voluntarios v ON e.voluntario_id = v.id
+        WHERE e.area_id IS NOT NULL AND e.data IS NOT NULL AND e.turno IS NOT NULL
+        GROUP BY e.area_id, e.data, e.turno
+    ''')
@@ -0,0 +1,19 @@
+from migrations import create_index
+
+DESCRIPTION = "Tabela idempotencia com as respostas de /agendar por chave"
+
+
+def upgrade(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS idempotencia (
+            chave VARCHAR(100) NOT NULL,
+            rota VARCHAR(50) NOT NULL,
+            fingerprint CHAR(64) NOT NULL,
+            status_code INT NOT NULL,
+            resposta TEXT NOT NULL,
+            expira_em DATETIME NOT NULL,
+            PRIMARY KEY (rota, chave)
+        ) ENGINE=InnoDB;
+    ''')
+    # Limpeza das chaves vencidas
+    create_index(cursor, "idempotencia", "idx_idempotencia_expira_em", ["expira_em"])
@@ -0,0 +1,23 @@
+from migrations import create_index
+
+DESCRIPTION = "Fila de agendamentos para o modo AGENDAR_MODE=fila"
+
+
+def upgrade(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fila_agendamentos (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            ticket CHAR(32) NOT NULL UNIQUE,
+            telefone VARCHAR(20) NOT NULL,
+            area_id INT NOT NULL,
+            slots TEXT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pendente',
+            status_code INT NULL,
+            resposta TEXT NULL,
+            criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            reservado_em DATETIME NULL,
+            processado_em DATETIME NULL
+        ) ENGINE=InnoDB;
+    ''')
+    # Workers pegam os pendentes por ordem de chegada; a posição na fila usa o mesmo índice
+    create_index(cursor, "fila_agendamentos", "idx_fila_status_id", ["status", "id"])
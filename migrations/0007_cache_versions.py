@@ -0,0 +1,13 @@
+DESCRIPTION = "Tabela cache_versions com a versão de cada cache entre workers"
+
+
+def upgrade(cursor):
+    # Cada escrita que invalida um cache incrementa a versão na mesma transação;
+    # os outros workers comparam a versão antes de servir o cache local
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            nome VARCHAR(50) PRIMARY KEY,
+            versao BIGINT NOT NULL DEFAULT 0
+        ) ENGINE=InnoDB;
+    ''')
+    cursor.execute("INSERT IGNORE INTO cache_versions (nome, versao) VALUES ('areas', 0)")
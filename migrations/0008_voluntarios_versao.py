@@ -0,0 +1,21 @@
+from migrations import add_column, create_index
+
+DESCRIPTION = "Versão de alteração dos voluntários para o diretório em memória"
+
+
+def upgrade(cursor):
+    # Cada escrita em um voluntário (ou nas áreas dele) grava a próxima versão de
+    # cache_versions 'voluntarios'; os workers buscam só o que passou da versão que têm
+    add_column(cursor, "voluntarios", "versao", "BIGINT NOT NULL DEFAULT 0")
+    create_index(cursor, "voluntarios", "idx_voluntarios_versao", ["versao"])
+
+    # Exclusões não deixam linha em voluntarios; ficam registradas aqui
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS voluntarios_removidos (
+            voluntario_id INT NOT NULL PRIMARY KEY,
+            versao BIGINT NOT NULL,
+            removido_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_voluntarios_removidos_versao (versao)
+        ) ENGINE=InnoDB;
+    ''')
+    cursor.execute("INSERT IGNORE INTO cache_versions (nome, versao) VALUES ('voluntarios', 0)")
@@ -0,0 +1,17 @@
+DESCRIPTION = "Tabela dashboard_snapshots com a grade do dashboard por área e mês"
+
+
+def upgrade(cursor):
+    # Mantida pelos repositórios (ver dashboard_repository); começa vazia e é montada na primeira leitura
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+            area_id INT NOT NULL,
+            ano SMALLINT NOT NULL,
+            mes TINYINT NOT NULL,
+            versao BIGINT NOT NULL DEFAULT 0,
+            grade MEDIUMTEXT NULL,
+            atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (area_id, ano, mes),
+            FOREIGN KEY (area_id) REFERENCES areas(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB;
+    ''')
@@ -0,0 +1,209 @@
+"""
+Migrações versionadas do esquema.
+
+Cada migração é um módulo `NNNN_descricao.py` neste pacote com DESCRIPTION e
+upgrade(cursor). As versões aplicadas ficam na tabela schema_version; rodar
+upgrade() de novo só aplica as que faltam.
+"""
+import importlib
+import logging
+import pkgutil
+import re
+
+from database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = "pronto_schema_migrations"
+LOCK_TIMEOUT = 60
+
+_MODULE_RE = re.compile(r"^(\d{4})_\w+$")
+
+
+class MigrationError(Exception):
+    pass
+
+
+def discover():
+    """Lista (versão, nome do módulo) das migrações do pacote, em ordem."""
+    found = []
+    for module in pkgutil.iter_modules(__path__):
+        match = _MODULE_RE.match(module.name)
+        if match:
+            found.append((int(match.group(1)), module.name))
+    found.sort()
+    versions = [version for version, _ in found]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"Versões de migração duplicadas: {versions}")
+    return found
+
+
+def latest_version():
+    migrations = discover()
+    return migrations[-1][0] if migrations else 0
+
+
+def index_exists(cursor, table, index_name):
+    cursor.execute(
+        """
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+        """,
+        (table, index_name),
+    )
+    return cursor.fetchone() is not None
+
+
+def create_index(cursor, table, index_name, columns, unique=False):
+    """CREATE INDEX idempotente (o MySQL não tem IF NOT EXISTS para índices)."""
+    if index_exists(cursor, table, index_name):
+        logger.info("Índice %s.%s já existe.", table, index_name)
+        return False
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    cursor.execute(f"CREATE {kind} {index_name} ON {table} ({', '.join(columns)})")
+    logger.info("Índice %s.%s criado.", table, index_name)
+    return True
+
+
+def column_exists(cursor, table, column):
+    cursor.execute(
+        """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        LIMIT 1
+        """,
+        (table, column),
+    )
+    return cursor.fetchone() is not None
+
+
+def add_column(cursor, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN idempotente (o MySQL não tem IF NOT EXISTS para colunas)."""
+    if column_exists(cursor, table, column):
+        logger.info("Coluna %s.%s já existe.", table, column)
+        return False
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    logger.info("Coluna %s.%s criada.", table, column)
+    return True
+
+
+def _ensure_version_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB;
+        """
+    )
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_version ORDER BY version")
+    return [row["version"] for row in cursor.fetchall()]
+
+
+def current_version(cursor):
+    cursor.execute("SELECT MAX(version) AS version FROM schema_version")
+    row = cursor.fetchone()
+    return (row or {}).get("version") or 0
+
+
+def upgrade(target=None):
+    """
+    Aplica as migrações pendentes até `target` (ou até a última).
+    Um lock nomeado no MySQL impede que dois processos migrem ao mesmo tempo.
+    Retorna a lista de versões aplicadas.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise MigrationError("Não foi possível conectar ao banco para migrar.")
+
+    aplicadas = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (LOCK_NAME, LOCK_TIMEOUT))
+            if not (cursor.fetchone() or {}).get("locked"):
+                raise MigrationError("Outro processo está aplicando migrações.")
+            try:
+                _ensure_version_table(cursor)
+                conn.commit()
+                ja_aplicadas = set(applied_versions(cursor))
+
+                for version, module_name in discover():
+                    if version in ja_aplicadas or (target is not None and version > target):
+                        continue
+                    module = importlib.import_module(f"{__name__}.{module_name}")
+                    logger.info("Aplicando migração %04d: %s", version, module.DESCRIPTION)
+                    module.upgrade(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                        (version, module.DESCRIPTION[:200]),
+                    )
+                    # DDL no MySQL já faz commit implícito; o commit fecha o registro da versão
+                    conn.commit()
+                    aplicadas.append(version)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+    except MigrationError:
+        raise
+    except Exception as err:
+        conn.rollback()
+        logger.error(f"Erro ao aplicar migrações: {err}")
+        raise MigrationError(str(err)) from err
+    finally:
+        conn.close()
+
+    if aplicadas:
+        logger.info("Migrações aplicadas: %s", aplicadas)
+    else:
+        logger.info("Esquema já está atualizado.")
+    return aplicadas
+
+
+def status():
+    """Retorna (versão atual, versões pendentes)."""
+    conn = get_db_connection()
+    if not conn:
+        raise MigrationError("Não foi possível conectar ao banco.")
+    try:
+        with conn.cursor() as cursor:
+            _ensure_version_table(cursor)
+            ja_aplicadas = set(applied_versions(cursor))
+    finally:
+        conn.close()
+    pendentes = [version for version, _ in discover() if version not in ja_aplicadas]
+    return max(ja_aplicadas, default=0), pendentes
+
+
+_verified = False
+
+
+def verify_once(connect):
+    """
+    Checagem barata feita pelos workers: uma consulta a schema_version na
+    primeira requisição do processo. Não aplica nada, só avisa se o deploy
+    esqueceu de rodar `python manage.py migrate`. Depois de uma checagem bem
+    sucedida o resultado fica em cache até o fim do processo, e `connect`
+    nem é chamado.
+    """
+    global _verified
+    if _verified:
+        return True
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            atual = current_version(cursor)
+    finally:
+        conn.close()
+    esperada = latest_version()
+    if atual < esperada:
+        logger.error(
+            "Esquema do banco na versão %s, código espera %s. Rode `python manage.py migrate`.",
+            atual,
+            esperada,
+        )
+    _verified = True
+    return atual >= esperada
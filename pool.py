@@ -0,0 +1,249 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class PooledConnection:
+    """
+    Proxy de uma conexão emprestada pelo pool.
+    Tudo é delegado à conexão real, exceto close(), que devolve a conexão ao pool.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._raw, self._created_at)
+
+    def invalidate(self):
+        """Descarta a conexão em vez de devolvê-la (ex.: após erro de protocolo)."""
+        if self._released:
+            return
+        self._released = True
+        self._pool._discard(self._raw)
+
+
+class ConnectionPool:
+    """
+    Pool de conexões limitado, por processo.
+
+    - min_size conexões são abertas no primeiro uso;
+    - no máximo max_size conexões ficam abertas ao mesmo tempo;
+    - acquire() espera até `timeout` segundos por uma conexão livre;
+    - conexões ociosas passam por ping antes de serem entregues;
+    - conexões mais velhas que `recycle` segundos são reabertas;
+    - toda conexão devolvida passa por rollback.
+    """
+
+    def __init__(self, factory, min_size=1, max_size=5, timeout=10.0, recycle=1800, ping=True):
+        if max_size < 1:
+            raise ValueError("max_size deve ser >= 1")
+        self._factory = factory
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping = ping
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self._filled = False
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def acquire(self):
+        if not self._filled:
+            self._fill()
+
+        deadline = time.monotonic() + self.timeout
+        entry = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Pool de conexões encerrado.")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"Nenhuma conexão livre após {self.timeout}s (max_size={self.max_size})."
+                    )
+                self._cond.wait(remaining)
+
+        if entry is None:
+            raw, created_at = self._open()
+        else:
+            raw, created_at = self._checkout(entry)
+        return PooledConnection(self, raw, created_at)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for raw, _ in idle:
+            self._close_raw(raw)
+
+    def _fill(self):
+        with self._cond:
+            if self._filled:
+                return
+            self._filled = True
+            missing = max(0, self.min_size - self._size)
+            self._size += missing
+
+        for _ in range(missing):
+            try:
+                entry = self._open()
+            except Exception:
+                # _open já liberou a vaga; o primeiro acquire tentará de novo
+                continue
+            with self._cond:
+                self._idle.append(entry)
+                self._cond.notify()
+
+    def _open(self):
+        """Abre uma conexão nova para uma vaga já reservada em _size."""
+        try:
+            return self._factory(), time.monotonic()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _checkout(self, entry):
+        raw, created_at = entry
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            logger.debug("Reciclando conexão com %.0fs de vida.", time.monotonic() - created_at)
+            self._close_raw(raw)
+            return self._open()
+
+        if self.ping:
+            try:
+                raw.ping(reconnect=False)
+            except Exception as err:
+                logger.warning("Conexão ociosa inválida, reabrindo: %s", err)
+                self._close_raw(raw)
+                return self._open()
+        return raw, created_at
+
+    def _release(self, raw, created_at):
+        try:
+            raw.rollback()
+        except Exception as err:
+            logger.warning("Falha no rollback ao devolver conexão, descartando: %s", err)
+            self._discard(raw)
+            return
+
+        with self._cond:
+            if not self._closed and self.pid == os.getpid():
+                self._idle.append((raw, created_at))
+                self._cond.notify()
+                return
+            self._size -= 1
+            self._cond.notify()
+        self._close_raw(raw)
+
+    def _discard(self, raw):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        self._close_raw(raw)
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+
+class ReplicaSet:
+    """
+    Conjunto de pools de réplicas de leitura com round-robin.
+    Uma réplica que falha ao entregar conexão fica ejetada por `eject_seconds`;
+    se nenhuma estiver disponível, acquire() retorna None e o chamador usa o primário.
+    """
+
+    def __init__(self, pools, names=None, eject_seconds=30.0):
+        self._pools = list(pools)
+        self.names = list(names or range(len(self._pools)))
+        self.eject_seconds = eject_seconds
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._next = 0
+        self._ejected_until = [0.0] * len(self._pools)
+
+    def healthy(self):
+        now = time.monotonic()
+        return [name for name, until in zip(self.names, self._ejected_until) if until <= now]
+
+    def acquire(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(1, len(self._pools))
+
+        for offset in range(len(self._pools)):
+            idx = (start + offset) % len(self._pools)
+            if self._ejected_until[idx] > time.monotonic():
+                continue
+            try:
+                return self._pools[idx].acquire()
+            except PoolTimeoutError:
+                # Réplica saudável, só ocupada: tenta a próxima
+                continue
+            except Exception as err:
+                self.eject(idx, err)
+        return None
+
+    def eject(self, idx, reason=None):
+        self._ejected_until[idx] = time.monotonic() + self.eject_seconds
+        logger.warning(
+            "Réplica %s ejetada por %.0fs: %s", self.names[idx], self.eject_seconds, reason
+        )
+
+    def close(self):
+        for pool in self._pools:
+            pool.close()
@@ -0,0 +1,179 @@
+"""
+Controle de admissão em memória para as rotas públicas.
+
+- Token buckets por IP e por telefone, com limites por rota (RATE_LIMITS);
+  estourou, a resposta é 429 com Retry-After.
+- Os buckets ficam num LRU limitado (RATE_LIMIT_MAX_BUCKETS): os ociosos há
+  mais tempo são descartados primeiro, e um bucket descartado estaria cheio
+  de qualquer forma.
+- Um teto de requisições públicas simultâneas por processo
+  (RATE_LIMIT_MAX_CONCURRENT) responde 503 antes de esgotar o pool de conexões.
+
+Os limites valem por processo: com N workers do gunicorn o limite efetivo é
+até N vezes maior, o que basta para conter um cliente agressivo.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request
+
+import database
+
+# endpoint -> {tipo da chave: (requisições, período em segundos)}
+RATE_LIMITS = {
+    "get_voluntario_areas": {"ip": (30, 60), "telefone": (10, 60)},
+    "check_vagas": {"ip": (120, 60)},
+    "resumo_vagas": {"ip": (60, 60)},
+    "resumo_vagas_stream": {"ip": (20, 60)},
+    "agendar": {"ip": (20, 60), "telefone": (10, 60)},
+    "agendar_status": {"ip": (120, 60)},
+}
+
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get("RATE_LIMIT_MAX_BUCKETS", 10000))
+RATE_LIMIT_MAX_CONCURRENT = int(os.environ.get("RATE_LIMIT_MAX_CONCURRENT", database.POOL_CONFIG["max_size"]))
+# Header com o IP real do cliente quando há proxy na frente (no Fly: Fly-Client-IP)
+RATE_LIMIT_IP_HEADER = os.environ.get("RATE_LIMIT_IP_HEADER")
+
+
+def parse_limits(value):
+    """Lê "ip=30/60,telefone=10/60" -> {"ip": (30, 60), "telefone": (10, 60)}."""
+    limits = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        kind, _, spec = item.partition("=")
+        count, _, period = spec.partition("/")
+        limits[kind.strip()] = (int(count), float(period or 60))
+    return limits
+
+
+for _endpoint in list(RATE_LIMITS):
+    _override = os.environ.get(f"RATE_LIMIT_{_endpoint.upper()}")
+    if _override is not None:
+        RATE_LIMITS[_endpoint] = parse_limits(_override)
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity, period, now):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def take(self, now):
+        """Consome um token. Retorna 0 se admitido, senão os segundos até o próximo token."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, max_buckets=RATE_LIMIT_MAX_BUCKETS, clock=time.monotonic):
+        self.max_buckets = max_buckets
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def hit(self, key, capacity, period):
+        """Retorna 0 se a requisição cabe no bucket de `key`, senão o Retry-After em segundos."""
+        with self._lock:
+            now = self._clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(capacity, period, now)
+                self._buckets[key] = bucket
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return bucket.take(now)
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active = max(0, self.active - 1)
+
+
+def client_ip():
+    if RATE_LIMIT_IP_HEADER:
+        forwarded = request.headers.get(RATE_LIMIT_IP_HEADER)
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.remote_addr or "-"
+
+
+def _keys(endpoint, limits):
+    for kind, (capacity, period) in limits.items():
+        if kind == "ip":
+            value = client_ip()
+        else:
+            value = request.values.get(kind)
+            if not value:
+                continue
+        yield f"{endpoint}:{kind}:{value}", capacity, period
+
+
+def _reject(status, retry_after, message):
+    response = jsonify({"status": "error", "message": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def init_app(app, limits=None, limiter=None, concurrency=None):
+    """
+    Registra o controle de admissão. Deve ser o primeiro before_request do
+    app, para recusar antes de qualquer acesso ao banco.
+    app.config["RATE_LIMIT_ENABLED"] = False desliga tudo (usado nos testes).
+    """
+    limits = RATE_LIMITS if limits is None else limits
+    limiter = limiter or RateLimiter()
+    concurrency = concurrency or ConcurrencyLimiter(RATE_LIMIT_MAX_CONCURRENT)
+    app.extensions["rate_limit"] = {"limiter": limiter, "concurrency": concurrency, "limits": limits}
+
+    @app.before_request
+    def _admit_request():
+        if not app.config.get("RATE_LIMIT_ENABLED", True):
+            return None
+        route_limits = limits.get(request.endpoint)
+        if not route_limits:
+            return None
+
+        retry_after = 0
+        for key, capacity, period in _keys(request.endpoint, route_limits):
+            retry_after = max(retry_after, limiter.hit(key, capacity, period))
+        if retry_after:
+            return _reject(429, retry_after, "Muitas requisições. Aguarde um pouco e tente novamente.")
+
+        if not concurrency.try_acquire():
+            return _reject(503, 1, "Sistema ocupado no momento. Tente novamente em instantes.")
+        g.rate_limit_slot = True
+        return None
+
+    @app.teardown_request
+    def _release_slot(exc):
+        if g.pop("rate_limit_slot", None):
+            concurrency.release()
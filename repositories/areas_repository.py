@@ -1,31 +1,48 @@
+import unicodedata
+
+from repositories import events
 from repositories.base import connect, logger
+from repositories.cache import VersionedCache, bump_version
+from repositories.dashboard_repository import invalidate_areas
 from repositories.errors import RepositoryError
 
 
-def list_areas():
-    conn = connect()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM areas")
-            return cursor.fetchall()
-    except Exception as err:
-        logger.exception("Erro ao listar áreas: %s", err)
-        raise RepositoryError("Erro ao listar áreas.") from err
-    finally:
-        conn.close()
+def _collation_key(nome):
+    # Aproxima a collation do MySQL (sem acento, sem caixa): "Área" fica junto de "Apoio"
+    sem_acento = unicodedata.normalize("NFKD", nome or "")
+    return "".join(c for c in sem_acento if not unicodedata.combining(c)).casefold()
+
+
+def _load_areas(cursor):
+    cursor.execute("SELECT * FROM areas ORDER BY id")
+    return cursor.fetchall()
+
+
+def _index_areas(areas):
+    return {
+        "by_id": {area["id"]: area for area in areas},
+        "ordered": areas,
+        "by_name": sorted(areas, key=lambda area: _collation_key(area["nome"])),
+    }
+
+
+area_cache = VersionedCache("areas", _load_areas, build=_index_areas)
+events.subscribe("areas_changed", area_cache.invalidate)
+
+
+def list_areas(by_name=False):
+    """Áreas do cache (ordem de id, ou de nome com by_name=True). Cada chamada recebe cópias."""
+    catalogo = area_cache.get()
+    return [dict(area) for area in catalogo["by_name" if by_name else "ordered"]]
 
 
 def get_area_by_id(area_id):
-    conn = connect()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM areas WHERE id = %s", (area_id,))
-            return cursor.fetchone()
-    except Exception as err:
-        logger.exception("Erro ao buscar área %s: %s", area_id, err)
-        raise RepositoryError("Erro ao buscar área.") from err
-    finally:
-        conn.close()
+        area_id = int(area_id)
+    except (TypeError, ValueError):
+        return None
+    area = area_cache.get()["by_id"].get(area_id)
+    return dict(area) if area else None
 
 
 def create_area(nome, max_pessoas, dias_disponiveis):
@@ -36,7 +53,9 @@ def create_area(nome, max_pessoas, dias_disponiveis):
                 "INSERT INTO areas (nome, max_pessoas, dias_disponiveis) VALUES (%s, %s, %s)",
                 (nome, int(max_pessoas), dias_disponiveis),
             )
+            bump_version(cursor, "areas")
         conn.commit()
+        events.publish("areas_changed")
     except Exception as err:
         conn.rollback()
         logger.exception("Erro ao criar área: %s", err)
@@ -53,7 +72,11 @@ def update_area(area_id, nome, max_pessoas, dias_disponiveis):
                 "UPDATE areas SET nome = %s, max_pessoas = %s, dias_disponiveis = %s WHERE id = %s",
                 (nome, int(max_pessoas), dias_disponiveis, area_id),
             )
+            # A disponibilidade define as datas da grade
+            invalidate_areas(cursor, [area_id])
+            bump_version(cursor, "areas")
         conn.commit()
+        events.publish("areas_changed", area_id=area_id)
     except Exception as err:
         conn.rollback()
         logger.exception("Erro ao atualizar área %s: %s", area_id, err)
@@ -66,10 +89,15 @@ def delete_area(area_id):
     conn = connect()
     try:
         with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM slot_ocupacao WHERE area_id = %s", (area_id,))
             cursor.execute("DELETE FROM escalas WHERE area_id = %s", (area_id,))
             cursor.execute("DELETE FROM voluntario_areas WHERE area_id = %s", (area_id,))
             cursor.execute("DELETE FROM areas WHERE id = %s", (area_id,))
+            # Quem só estava escalado nesta área passa a "não escalado" nas outras
+            invalidate_areas(cursor)
+            bump_version(cursor, "areas")
         conn.commit()
+        events.publish("areas_changed", area_id=area_id)
     except Exception as err:
         conn.rollback()
         logger.exception("Erro ao excluir área: %s", err)
@@ -1,14 +1,64 @@
 import logging
+from datetime import date
 
-from database import get_db_connection
+import database
+from repositories.instrumentation import instrument
+from repositories.unit_of_work import current_unit_of_work
 
 logger = logging.getLogger(__name__)
 
 
-def connect():
-    conn = get_db_connection()
+def connect(readonly=False):
+    """
+    Retorna a conexão da unidade de trabalho da requisição atual, se houver;
+    fora de uma requisição, empresta uma conexão do pool.
+    readonly=True permite que a leitura seja servida por uma réplica.
+    Os cursores da conexão retornada são instrumentados (ver instrumentation).
+    """
+    uow = current_unit_of_work()
+    if uow is not None:
+        return instrument(uow.connection(readonly=readonly))
+    return connect_dedicated(readonly=readonly)
+
+
+def connect_dedicated(readonly=False):
+    """
+    Empresta uma conexão do pool só para quem chama, mesmo dentro de uma
+    requisição (fora da unidade de trabalho, com commit/close próprios). Para
+    leituras com cursor sem buffer, que prendem a conexão até o fim.
+    """
+    conn = database.get_db_connection(readonly=readonly)
     if conn is None:
         from repositories.errors import RepositoryError
 
         raise RepositoryError("Erro ao conectar ao banco de dados.")
-    return conn
+    return instrument(conn)
+
+
+def month_range(year, month):
+    """Retorna (primeiro dia do mês, primeiro dia do mês seguinte)."""
+    year, month = int(year), int(month)
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def date_range_predicate(column, start=None, end=None):
+    """
+    Monta `start <= column < end` comparando a coluna DATE diretamente,
+    para que o MySQL use índices (ao contrário de `column LIKE 'YYYY-MM-%'`).
+    Retorna (sql, params).
+    """
+    clauses = []
+    params = []
+    if start is not None:
+        clauses.append(f"{column} >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append(f"{column} < %s")
+        params.append(end)
+    return " AND ".join(clauses) or "1 = 1", params
+
+
+def month_predicate(column, year, month):
+    return date_range_predicate(column, *month_range(year, month))
@@ -0,0 +1,216 @@
+"""
+Caches do app, sobre um backend de repositories.cache_backends (CACHE_BACKEND:
+em memória por processo, SQLite compartilhado pela máquina ou Redis).
+
+VersionedCache guarda um valor que muda pouco, como o catálogo de áreas.
+Cada cache tem uma linha em cache_versions. Quem escreve chama bump_version()
+na mesma transação da escrita e invalida o cache local depois do commit
+(via repositories.events). Os outros workers do gunicorn não recebem esse
+aviso, então conferem a versão no banco no máximo a cada
+CACHE_CHECK_SECONDS; se mudou, recarregam. CACHE_TTL_SECONDS é a rede de
+segurança para escritas feitas fora do app (SQL manual, por exemplo). O
+valor pronto fica em memória; com backend compartilhado, a carga de cada
+versão é feita por um worker só e reaproveitada pelos outros.
+
+SharedCache guarda valores calculados por chave (o resumo de vagas por área
+e mês, por exemplo), com TTL. Cada entrada depende de carimbos de versão
+(contadores no backend); bump() de um carimbo invalida todas as entradas que
+dependem dele, em todos os workers que usam o mesmo backend.
+
+Um backend fora do ar nunca derruba a requisição: o valor é calculado direto.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from repositories.base import connect
+from repositories.cache_backends import get_backend
+from repositories.errors import RepositoryError
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", 600))
+CACHE_CHECK_SECONDS = float(os.environ.get("CACHE_CHECK_SECONDS", 2))
+
+
+def bump_version(cursor, nome):
+    cursor.execute(
+        """
+        INSERT INTO cache_versions (nome, versao) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE versao = versao + 1
+        """,
+        (nome,),
+    )
+
+
+def read_version(cursor, nome):
+    cursor.execute("SELECT versao FROM cache_versions WHERE nome = %s", (nome,))
+    row = cursor.fetchone()
+    return row["versao"] if row else 0
+
+
+def _backend_get(backend, key):
+    try:
+        return backend.get(key)
+    except Exception as err:
+        logger.warning("Backend de cache indisponível ao ler %s: %s", key, err)
+        return None
+
+
+def _backend_set(backend, key, value, ttl):
+    try:
+        backend.set(key, value, ttl)
+    except Exception as err:
+        logger.warning("Backend de cache indisponível ao gravar %s: %s", key, err)
+
+
+@contextmanager
+def _single_flight(backend, key):
+    try:
+        trava = backend.lock(key)
+        acquired = trava.__enter__()
+    except Exception as err:
+        logger.warning("Backend de cache indisponível ao travar %s: %s", key, err)
+        yield False
+        return
+    try:
+        yield acquired
+    finally:
+        try:
+            trava.__exit__(None, None, None)
+        except Exception as err:
+            logger.warning("Backend de cache indisponível ao liberar %s: %s", key, err)
+
+
+def load_shared(backend, key, loader, ttl):
+    """
+    Valor de `key` no backend; se ausente, loader() sob a trava de
+    single-flight da chave (quem esperou a trava costuma achar o valor
+    pronto). Resultados None não são gravados.
+    """
+    value = _backend_get(backend, key)
+    if value is not None:
+        return value
+    with _single_flight(backend, key + ":trava"):
+        value = _backend_get(backend, key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                _backend_set(backend, key, value, ttl)
+    return value
+
+
+class VersionedCache:
+    """
+    Um valor carregado por loader(cursor), válido enquanto a versão `nome` em
+    cache_versions não mudar e o TTL não vencer. loader devolve dados
+    serializáveis em JSON (vão para o backend); build() monta a partir deles
+    o valor guardado em memória (índices, por exemplo).
+    """
+
+    def __init__(self, nome, loader, build=None, ttl=None, check_interval=None, clock=time.monotonic, backend=None):
+        self.nome = nome
+        self._loader = loader
+        self._build = build or (lambda raw: raw)
+        self.ttl = CACHE_TTL_SECONDS if ttl is None else ttl
+        self.check_interval = CACHE_CHECK_SECONDS if check_interval is None else check_interval
+        self._clock = clock
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        # Incrementado a cada invalidate(); uma carga que começou antes não é guardada
+        self._generation = 0
+
+    def get(self):
+        now = self._clock()
+        with self._lock:
+            value, version, generation = self._value, self._version, self._generation
+            fresh = value is not None and now - self._loaded_at < self.ttl
+            if fresh and now - self._checked_at < self.check_interval:
+                return value
+
+        conn = connect()
+        try:
+            with conn.cursor() as cursor:
+                current = read_version(cursor, self.nome)
+                if fresh and current == version:
+                    with self._lock:
+                        self._checked_at = now
+                    return value
+                backend = get_backend() if self._backend is None else self._backend
+                raw = load_shared(
+                    backend, f"{self.nome}:v{current}",
+                    lambda: self._loader(cursor), self.ttl,
+                )
+        except Exception as err:
+            logger.exception("Erro ao carregar cache %s: %s", self.nome, err)
+            raise RepositoryError(f"Erro ao carregar {self.nome}.") from err
+        finally:
+            conn.close()
+
+        value = self._build(raw)
+        with self._lock:
+            if self._generation == generation:
+                self._value = value
+                self._version = current
+                self._loaded_at = self._checked_at = now
+        return value
+
+    def invalidate(self, **_):
+        """Descarta a cópia em memória; a próxima leitura confere a versão no banco."""
+        with self._lock:
+            self._value = None
+            self._version = None
+            self._generation += 1
+
+
+class SharedCache:
+    """
+    Valores calculados por chave, no backend, com validade de `ttl` segundos.
+    A chave efetiva inclui os valores atuais dos carimbos da entrada, então
+    bump() de um carimbo faz as entradas antigas deixarem de ser lidas (e
+    saírem por TTL ou LRU). Uma carga que cruzou um bump() fica guardada na
+    chave antiga, que ninguém mais lê.
+    """
+
+    def __init__(self, namespace, ttl, backend=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._backend = backend
+
+    @property
+    def backend(self):
+        return get_backend() if self._backend is None else self._backend
+
+    def _stamp_key(self, stamp):
+        return f"{self.namespace}:carimbo:{stamp}"
+
+    def versions(self, stamps):
+        """Valores atuais dos carimbos; mudam a cada bump(), em todos os workers que usam o backend."""
+        return self.backend.counters([self._stamp_key(stamp) for stamp in stamps])
+
+    def get_or_load(self, key, loader, stamps=()):
+        """Valor de `key` para os carimbos atuais; se ausente, loader(). Resultados None não são guardados."""
+        backend = self.backend
+        try:
+            versions = backend.counters([self._stamp_key(stamp) for stamp in stamps])
+        except Exception as err:
+            logger.warning("Backend de cache indisponível ao ler carimbos de %s: %s", self.namespace, err)
+            return loader()
+        if isinstance(key, tuple):
+            key = ":".join(str(part) for part in key)
+        chave = f"{self.namespace}:{key}@" + ".".join(str(v) for v in versions)
+        return load_shared(backend, chave, loader, self.ttl)
+
+    def bump(self, *stamps):
+        backend = self.backend
+        for stamp in stamps:
+            try:
+                backend.incr(self._stamp_key(stamp))
+            except Exception as err:
+                logger.warning("Backend de cache indisponível ao invalidar %s: %s", self._stamp_key(stamp), err)
@@ -0,0 +1,377 @@
+"""
+Backends dos caches do app (repositories.cache).
+
+Todos têm a mesma interface:
+- get(key) / set(key, value, ttl=None) / delete(key); valores em JSON
+  (listas, dicts de chave texto, números e textos);
+- incr(key, delta=1): incremento atômico, usado para carimbos de versão;
+- counters(keys): valores atuais dos contadores (0 se ainda não existem);
+- lock(key, ttl, wait): trava de single-flight. Context manager que entrega
+  True se esta chamada ficou com a trava, ou False se esperou `wait`
+  segundos sem conseguir. A trava expira sozinha após `ttl` segundos.
+
+CACHE_BACKEND escolhe o backend do processo:
+- "local" (padrão): LRU em memória, por processo;
+- "sqlite:///caminho/cache.db": arquivo SQLite em modo WAL, compartilhado
+  pelos workers do gunicorn na mesma máquina;
+- "redis://[:senha@]host:porta/db": qualquer servidor que fale o protocolo
+  do Redis, compartilhado entre máquinas. Usa um cliente mínimo embutido,
+  sem dependência nova.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "local")
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 1000))
+LOCK_TTL_SECONDS = 10
+LOCK_WAIT_SECONDS = 2
+LOCK_POLL_SECONDS = 0.01
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class LocalBackend:
+    """
+    LRU em memória, por processo. Os valores são guardados sem cópia. O ttl
+    das travas é ignorado: no mesmo processo a trava sempre sai no finally.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+        # Uma trava por chave em uso: {chave: [Lock, quantos a usam]}, removida ao ficar sem uso
+        self._key_locks = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expira = entry
+            if expira is not None and self._clock() >= expira:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expira = None if ttl is None else self._clock() + ttl
+        with self._lock:
+            self._entries[key] = (value, expira)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._counters.pop(key, None)
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + delta
+            return self._counters[key]
+
+    def counters(self, keys):
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    @contextmanager
+    def lock(self, key, ttl=LOCK_TTL_SECONDS, wait=LOCK_WAIT_SECONDS):
+        with self._lock:
+            entrada = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entrada[1] += 1
+        acquired = entrada[0].acquire(timeout=wait)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                entrada[0].release()
+            with self._lock:
+                entrada[1] -= 1
+                if not entrada[1]:
+                    del self._key_locks[key]
+
+
+class SQLiteBackend:
+    """
+    Arquivo SQLite em modo WAL: leituras não bloqueiam a escrita e todos os
+    processos da máquina enxergam as mesmas entradas. Uma conexão por thread
+    (e por pid, já que o gunicorn cria os workers com fork). As entradas
+    vencidas e o excesso acima de max_entries (as gravadas há mais tempo)
+    são apagados no máximo a cada PURGE_INTERVAL_SECONDS.
+    """
+
+    PURGE_INTERVAL_SECONDS = 60
+
+    def __init__(self, path, max_entries=CACHE_MAX_ENTRIES, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        # Relógio de parede: as expirações são comparadas entre processos
+        self._clock = clock
+        self._local = threading.local()
+        self._last_purge = 0.0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache "
+            "(chave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira REAL, gravado REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_gravado ON cache (gravado)")
+        conn.execute("CREATE TABLE IF NOT EXISTS contadores (chave TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS travas (chave TEXT PRIMARY KEY, dono TEXT NOT NULL, expira REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: cada comando é a própria transação
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute("SELECT valor, expira FROM cache WHERE chave = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and self._clock() >= row[1]):
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = self._clock()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (chave, valor, expira, gravado) VALUES (?, ?, ?, ?)",
+            (key, _dumps(value), None if ttl is None else now + ttl, now),
+        )
+        if now - self._last_purge >= self.PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            self._purge(conn, now)
+
+    def _purge(self, conn, now):
+        conn.execute("DELETE FROM cache WHERE expira <= ?", (now,))
+        excesso = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if excesso > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE chave IN (SELECT chave FROM cache ORDER BY gravado LIMIT ?)", (excesso,)
+            )
+
+    def delete(self, key):
+        conn = self._connection()
+        conn.execute("DELETE FROM cache WHERE chave = ?", (key,))
+        conn.execute("DELETE FROM contadores WHERE chave = ?", (key,))
+
+    def incr(self, key, delta=1):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO contadores (chave, valor) VALUES (?, ?) "
+                "ON CONFLICT(chave) DO UPDATE SET valor = valor + excluded.valor",
+                (key, delta),
+            )
+            valor = conn.execute("SELECT valor FROM contadores WHERE chave = ?", (key,)).fetchone()[0]
+            conn.execute("COMMIT")
+            return valor
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def counters(self, keys):
+        if not keys:
+            return []
+        marcadores = ", ".join(["?"] * len(keys))
+        rows = self._connection().execute(
+            f"SELECT chave, valor FROM contadores WHERE chave IN ({marcadores})", list(keys)
+        ).fetchall()
+        valores = dict(rows)
+        return [valores.get(key, 0) for key in keys]
+
+    @contextmanager
+    def lock(self, key, ttl=LOCK_TTL_SECONDS, wait=LOCK_WAIT_SECONDS):
+        conn = self._connection()
+        dono = uuid.uuid4().hex
+        limite = time.monotonic() + wait
+        acquired = False
+        while True:
+            now = self._clock()
+            # Só assume a trava se ninguém a tem ou se a do dono anterior venceu
+            cursor = conn.execute(
+                "INSERT INTO travas (chave, dono, expira) VALUES (?, ?, ?) "
+                "ON CONFLICT(chave) DO UPDATE SET dono = excluded.dono, expira = excluded.expira "
+                "WHERE travas.expira <= ?",
+                (key, dono, now + ttl, now),
+            )
+            if cursor.rowcount == 1:
+                acquired = True
+                break
+            if time.monotonic() >= limite:
+                break
+            time.sleep(LOCK_POLL_SECONDS)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute("DELETE FROM travas WHERE chave = ? AND dono = ?", (key, dono))
+
+
+class RedisError(Exception):
+    pass
+
+
+# Libera a trava só se ela ainda for desta chamada (pode ter vencido e passado a outro)
+_RELEASE_SCRIPT = 'if redis.call("get", KEYS[1]) == ARGV[1] then return redis.call("del", KEYS[1]) else return 0 end'
+
+
+def encode_command(args):
+    partes = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        partes.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(partes)
+
+
+def read_reply(rfile):
+    line = rfile.readline()
+    if not line:
+        raise ConnectionError("Conexão com o servidor de cache encerrada.")
+    prefix, body = line[:1], line[1:-2]
+    if prefix == b"+":
+        return body.decode("utf-8")
+    if prefix == b"-":
+        raise RedisError(body.decode("utf-8"))
+    if prefix == b":":
+        return int(body)
+    if prefix == b"$":
+        size = int(body)
+        return None if size < 0 else rfile.read(size + 2)[:-2]
+    if prefix == b"*":
+        size = int(body)
+        return None if size < 0 else [read_reply(rfile) for _ in range(size)]
+    raise RedisError(f"Resposta inválida do servidor de cache: {line!r}")
+
+
+class RedisBackend:
+    """Cliente mínimo do protocolo do Redis (RESP2), com uma conexão por thread."""
+
+    def __init__(self, url, timeout=1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int((parsed.path or "/").lstrip("/") or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn, self._local.pid = conn, os.getpid()
+            if self.password:
+                self.command("AUTH", self.password)
+            if self.db:
+                self.command("SELECT", self.db)
+        return conn
+
+    def command(self, *args):
+        sock, rfile = self._connection()
+        try:
+            sock.sendall(encode_command(args))
+            return read_reply(rfile)
+        except (OSError, ConnectionError):
+            # Conexão em estado desconhecido: a próxima chamada abre outra
+            self._local.conn = None
+            sock.close()
+            raise
+
+    def get(self, key):
+        value = self.command("GET", key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            self.command("SET", key, _dumps(value))
+        else:
+            self.command("SET", key, _dumps(value), "PX", max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self.command("DEL", key)
+
+    def incr(self, key, delta=1):
+        return self.command("INCRBY", key, delta)
+
+    def counters(self, keys):
+        if not keys:
+            return []
+        return [int(value) if value is not None else 0 for value in self.command("MGET", *keys)]
+
+    @contextmanager
+    def lock(self, key, ttl=LOCK_TTL_SECONDS, wait=LOCK_WAIT_SECONDS):
+        dono = uuid.uuid4().hex
+        limite = time.monotonic() + wait
+        acquired = False
+        while True:
+            if self.command("SET", key, dono, "NX", "PX", max(1, int(ttl * 1000))) == "OK":
+                acquired = True
+                break
+            if time.monotonic() >= limite:
+                break
+            time.sleep(LOCK_POLL_SECONDS)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.command("EVAL", _RELEASE_SCRIPT, 1, key, dono)
+
+
+def backend_from_url(url, max_entries=CACHE_MAX_ENTRIES):
+    if not url or url == "local":
+        return LocalBackend(max_entries)
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):], max_entries)
+    if url.startswith("redis://"):
+        return RedisBackend(url)
+    raise ValueError(f"CACHE_BACKEND desconhecido: {url}")
+
+
+_state = {"pid": None, "backend": None}
+_state_lock = threading.Lock()
+
+
+def get_backend():
+    """Backend do processo, criado a partir de CACHE_BACKEND no primeiro uso (de novo após um fork)."""
+    with _state_lock:
+        if _state["backend"] is None or _state["pid"] != os.getpid():
+            _state["backend"] = backend_from_url(CACHE_BACKEND)
+            _state["pid"] = os.getpid()
+        return _state["backend"]
+
+
+def use_backend(backend):
+    """Troca o backend do processo (testes, ou configuração feita por código)."""
+    with _state_lock:
+        _state["backend"] = backend
+        _state["pid"] = os.getpid()
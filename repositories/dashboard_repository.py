@@ -0,0 +1,208 @@
+"""
+Grade do dashboard já montada, por área e mês (tabela dashboard_snapshots).
+
+Cada linha guarda em JSON o que /admin mostra de uma área no mês: as datas,
+os escalados de cada dia/turno (responsáveis e equipe), max_rows e os
+voluntários da área que não estão escalados no mês. O dashboard lê a linha
+pela chave primária e só remonta a grade (duas consultas) quando ela está
+vazia.
+
+Toda escrita em escalas, voluntários ou áreas chama, na mesma transação, uma
+das funções com `cursor` abaixo: elas sobem a versão e apagam a grade só das
+linhas afetadas. Uma escala mexe na área dela e nas áreas do voluntário (a
+lista de não escalados considera o mês inteiro, em qualquer área). A grade
+remontada é gravada só se a versão ainda for a lida, então uma escrita
+concorrente nunca é coberta por uma grade antiga.
+"""
+import json
+
+from availability import availability_for
+from repositories.base import connect, logger, month_predicate
+from repositories.errors import RepositoryError
+
+_INVALIDA = "ON DUPLICATE KEY UPDATE versao = versao + 1, grade = NULL"
+
+
+def _ano_mes(data):
+    if hasattr(data, "year"):
+        return data.year, data.month
+    return int(str(data)[:4]), int(str(data)[5:7])
+
+
+def invalidate_slots(cursor, voluntario_id, slots):
+    """
+    Escalas do voluntário criadas ou removidas nos `slots` [(area_id, data)]:
+    invalida os meses deles na área das escalas e nas áreas do voluntário.
+    """
+    area_ids = sorted({int(area_id) for area_id, _ in slots})
+    meses = sorted({_ano_mes(data) for _, data in slots})
+    if not area_ids:
+        return
+    areas_sql = " UNION ".join(["SELECT %s"] * len(area_ids))
+    meses_sql = " UNION ALL ".join(["SELECT %s AS ano, %s AS mes"] * len(meses))
+    cursor.execute(
+        """
+        INSERT INTO dashboard_snapshots (area_id, ano, mes)
+        SELECT a.area_id, m.ano, m.mes
+        FROM (SELECT area_id FROM voluntario_areas WHERE voluntario_id = %s UNION """ + areas_sql + """) a
+        CROSS JOIN (""" + meses_sql + """) m
+        ORDER BY a.area_id, m.ano, m.mes
+        """ + _INVALIDA,
+        [voluntario_id] + area_ids + [parte for mes in meses for parte in mes],
+    )
+
+
+def invalidate_voluntario(cursor, voluntario_id, area_ids=()):
+    """
+    Nome, papel, áreas ou exclusão do voluntário: invalida os meses em que ele
+    está escalado e todos os meses das áreas dele (as atuais e `area_ids`).
+    Chame antes de alterar as escalas e as áreas.
+    """
+    cursor.execute(
+        """
+        INSERT INTO dashboard_snapshots (area_id, ano, mes)
+        SELECT DISTINCT e.area_id, YEAR(e.data), MONTH(e.data)
+        FROM escalas e
+        WHERE e.voluntario_id = %s
+        ORDER BY 1, 2, 3
+        """ + _INVALIDA,
+        (voluntario_id,),
+    )
+    area_ids = sorted({int(area_id) for area_id in area_ids})
+    extra_sql = (" OR area_id IN (" + ", ".join(["%s"] * len(area_ids)) + ")") if area_ids else ""
+    cursor.execute(
+        "UPDATE dashboard_snapshots SET versao = versao + 1, grade = NULL"
+        " WHERE area_id IN (SELECT area_id FROM voluntario_areas WHERE voluntario_id = %s)" + extra_sql,
+        [voluntario_id] + area_ids,
+    )
+
+
+def invalidate_areas(cursor, area_ids=None):
+    """Todos os meses das áreas (novos voluntários, disponibilidade alterada); None = todas."""
+    if area_ids is None:
+        cursor.execute("UPDATE dashboard_snapshots SET versao = versao + 1, grade = NULL")
+        return
+    area_ids = sorted({int(area_id) for area_id in area_ids})
+    if area_ids:
+        cursor.execute(
+            "UPDATE dashboard_snapshots SET versao = versao + 1, grade = NULL"
+            " WHERE area_id IN (" + ", ".join(["%s"] * len(area_ids)) + ")",
+            area_ids,
+        )
+
+
+def nao_escalados(cursor, area_id, ano, mes):
+    """Voluntários da área sem nenhuma escala no mês (em qualquer área), por nome."""
+    periodo_sql, periodo_params = month_predicate("data", ano, mes)
+    cursor.execute(
+        """
+        SELECT v.id, v.nome, v.telefone
+        FROM voluntarios v
+        JOIN voluntario_areas va ON v.id = va.voluntario_id
+        WHERE va.area_id = %s
+          AND v.id NOT IN (
+              SELECT voluntario_id
+              FROM escalas
+              WHERE """ + periodo_sql + """
+          )
+        ORDER BY v.nome ASC
+        """,
+        tuple([area_id] + periodo_params),
+    )
+    return cursor.fetchall()
+
+
+def _iso(data):
+    return data.strftime("%Y-%m-%d") if hasattr(data, "strftime") else str(data)
+
+
+def _montar(area, ano, mes, escalas, nao_escalados):
+    # Datas da disponibilidade da área, mais as de escalas fora dela (configuração alterada depois)
+    datas = {
+        item["iso"]: {"iso": item["iso"], "br": item["br"]}
+        for item in availability_for(area).dates(ano, mes)
+    }
+    for escala in escalas:
+        iso = _iso(escala["data"])
+        if iso not in datas:
+            datas[iso] = {"iso": iso, "br": f"{iso[8:10]}/{iso[5:7]}/{iso[:4]}"}
+    datas = [datas[iso] for iso in sorted(datas)]
+
+    dias = {
+        dia["iso"]: {"Manhã": {"responsavel": [], "equipe": []}, "Noite": {"responsavel": [], "equipe": []}}
+        for dia in datas
+    }
+    for escala in escalas:
+        turnos = dias[_iso(escala["data"])]
+        if escala["turno"] in turnos:
+            grupo = "responsavel" if escala["responsavel"] else "equipe"
+            turnos[escala["turno"]][grupo].append({"id": escala["id"], "nome": escala["voluntario_nome"]})
+
+    maior = 0
+    for turnos in dias.values():
+        maior = max(maior, len(turnos["Manhã"]["equipe"]), len(turnos["Noite"]["equipe"]))
+
+    return {
+        "datas": datas,
+        "dias": dias,
+        "max_rows": max(maior + 2, 2),
+        "nao_escalados": [
+            {"id": row["id"], "nome": row["nome"], "telefone": row["telefone"]} for row in nao_escalados
+        ],
+    }
+
+
+def get_dashboard_snapshot(area, ano, mes):
+    """
+    Grade da área no mês: {"datas", "dias", "max_rows", "nao_escalados"}, com
+    dias = {iso: {turno: {"responsavel": [...], "equipe": [...]}}}.
+    Uma leitura pela chave; sem grade gravada, monta e grava.
+    """
+    # Sempre no primário: a grade gravada é comparada com a versão lida
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            chave = (area["id"], ano, mes)
+            cursor.execute(
+                "SELECT versao, grade FROM dashboard_snapshots WHERE area_id = %s AND ano = %s AND mes = %s",
+                chave,
+            )
+            row = cursor.fetchone()
+            if row and row["grade"]:
+                return json.loads(row["grade"])
+
+            periodo_sql, periodo_params = month_predicate("e.data", ano, mes)
+            cursor.execute(
+                """
+                SELECT e.id, v.nome AS voluntario_nome, v.responsavel, e.data, e.turno
+                FROM escalas e
+                JOIN voluntarios v ON e.voluntario_id = v.id
+                WHERE e.area_id = %s AND """ + periodo_sql + """
+                ORDER BY e.data ASC, e.turno ASC, v.responsavel DESC, v.nome ASC
+                """,
+                [area["id"]] + periodo_params,
+            )
+            escalas = cursor.fetchall()
+            grade = _montar(area, ano, mes, escalas, nao_escalados(cursor, area["id"], ano, mes))
+
+            texto = json.dumps(grade, ensure_ascii=False, separators=(",", ":"))
+            if row is None:
+                # Uma escrita que chegar antes cria a linha vazia; aí esta grade fica de fora
+                cursor.execute(
+                    "INSERT IGNORE INTO dashboard_snapshots (area_id, ano, mes, grade) VALUES (%s, %s, %s, %s)",
+                    chave + (texto,),
+                )
+            else:
+                cursor.execute(
+                    "UPDATE dashboard_snapshots SET grade = %s"
+                    " WHERE area_id = %s AND ano = %s AND mes = %s AND versao = %s",
+                    (texto,) + chave + (row["versao"],),
+                )
+        conn.commit()
+        return grade
+    except Exception as err:
+        conn.rollback()
+        logger.exception("Erro ao montar grade do dashboard: %s", err)
+        raise RepositoryError("Erro ao carregar dashboard.") from err
+    finally:
+        conn.close()
@@ -1,5 +1,14 @@
-from repositories.base import connect, logger
+import pymysql.cursors
+
+from repositories import events
+from repositories.areas_repository import get_area_by_id, list_areas
+from repositories.base import connect, connect_dedicated, date_range_predicate, logger, month_predicate, month_range
+from repositories.dashboard_repository import invalidate_slots
 from repositories.errors import RepositoryError
+from repositories.ocupacao_repository import adjust_ocupacao, lock_slots
+
+# Linhas lidas por vez do cursor sem buffer da exportação
+EXPORT_FETCH_ROWS = 500
 
 
 def count_agendados_non_responsavel(area_id, data, turno):
@@ -8,10 +17,8 @@ def count_agendados_non_responsavel(area_id, data, turno):
         with conn.cursor() as cursor:
             cursor.execute(
                 """
-                SELECT count(e.id) as count FROM escalas e
-                JOIN voluntarios v ON e.voluntario_id = v.id
-                WHERE e.area_id = %s AND e.data = %s AND e.turno = %s
-                  AND (v.responsavel = 0 OR v.responsavel IS NULL)
+                SELECT equipe as count FROM slot_ocupacao
+                WHERE area_id = %s AND data = %s AND turno = %s
                 """,
                 (area_id, data, turno),
             )
@@ -43,6 +50,20 @@ def escala_exists(voluntario_id, data, turno):
         conn.close()
 
 
+def get_escala_by_id(escala_id):
+    """Retorna {"voluntario_id", "area_id", "data", "turno"} da escala ou None."""
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT voluntario_id, area_id, data, turno FROM escalas WHERE id = %s", (escala_id,))
+            return cursor.fetchone()
+    except Exception as err:
+        logger.exception("Erro ao buscar escala %s: %s", escala_id, err)
+        raise RepositoryError("Erro ao buscar escala.") from err
+    finally:
+        conn.close()
+
+
 def create_escala(voluntario_id, area_id, data, turno):
     conn = connect()
     try:
@@ -54,7 +75,10 @@ def create_escala(voluntario_id, area_id, data, turno):
                 """,
                 (voluntario_id, area_id, data, turno),
             )
+            adjust_ocupacao(cursor, "e.id = %s", [cursor.lastrowid])
+            invalidate_slots(cursor, voluntario_id, [(area_id, data)])
         conn.commit()
+        events.publish("escalas_changed", slots=[(area_id, data)])
     except Exception as err:
         conn.rollback()
         logger.exception("Erro ao criar escala: %s", err)
@@ -63,41 +87,128 @@ def create_escala(voluntario_id, area_id, data, turno):
         conn.close()
 
 
-def get_resumo_vagas(area_id, year, month):
+def book_slots(voluntario_id, area_id, slots):
+    """
+    Agenda o voluntário em vários horários (data, turno) da área numa única transação.
+
+    As linhas de slot_ocupacao dos horários pedidos são travadas com FOR UPDATE
+    (em ordem) antes da validação, então dois agendamentos simultâneos no mesmo
+    horário não conseguem passar de max_pessoas. Escalas já existentes do
+    voluntário são checadas numa consulta só, os horários aceitos são gravados
+    num único INSERT e os contadores num único UPDATE.
+
+    Retorna None se a área não existir; senão uma lista, na ordem de `slots`,
+    de dicts {"data", "turno", "status"} com status "agendado", "lotado" ou
+    "duplicado".
+    """
+    if not slots:
+        return []
     conn = connect()
     try:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT max_pessoas FROM areas WHERE id = %s", (area_id,))
-            area = cursor.fetchone()
-            if not area:
-                return None, [], []
+            travados = lock_slots(cursor, area_id, slots)
+            if travados is None:
+                return None
+            max_pessoas, ocupacao = travados
 
-            params = (area_id, f"{year}-{month:02d}-%")
+            pedidos = sorted(set(slots))
+            tuplas = ", ".join(["(%s, %s)"] * len(pedidos))
+            params = [data_turno for pedido in pedidos for data_turno in pedido]
             cursor.execute(
                 """
-                SELECT e.data, e.turno, count(e.id) as total
-                FROM escalas e
-                JOIN voluntarios v ON e.voluntario_id = v.id
-                WHERE e.area_id = %s AND e.data LIKE %s
-                  AND (v.responsavel = 0 OR v.responsavel IS NULL)
-                GROUP BY e.data, e.turno
+                SELECT v.responsavel, e.data, e.turno
+                FROM voluntarios v
+                LEFT JOIN escalas e ON e.voluntario_id = v.id AND (e.data, e.turno) IN (""" + tuplas + """)
+                WHERE v.id = %s
                 """,
-                params,
+                params + [voluntario_id],
             )
-            agrupado = cursor.fetchall()
+            rows = cursor.fetchall()
+            responsavel = bool(rows and rows[0]["responsavel"] == 1)
+            ja_escalado = {(str(row["data"]), row["turno"]) for row in rows if row["data"] is not None}
+
+            resultados = []
+            aceitos = []
+            for data, turno in slots:
+                if (data, turno) in aceitos:
+                    status = "duplicado"
+                elif ocupacao.get((str(data), turno), 0) >= max_pessoas:
+                    status = "lotado"
+                elif (str(data), turno) in ja_escalado:
+                    status = "duplicado"
+                else:
+                    status = "agendado"
+                    aceitos.append((data, turno))
+                resultados.append({"data": data, "turno": turno, "status": status})
 
+            if aceitos:
+                valores = ", ".join(["(%s, %s, %s, %s)"] * len(aceitos))
+                params = []
+                for data, turno in aceitos:
+                    params.extend([voluntario_id, area_id, data, turno])
+                cursor.execute(
+                    "INSERT INTO escalas (voluntario_id, area_id, data, turno) VALUES " + valores,
+                    params,
+                )
+
+                tuplas = ", ".join(["(%s, %s)"] * len(aceitos))
+                coluna = "responsaveis" if responsavel else "equipe"
+                cursor.execute(
+                    f"UPDATE slot_ocupacao SET {coluna} = {coluna} + 1"
+                    " WHERE area_id = %s AND (data, turno) IN (" + tuplas + ")",
+                    [area_id] + [data_turno for aceito in aceitos for data_turno in aceito],
+                )
+                invalidate_slots(cursor, voluntario_id, [(area_id, data) for data, _ in aceitos])
+        conn.commit()
+        if aceitos:
+            events.publish("escalas_changed", slots=[(area_id, data) for data, _ in aceitos])
+        return resultados
+    except Exception as err:
+        conn.rollback()
+        logger.exception("Erro ao agendar horários: %s", err)
+        raise RepositoryError("Erro ao salvar escala.") from err
+    finally:
+        conn.close()
+
+
+def get_resumo_vagas(area_ids, meses):
+    """
+    Ocupação das áreas nos meses [(ano, mes), ...] consecutivos, numa consulta
+    só em slot_ocupacao (equipe e responsáveis vêm juntos em cada linha).
+    Retorna {area_id: (area, {(data_iso, turno): (equipe, responsaveis)})}
+    só para as áreas que existem; a área (max_pessoas, disponibilidade) vem do
+    cache de áreas.
+    """
+    areas = {}
+    for area_id in area_ids:
+        area = get_area_by_id(area_id)
+        if area:
+            areas[area["id"]] = area
+    if not areas or not meses:
+        return {}
+
+    conn = connect(readonly=True)
+    try:
+        with conn.cursor() as cursor:
+            ids = sorted(areas)
+            periodo_sql, periodo_params = date_range_predicate(
+                "data", start=month_range(*meses[0])[0], end=month_range(*meses[-1])[1]
+            )
             cursor.execute(
                 """
-                SELECT e.data, e.turno, count(e.id) as total
-                FROM escalas e
-                JOIN voluntarios v ON e.voluntario_id = v.id
-                WHERE e.area_id = %s AND e.data LIKE %s AND v.responsavel = 1
-                GROUP BY e.data, e.turno
+                SELECT area_id, data, turno, equipe, responsaveis
+                FROM slot_ocupacao
+                WHERE area_id IN (""" + ", ".join(["%s"] * len(ids)) + """)
+                  AND """ + periodo_sql + """
+                  AND (equipe > 0 OR responsaveis > 0)
                 """,
-                params,
+                ids + periodo_params,
             )
-            agrupado_responsavel = cursor.fetchall()
-            return area["max_pessoas"], agrupado, agrupado_responsavel
+            resumo = {area_id: (area, {}) for area_id, area in areas.items()}
+            for row in cursor.fetchall():
+                data = row["data"].isoformat() if hasattr(row["data"], "isoformat") else str(row["data"])
+                resumo[row["area_id"]][1][(data, row["turno"])] = (row["equipe"], row["responsaveis"])
+            return resumo
     except Exception as err:
         logger.exception("Erro ao montar resumo de vagas: %s", err)
         raise RepositoryError("Erro ao gerar resumo de vagas.") from err
@@ -106,21 +217,19 @@ def get_resumo_vagas(area_id, year, month):
 
 
 def get_dashboard_data(year, month, area_filter=None):
-    conn = connect()
+    areas = list_areas()
+    conn = connect(readonly=True)
     try:
         with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM areas")
-            areas = cursor.fetchall()
 
+            periodo_sql, params = month_predicate("e.data", year, month)
             query = """
                 SELECT e.id, v.nome as voluntario_nome, v.responsavel, e.area_id,
                        a.nome as area_nome, e.data, e.turno
                 FROM escalas e
                 JOIN voluntarios v ON e.voluntario_id = v.id
                 JOIN areas a ON e.area_id = a.id
-                WHERE e.data LIKE %s
-            """
-            params = [f"{year}-{month:02d}-%"]
+                WHERE """ + periodo_sql
 
             if area_filter:
                 query += " AND e.area_id = %s"
@@ -138,14 +247,75 @@ def get_dashboard_data(year, month, area_filter=None):
 
 
 def delete_escala(escala_id):
+    """Exclui a escala; retorna a escala excluída {"voluntario_id", "area_id", "data", "turno"} ou None."""
     conn = connect()
     try:
         with conn.cursor() as cursor:
+            cursor.execute("SELECT voluntario_id, area_id, data, turno FROM escalas WHERE id = %s", (escala_id,))
+            rows = cursor.fetchall()
+            afetados = [(row["area_id"], row["data"]) for row in rows]
+            for row in rows:
+                invalidate_slots(cursor, row["voluntario_id"], [(row["area_id"], row["data"])])
+            adjust_ocupacao(cursor, "e.id = %s", [escala_id], sign=-1)
             cursor.execute("DELETE FROM escalas WHERE id = %s", (escala_id,))
         conn.commit()
+        events.publish("escalas_changed", slots=afetados)
+        return rows[0] if rows else None
     except Exception as err:
         conn.rollback()
         logger.exception("Erro ao excluir escala: %s", err)
         raise RepositoryError("Erro ao excluir escala.") from err
     finally:
         conn.close()
+
+
+def iter_escalas_export(inicio, fim, area_id=None):
+    """
+    Escalas de [inicio, fim), opcionalmente de uma área, para exportação: dicts
+    {"area", "data", "turno", "responsavel", "voluntario", "telefone"} por
+    área, data, turno, responsáveis primeiro e nome.
+
+    Lê com cursor sem buffer (SSDictCursor), EXPORT_FETCH_ROWS linhas por vez:
+    o MySQL envia o resultado aos poucos e a memória não cresce com o período.
+    O cursor prende a conexão até o fim da leitura, por isso ela é própria
+    (connect_dedicated); se a leitura for interrompida (cliente desconectou),
+    a conexão é descartada em vez de voltar ao pool com linhas pendentes.
+    A consulta roda no primeiro next(); erros viram RepositoryError.
+    """
+    periodo_sql, periodo_params = date_range_predicate("e.data", inicio, fim)
+    params = list(periodo_params)
+    area_sql = ""
+    if area_id is not None:
+        area_sql = " AND e.area_id = %s"
+        params.append(area_id)
+
+    conn = connect_dedicated(readonly=True)
+    lido = False
+    try:
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+        cursor.execute(
+            """
+            SELECT a.nome AS area, e.data, e.turno, v.responsavel, v.nome AS voluntario, v.telefone
+            FROM escalas e
+            JOIN areas a ON a.id = e.area_id
+            JOIN voluntarios v ON v.id = e.voluntario_id
+            WHERE """ + periodo_sql + area_sql + """
+            ORDER BY a.nome ASC, e.area_id ASC, e.data ASC, e.turno ASC, v.responsavel DESC, v.nome ASC
+            """,
+            params,
+        )
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+            if not rows:
+                break
+            yield from rows
+        cursor.close()
+        lido = True
+    except Exception as err:
+        logger.exception("Erro ao exportar escalas: %s", err)
+        raise RepositoryError("Erro ao exportar escalas.") from err
+    finally:
+        if lido:
+            conn.close()
+        else:
+            getattr(conn, "invalidate", conn.close)()
@@ -0,0 +1,45 @@
+"""
+Eventos de domínio publicados pelos repositórios depois de uma escrita.
+
+publish() dentro de uma requisição só entrega o evento depois do commit da
+unidade de trabalho (e descarta se houver rollback); fora de uma requisição
+entrega na hora, já que a função de repositório acabou de fazer commit.
+Os assinantes (caches, por exemplo) rodam no mesmo processo; erros deles são
+logados e não afetam a escrita.
+
+Eventos publicados:
+- "areas_changed": área criada, alterada ou excluída; area_id (exceto na criação).
+- "escalas_changed": escalas criadas ou removidas, ou contadores refeitos;
+  slots = lista de (area_id, data) afetados, ou None se pode ter sido qualquer um.
+- "voluntarios_changed": voluntário criado, alterado, excluído ou importado.
+"""
+import logging
+from collections import defaultdict
+
+from repositories.unit_of_work import current_unit_of_work
+
+logger = logging.getLogger(__name__)
+
+_subscribers = defaultdict(list)
+
+
+def subscribe(event, handler):
+    """Registra handler(**payload) para o evento."""
+    _subscribers[event].append(handler)
+    return handler
+
+
+def publish(event, **payload):
+    uow = current_unit_of_work()
+    if uow is not None:
+        uow.after_commit(lambda: dispatch(event, **payload))
+    else:
+        dispatch(event, **payload)
+
+
+def dispatch(event, **payload):
+    for handler in list(_subscribers[event]):
+        try:
+            handler(**payload)
+        except Exception as err:
+            logger.warning("Erro no assinante %s de %s: %s", getattr(handler, "__name__", handler), event, err)
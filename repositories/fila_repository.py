@@ -0,0 +1,147 @@
+"""
+Fila durável de agendamentos (tabela fila_agendamentos).
+
+Usada quando AGENDAR_MODE=fila: /agendar grava o pedido e devolve um ticket,
+e os workers de booking_queue processam os pendentes por ordem de chegada.
+"""
+import json
+import uuid
+
+from repositories.base import connect, logger
+from repositories.errors import RepositoryError
+
+PENDENTE = "pendente"
+PROCESSANDO = "processando"
+CONCLUIDO = "concluido"
+
+
+def enqueue_booking(telefone, area_id, slots):
+    """Grava o pedido e retorna o ticket."""
+    ticket = uuid.uuid4().hex
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO fila_agendamentos (ticket, telefone, area_id, slots)
+                VALUES (%s, %s, %s, %s)
+                """,
+                (ticket, telefone, area_id, json.dumps(slots, ensure_ascii=False)),
+            )
+        conn.commit()
+        return ticket
+    except Exception as err:
+        conn.rollback()
+        logger.exception("Erro ao enfileirar agendamento: %s", err)
+        raise RepositoryError("Erro ao enfileirar agendamento.") from err
+    finally:
+        conn.close()
+
+
+def claim_bookings(limit):
+    """
+    Reserva até `limit` pedidos pendentes, os mais antigos primeiro.
+    SKIP LOCKED deixa vários workers (ou processos) dividirem a fila sem
+    esperar uns pelos outros. Retorna a lista de pedidos com `slots` já decodificado.
+    """
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, ticket, telefone, area_id, slots FROM fila_agendamentos
+                WHERE status = %s
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (PENDENTE, limit),
+            )
+            pedidos = cursor.fetchall()
+            if pedidos:
+                ids = [pedido["id"] for pedido in pedidos]
+                cursor.execute(
+                    "UPDATE fila_agendamentos SET status = %s, reservado_em = NOW() WHERE id IN ("
+                    + ", ".join(["%s"] * len(ids)) + ")",
+                    [PROCESSANDO] + ids,
+                )
+        conn.commit()
+        for pedido in pedidos:
+            pedido["slots"] = json.loads(pedido["slots"])
+        return pedidos
+    except Exception as err:
+        conn.rollback()
+        logger.exception("Erro ao reservar pedidos da fila: %s", err)
+        raise RepositoryError("Erro ao ler a fila de agendamentos.") from err
+    finally:
+        conn.close()
+
+
+def complete_bookings(resultados):
+    """Grava o resultado de vários pedidos. `resultados` é uma lista de (id, status_code, resposta)."""
+    if not resultados:
+        return
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.executemany(
+                """
+                UPDATE fila_agendamentos
+                SET status = %s, status_code = %s, resposta = %s, processado_em = NOW()
+                WHERE id = %s
+                """,
+                [(CONCLUIDO, status_code, resposta, pedido_id) for pedido_id, status_code, resposta in resultados],
+            )
+        conn.commit()
+    except Exception as err:
+        conn.rollback()
+        logger.exception("Erro ao gravar resultados da fila: %s", err)
+        raise RepositoryError("Erro ao gravar resultados da fila.") from err
+    finally:
+        conn.close()
+
+
+def requeue_stale_bookings(older_than_seconds):
+    """Devolve à fila pedidos reservados por um worker que morreu no meio do lote."""
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            devolvidos = cursor.execute(
+                """
+                UPDATE fila_agendamentos SET status = %s, reservado_em = NULL
+                WHERE status = %s AND reservado_em < NOW() - INTERVAL %s SECOND
+                """,
+                (PENDENTE, PROCESSANDO, older_than_seconds),
+            )
+        conn.commit()
+        return devolvidos
+    except Exception as err:
+        conn.rollback()
+        logger.exception("Erro ao devolver pedidos à fila: %s", err)
+        raise RepositoryError("Erro ao devolver pedidos à fila.") from err
+    finally:
+        conn.close()
+
+
+def get_booking_ticket(ticket):
+    """Retorna o pedido do ticket (com `posicao` na fila se ainda pendente) ou None."""
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, status, status_code, resposta FROM fila_agendamentos WHERE ticket = %s",
+                (ticket,),
+            )
+            pedido = cursor.fetchone()
+            if pedido and pedido["status"] == PENDENTE:
+                cursor.execute(
+                    "SELECT COUNT(*) as total FROM fila_agendamentos WHERE status = %s AND id < %s",
+                    (PENDENTE, pedido["id"]),
+                )
+                pedido["posicao"] = (cursor.fetchone() or {"total": 0})["total"] + 1
+            return pedido
+    except Exception as err:
+        logger.exception("Erro ao consultar ticket %s: %s", ticket, err)
+        raise RepositoryError("Erro ao consultar agendamento.") from err
+    finally:
+        conn.close()
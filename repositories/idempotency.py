@@ -0,0 +1,186 @@
+"""
+Chaves de idempotência para rotas de escrita (hoje só /agendar).
+
+O cliente manda o header `Idempotency-Key` (ou o campo `idempotency_key`).
+A primeira requisição com a chave roda normalmente e a resposta (status < 500)
+é gravada em `idempotencia` na mesma transação da escrita. Repetições dentro
+de IDEMPOTENCY_TTL_SECONDS recebem a resposta gravada, sem passar pela view.
+
+Requisições simultâneas com a mesma chave se serializam por um GET_LOCK na
+conexão da unidade de trabalho: a segunda espera a primeira terminar (commit
+incluído) e então encontra a resposta pronta.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+
+from repositories.base import connect
+from repositories.errors import RepositoryError
+from repositories.unit_of_work import current_unit_of_work
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+IDEMPOTENCY_LOCK_WAIT = int(os.environ.get("IDEMPOTENCY_LOCK_WAIT", 10))
+PURGE_INTERVAL_SECONDS = 60
+HEADER = "Idempotency-Key"
+FORM_FIELD = "idempotency_key"
+MAX_KEY_LENGTH = 100
+
+_last_purge = 0.0
+
+
+def request_key():
+    chave = request.headers.get(HEADER) or request.form.get(FORM_FIELD)
+    return chave.strip() if chave else None
+
+
+def fingerprint():
+    """Hash do pedido (campos do formulário, sem a própria chave)."""
+    campos = sorted(
+        (nome, valor) for nome, valores in request.form.lists() if nome != FORM_FIELD for valor in valores
+    )
+    return hashlib.sha256(json.dumps(campos, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _lock_name(rota, chave):
+    # Nomes de GET_LOCK têm no máximo 64 caracteres
+    return "idem:" + hashlib.sha1(f"{rota}:{chave}".encode("utf-8")).hexdigest()
+
+
+def acquire_lock(rota, chave):
+    """Espera até IDEMPOTENCY_LOCK_WAIT segundos pela chave; a liberação fica no close da unidade de trabalho."""
+    nome = _lock_name(rota, chave)
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (nome, IDEMPOTENCY_LOCK_WAIT))
+            locked = (cursor.fetchone() or {}).get("locked") == 1
+    except Exception as err:
+        logger.exception("Erro ao obter lock de idempotência: %s", err)
+        raise RepositoryError("Erro ao obter lock de idempotência.") from err
+    finally:
+        conn.close()
+    if locked:
+        current_unit_of_work().on_close(lambda raw: _release_lock(raw, nome))
+    return locked
+
+
+def _release_lock(raw, nome):
+    try:
+        with raw.cursor() as cursor:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (nome,))
+    except Exception as err:
+        # Uma conexão que ainda segura o lock não pode voltar ao pool
+        logger.warning("Erro ao liberar lock de idempotência, descartando conexão: %s", err)
+        invalidate = getattr(raw, "invalidate", None)
+        if invalidate:
+            invalidate()
+
+
+def get_stored_response(rota, chave):
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT fingerprint, status_code, resposta FROM idempotencia
+                WHERE rota = %s AND chave = %s AND expira_em > NOW()
+                """,
+                (rota, chave),
+            )
+            return cursor.fetchone()
+    except Exception as err:
+        logger.exception("Erro ao consultar chave de idempotência: %s", err)
+        raise RepositoryError("Erro ao consultar chave de idempotência.") from err
+    finally:
+        conn.close()
+
+
+def store_response(rota, chave, fingerprint_hash, status_code, resposta):
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            _purge_expired(cursor)
+            # Substitui uma entrada vencida que ainda não foi limpa
+            cursor.execute(
+                """
+                INSERT INTO idempotencia (rota, chave, fingerprint, status_code, resposta, expira_em)
+                VALUES (%s, %s, %s, %s, %s, NOW() + INTERVAL %s SECOND)
+                ON DUPLICATE KEY UPDATE
+                    fingerprint = VALUES(fingerprint),
+                    status_code = VALUES(status_code),
+                    resposta = VALUES(resposta),
+                    expira_em = VALUES(expira_em)
+                """,
+                (rota, chave, fingerprint_hash, status_code, resposta, IDEMPOTENCY_TTL_SECONDS),
+            )
+        conn.commit()
+    except Exception as err:
+        conn.rollback()
+        logger.exception("Erro ao gravar chave de idempotência: %s", err)
+        raise RepositoryError("Erro ao gravar chave de idempotência.") from err
+    finally:
+        conn.close()
+
+
+def _purge_expired(cursor):
+    global _last_purge
+    agora = time.monotonic()
+    if agora - _last_purge < PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = agora
+    cursor.execute("DELETE FROM idempotencia WHERE expira_em < NOW() LIMIT 500")
+
+
+def _error(message, status):
+    return jsonify({"status": "error", "message": message}), status
+
+
+def idempotent(rota):
+    """Decorator de view: aplica a chave de idempotência do pedido, se houver."""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            chave = request_key()
+            if not chave:
+                return view(*args, **kwargs)
+            if len(chave) > MAX_KEY_LENGTH:
+                return _error("Chave de idempotência inválida.", 400)
+
+            hash_pedido = fingerprint()
+            try:
+                if not acquire_lock(rota, chave):
+                    return _error("Pedido já está em processamento. Tente novamente em instantes.", 409)
+                gravada = get_stored_response(rota, chave)
+            except RepositoryError:
+                return _error("Erro interno ao processar agendamento.", 500)
+
+            if gravada:
+                if gravada["fingerprint"] != hash_pedido:
+                    return _error("Chave de idempotência já usada em outro pedido.", 422)
+                response = current_app.response_class(
+                    gravada["resposta"], status=gravada["status_code"], mimetype="application/json"
+                )
+                response.headers["Idempotent-Replayed"] = "true"
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code < 500:
+                try:
+                    store_response(
+                        rota, chave, hash_pedido, response.status_code, response.get_data(as_text=True)
+                    )
+                except RepositoryError:
+                    return _error("Erro interno ao processar agendamento.", 500)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,175 @@
+"""
+Instrumentação das consultas feitas pelos repositórios.
+
+Os cursores entregues por repositories.base.connect() passam por aqui: cada
+requisição acumula número de comandos, tempo total no banco e o comando mais
+lento, que viram um header Server-Timing. Comandos acima de SLOW_QUERY_MS vão
+para o log `pronto.slow_query` em JSON, com o SQL normalizado e sem os
+valores dos parâmetros.
+"""
+import json
+import logging
+import os
+import re
+import time
+
+from flask import g, has_app_context, has_request_context, request
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+# Tamanho máximo do SQL do comando mais lento no desc do Server-Timing
+SERVER_TIMING_SQL_CHARS = 120
+
+slow_query_logger = logging.getLogger("pronto.slow_query")
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"%s")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", re.IGNORECASE)
+_VALUES_RE = re.compile(r"(\((?:\s*\?\s*,)*\s*\?\s*\))(?:\s*,\s*\1)+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """SQL sem literais nem placeholders, para agrupar comandos iguais."""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _PLACEHOLDER_RE.sub("?", sql)
+    sql = _SPACE_RE.sub(" ", sql).strip()
+    sql = _IN_LIST_RE.sub("IN (?+)", sql)
+    return _VALUES_RE.sub(r"\1, ...", sql)
+
+
+def redact_params(params, many=False):
+    """Descreve os parâmetros (quantidade e tipos) sem expor valores."""
+    if params is None:
+        return None
+    if many:
+        params = list(params)
+        return {"rows": len(params), "types": redact_params(params[0])["types"] if params else []}
+    if isinstance(params, dict):
+        return {"count": len(params), "types": {k: type(v).__name__ for k, v in params.items()}}
+    if not isinstance(params, (list, tuple)):
+        params = (params,)
+    return {"count": len(params), "types": [type(v).__name__ for v in params]}
+
+
+def _timing_desc(sql):
+    """SQL normalizado e truncado, seguro dentro do quoted-string de um header."""
+    desc = normalize_sql(sql)
+    if len(desc) > SERVER_TIMING_SQL_CHARS:
+        desc = desc[:SERVER_TIMING_SQL_CHARS - 3] + "..."
+    desc = desc.replace("\\", "\\\\").replace('"', '\\"')
+    return desc.encode("ascii", "replace").decode("ascii")
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_sql = None
+
+    def record(self, sql, elapsed_ms):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest_sql = sql
+
+    def server_timing(self, commit_ms=None):
+        metrics = [f'db;dur={self.total_ms:.1f};desc="{self.count} queries"']
+        if self.slowest_sql is not None:
+            metrics.append(f'db-slowest;dur={self.slowest_ms:.1f};desc="{_timing_desc(self.slowest_sql)}"')
+        if commit_ms:
+            metrics.append(f"db-commit;dur={commit_ms:.1f}")
+        return ", ".join(metrics)
+
+
+def current_stats():
+    if not has_app_context():
+        return None
+    return g.get("db_stats")
+
+
+def _record(sql, params, elapsed_ms, many=False):
+    stats = current_stats()
+    if stats is not None:
+        stats.record(sql, elapsed_ms)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        entry = {
+            "event": "slow_query",
+            "ms": round(elapsed_ms, 1),
+            "sql": normalize_sql(sql),
+            "params": redact_params(params, many=many),
+        }
+        if has_request_context():
+            entry["route"] = request.endpoint
+            entry["method"] = request.method
+        slow_query_logger.warning(json.dumps(entry, ensure_ascii=False))
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        self._cursor = self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._cursor.__exit__(exc_type, exc, tb)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            _record(query, args, (time.perf_counter() - started) * 1000)
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            _record(query, args, (time.perf_counter() - started) * 1000, many=True)
+
+
+class InstrumentedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+
+def instrument(conn):
+    return InstrumentedConnection(conn)
+
+
+def init_app(app):
+    """
+    Registra as métricas por requisição. Deve ser chamado antes de
+    unit_of_work.init_app para que o header inclua o tempo do commit.
+    """
+
+    @app.before_request
+    def _begin_query_stats():
+        g.db_stats = QueryStats()
+
+    @app.after_request
+    def _server_timing(response):
+        stats = g.get("db_stats")
+        if stats is None:
+            return response
+        uow = g.get("db_uow")
+        response.headers.add("Server-Timing", stats.server_timing(getattr(uow, "commit_ms", None)))
+        return response
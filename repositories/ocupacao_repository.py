@@ -0,0 +1,148 @@
+"""
+Contadores de ocupação por horário (tabela slot_ocupacao).
+
+Cada linha (area_id, data, turno) guarda quantos voluntários da equipe e
+quantos responsáveis estão escalados. Toda escrita em escalas atualiza os
+contadores na mesma transação, pelas funções que recebem `cursor` abaixo; as
+checagens de vaga passam a ser leituras pela chave primária. A linha do
+contador também é a trava do agendamento (ver lock_slots).
+"""
+from repositories import events
+from repositories.base import connect, logger
+from repositories.errors import RepositoryError
+
+# Mesma regra das consultas antigas: responsavel NULL conta como equipe
+_EQUIPE_SQL = "SUM(v.responsavel = 0 OR v.responsavel IS NULL)"
+_RESPONSAVEIS_SQL = "SUM(v.responsavel = 1)"
+
+
+def adjust_ocupacao(cursor, where_sql, params, sign=1):
+    """
+    Soma (sign=1) ou subtrai (sign=-1) dos contadores as escalas `e` que
+    satisfazem `where_sql`. Para subtrair, chame antes do DELETE das escalas.
+    """
+    cursor.execute(
+        f"""
+        INSERT INTO slot_ocupacao (area_id, data, turno, equipe, responsaveis)
+        SELECT e.area_id, e.data, e.turno, %s * {_EQUIPE_SQL}, %s * {_RESPONSAVEIS_SQL}
+        FROM escalas e
+        JOIN voluntarios v ON e.voluntario_id = v.id
+        WHERE {where_sql}
+        GROUP BY e.area_id, e.data, e.turno
+        ON DUPLICATE KEY UPDATE
+            equipe = equipe + VALUES(equipe),
+            responsaveis = responsaveis + VALUES(responsaveis)
+        """,
+        [sign, sign] + list(params),
+    )
+
+
+def lock_slots(cursor, area_id, slots):
+    """
+    Cria (se preciso) e trava com FOR UPDATE as linhas de contador dos
+    horários pedidos, sempre em ordem (data, turno) para evitar deadlock entre
+    agendamentos concorrentes. Retorna None se a área não existir; senão
+    (max_pessoas, {(data, turno): equipe}).
+    """
+    pedidos = sorted(set(slots))
+    derivada = " UNION ALL ".join(["SELECT %s AS data, %s AS turno"] * len(pedidos))
+    params = []
+    for data, turno in pedidos:
+        params.extend([data, turno])
+    cursor.execute(
+        """
+        INSERT IGNORE INTO slot_ocupacao (area_id, data, turno)
+        SELECT a.id, s.data, s.turno
+        FROM areas a
+        JOIN (""" + derivada + """) s
+        WHERE a.id = %s
+        ORDER BY s.data, s.turno
+        """,
+        params + [area_id],
+    )
+
+    tuplas = ", ".join(["(%s, %s)"] * len(pedidos))
+    cursor.execute(
+        """
+        SELECT a.max_pessoas, s.data, s.turno, s.equipe
+        FROM slot_ocupacao s
+        JOIN areas a ON a.id = s.area_id
+        WHERE s.area_id = %s AND (s.data, s.turno) IN (""" + tuplas + """)
+        ORDER BY s.data, s.turno
+        FOR UPDATE OF s
+        """,
+        [area_id] + params,
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    return rows[0]["max_pessoas"], {(str(row["data"]), row["turno"]): row["equipe"] for row in rows}
+
+
+_RECOUNT_SQL = f"""
+    SELECT e.area_id, e.data, e.turno,
+           {_EQUIPE_SQL} as equipe, {_RESPONSAVEIS_SQL} as responsaveis
+    FROM escalas e
+    JOIN voluntarios v ON e.voluntario_id = v.id
+    WHERE e.area_id IS NOT NULL AND e.data IS NOT NULL AND e.turno IS NOT NULL
+    GROUP BY e.area_id, e.data, e.turno
+"""
+
+
+def rebuild_ocupacao():
+    """Recalcula todos os contadores a partir de escalas. Retorna o número de horários."""
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            # Trava escalas para que nenhum agendamento aconteça entre o DELETE e o INSERT
+            cursor.execute("SELECT COUNT(*) as total FROM escalas FOR UPDATE")
+            cursor.execute("DELETE FROM slot_ocupacao")
+            total = cursor.execute(
+                "INSERT INTO slot_ocupacao (area_id, data, turno, equipe, responsaveis) " + _RECOUNT_SQL
+            )
+        conn.commit()
+        events.publish("escalas_changed", slots=None)
+        return total
+    except Exception as err:
+        conn.rollback()
+        logger.exception("Erro ao recalcular ocupação: %s", err)
+        raise RepositoryError("Erro ao recalcular ocupação.") from err
+    finally:
+        conn.close()
+
+
+def verify_ocupacao():
+    """
+    Compara os contadores com a contagem real em escalas.
+    Retorna a lista de divergências: dicts com area_id, data, turno e os
+    valores esperado/gravado de equipe e responsaveis.
+    """
+    # Sempre no primário: numa réplica atrasada toda escala recente pareceria divergente
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(_RECOUNT_SQL)
+            esperado = {(r["area_id"], str(r["data"]), r["turno"]): r for r in cursor.fetchall()}
+            cursor.execute("SELECT area_id, data, turno, equipe, responsaveis FROM slot_ocupacao")
+            gravado = {(r["area_id"], str(r["data"]), r["turno"]): r for r in cursor.fetchall()}
+    except Exception as err:
+        logger.exception("Erro ao verificar ocupação: %s", err)
+        raise RepositoryError("Erro ao verificar ocupação.") from err
+    finally:
+        conn.close()
+
+    vazio = {"equipe": 0, "responsaveis": 0}
+    divergencias = []
+    for chave in sorted(set(esperado) | set(gravado), key=str):
+        real = esperado.get(chave, vazio)
+        contador = gravado.get(chave, vazio)
+        if (int(real["equipe"]), int(real["responsaveis"])) != (contador["equipe"], contador["responsaveis"]):
+            area_id, data, turno = chave
+            divergencias.append({
+                "area_id": area_id,
+                "data": data,
+                "turno": turno,
+                "equipe": (int(real["equipe"]), contador["equipe"]),
+                "responsaveis": (int(real["responsaveis"]), contador["responsaveis"]),
+            })
+    return divergencias
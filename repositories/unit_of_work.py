@@ -0,0 +1,235 @@
+import logging
+import os
+import time
+
+from flask import g, has_app_context, request, session
+
+import database
+from repositories.errors import RepositoryError
+
+logger = logging.getLogger(__name__)
+
+# Depois de uma escrita, a sessão lê do primário por esta janela (atraso de replicação)
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("DB_READ_YOUR_WRITES_SECONDS", 5))
+PIN_SESSION_KEY = "_db_primary_until"
+
+
+class UnitOfWork:
+    """
+    Uma conexão e uma transação por requisição.
+
+    A conexão só é obtida do pool quando o primeiro repositório precisa dela.
+    commit()/rollback()/close() chamados pelos repositórios são absorvidos:
+    o commit acontece uma única vez no fim da requisição e qualquer rollback
+    de um participante marca a transação inteira para rollback.
+
+    Com réplicas configuradas, leituras vão para uma conexão de réplica até a
+    requisição abrir a conexão do primário (ou a sessão estar fixada nele);
+    a partir daí tudo usa o primário.
+    """
+
+    def __init__(self, connection_factory=None, pinned=False):
+        self._factory = connection_factory or database.get_db_connection
+        self._conn = None
+        self._replica = None
+        self.pinned = pinned
+        self.rollback_only = False
+        self.writes = 0
+        self.connections = 0
+        self.statements = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.commit_ms = 0.0
+        self._close_callbacks = []
+        self._commit_callbacks = []
+
+    @property
+    def active(self):
+        return self._conn is not None or self._replica is not None
+
+    @property
+    def round_trips(self):
+        return self.statements + self.commits + self.rollbacks
+
+    def connection(self, readonly=False):
+        if readonly and self._conn is None and not self.pinned and database.has_replicas():
+            if self._replica is None:
+                self._replica = self._open(readonly=True)
+            return _ParticipantConnection(self, self._replica)
+
+        if self._conn is None:
+            self._conn = self._open(readonly=False)
+        return _ParticipantConnection(self, self._conn)
+
+    def _open(self, readonly):
+        conn = self._factory(readonly=readonly)
+        if conn is None:
+            raise RepositoryError("Erro ao conectar ao banco de dados.")
+        self.connections += 1
+        return conn
+
+    def after_commit(self, callback):
+        """Agenda callback() para depois do commit da transação; descartado se houver rollback."""
+        self._commit_callbacks.append(callback)
+
+    def commit(self):
+        if self._conn is None:
+            return
+        if self.rollback_only:
+            self.rollback()
+            return
+        started = time.perf_counter()
+        self._conn.commit()
+        self.commit_ms += (time.perf_counter() - started) * 1000
+        self.commits += 1
+        callbacks, self._commit_callbacks = self._commit_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as err:
+                logger.warning("Erro em callback pós-commit: %s", err)
+
+    def rollback(self):
+        self._commit_callbacks = []
+        if self._conn is None:
+            return
+        try:
+            self._conn.rollback()
+            self.rollbacks += 1
+        except Exception as err:
+            logger.warning("Erro no rollback da unidade de trabalho: %s", err)
+
+    def on_close(self, callback):
+        """
+        Registra callback(conexão do primário), chamado no close() depois do
+        commit/rollback e antes de a conexão voltar ao pool. Serve para liberar
+        estado de sessão do MySQL (ex.: GET_LOCK) que o rollback não desfaz.
+        """
+        self._close_callbacks.append(callback)
+
+    def close(self):
+        replica, self._replica = self._replica, None
+        conn, self._conn = self._conn, None
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        if conn is not None:
+            for callback in callbacks:
+                try:
+                    callback(conn)
+                except Exception as err:
+                    logger.warning("Erro ao fechar unidade de trabalho: %s", err)
+        try:
+            if replica is not None:
+                replica.close()
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+class _ParticipantConnection:
+    """Visão da conexão compartilhada entregue a cada função de repositório."""
+
+    def __init__(self, uow, conn):
+        self._uow = uow
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._uow, self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        # Adiado para o fim da requisição
+        self._uow.writes += 1
+
+    def rollback(self):
+        self._uow.rollback_only = True
+        self._uow.rollback()
+
+    def close(self):
+        # A conexão pertence à unidade de trabalho
+        pass
+
+
+class _CountingCursor:
+    def __init__(self, uow, cursor):
+        self._uow = uow
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        self._cursor = self._cursor.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._cursor.__exit__(exc_type, exc, tb)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query, args=None):
+        self._uow.statements += 1
+        return self._cursor.execute(query, args)
+
+    def executemany(self, query, args):
+        self._uow.statements += 1
+        return self._cursor.executemany(query, args)
+
+
+def current_unit_of_work():
+    if not has_app_context():
+        return None
+    return g.get("db_uow")
+
+
+def init_app(app):
+    """Registra a unidade de trabalho por requisição no app Flask."""
+
+    @app.before_request
+    def _begin_unit_of_work():
+        pinned = False
+        if database.has_replicas():
+            pinned = session.get(PIN_SESSION_KEY, 0) > time.time()
+        g.db_uow = UnitOfWork(pinned=pinned)
+
+    @app.after_request
+    def _commit_unit_of_work(response):
+        uow = g.get("db_uow")
+        if uow is None or not uow.active:
+            return response
+        if response.status_code >= 500:
+            # Inclui exceções não tratadas, que o Flask converte em 500 antes daqui
+            uow.rollback()
+            return response
+        try:
+            uow.commit()
+        except Exception as err:
+            logger.exception("Erro no commit da requisição %s: %s", request.path, err)
+            uow.rollback()
+            return app.make_response(("Erro ao salvar alterações no banco de dados.", 500))
+        if uow.writes and database.has_replicas():
+            # read-your-writes: as próximas requisições desta sessão leem do primário
+            session[PIN_SESSION_KEY] = time.time() + READ_YOUR_WRITES_SECONDS
+        return response
+
+    @app.teardown_request
+    def _end_unit_of_work(exc):
+        uow = g.pop("db_uow", None)
+        if uow is None or not uow.active:
+            return
+        if exc is not None:
+            uow.rollback()
+        try:
+            uow.close()
+        finally:
+            logger.debug(
+                "%s %s: %d conexão(ões), %d comando(s), %d commit(s), %d rollback(s)",
+                request.method,
+                request.path,
+                uow.connections,
+                uow.statements,
+                uow.commits,
+                uow.rollbacks,
+            )
@@ -0,0 +1,201 @@
+"""
+Diretório de voluntários em memória: telefone -> (id, nome, responsável,
+bitset das áreas). Atende a busca por telefone e a checagem de habilitação
+de /agendar e /api/voluntario/areas sem ir ao banco.
+
+Quem escreve em voluntários reserva com next_version() a próxima versão de
+cache_versions 'voluntarios' e a grava em voluntarios.versao (ou em
+voluntarios_removidos, na exclusão), na mesma transação, e publica
+"voluntarios_changed" depois do commit. A reserva trava a linha do contador
+até o commit, então as versões ficam visíveis na ordem em que foram dadas e
+cada worker só busca o que passou da versão que já tem.
+
+A versão é conferida no máximo a cada CACHE_CHECK_SECONDS (logo na leitura
+seguinte, depois de uma escrita no próprio processo) e a carga completa é
+refeita a cada CACHE_TTL_SECONDS. Telefone não encontrado ou área não
+habilitada conferem a versão na hora antes da resposta negativa, então um
+cadastro recém-feito em outro worker já vale. Áreas excluídas continuam no
+bitset até a próxima alteração do voluntário; quem lista as áreas cruza com o
+catálogo.
+"""
+import threading
+import time
+from typing import NamedTuple
+
+from repositories import events
+from repositories.base import connect, logger
+from repositories.cache import CACHE_CHECK_SECONDS, CACHE_TTL_SECONDS, read_version
+from repositories.errors import RepositoryError
+
+NOME = "voluntarios"
+
+# Voluntários removidos há mais tempo que isso já saíram de todos os diretórios pela carga completa
+REMOVIDOS_RETENCAO = "1 DAY"
+
+
+class Voluntario(NamedTuple):
+    id: int
+    nome: str
+    telefone: str
+    responsavel: int
+    areas: int  # bit area_id ligado para cada área habilitada
+
+    def has_area(self, area_id):
+        return area_id >= 0 and bool(self.areas >> area_id & 1)
+
+    def as_dict(self):
+        return {"id": self.id, "nome": self.nome, "telefone": self.telefone, "responsavel": self.responsavel}
+
+
+def _area_bits(area_ids):
+    """GROUP_CONCAT de ids ("1,3") -> bitset."""
+    if isinstance(area_ids, bytes):
+        area_ids = area_ids.decode()
+    bits = 0
+    for parte in (area_ids or "").split(","):
+        if parte.strip().isdigit():
+            bits |= 1 << int(parte)
+    return bits
+
+
+def next_version(cursor):
+    """Reserva a próxima versão dos voluntários na transação do chamador (um comando)."""
+    cursor.execute(
+        "UPDATE cache_versions SET versao = LAST_INSERT_ID(versao + 1) WHERE nome = %s",
+        (NOME,),
+    )
+    return cursor.lastrowid
+
+
+def record_removal(cursor, voluntario_id, versao):
+    cursor.execute(
+        """
+        INSERT INTO voluntarios_removidos (voluntario_id, versao) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE versao = VALUES(versao), removido_em = CURRENT_TIMESTAMP
+        """,
+        (voluntario_id, versao),
+    )
+    cursor.execute(
+        "DELETE FROM voluntarios_removidos WHERE removido_em < NOW() - INTERVAL " + REMOVIDOS_RETENCAO
+    )
+
+
+class VoluntariosDirectory:
+    def __init__(self, ttl=None, check_interval=None, clock=time.monotonic):
+        self.ttl = CACHE_TTL_SECONDS if ttl is None else ttl
+        self.check_interval = CACHE_CHECK_SECONDS if check_interval is None else check_interval
+        self._clock = clock
+        # Segurado durante a consulta: threads que chegam juntas esperam a mesma carga
+        self._lock = threading.Lock()
+        self._by_phone = {}
+        self._phones = {}
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def __len__(self):
+        return len(self._by_phone)
+
+    def get(self, telefone):
+        consultou = self.refresh()
+        voluntario = self._by_phone.get(telefone)
+        if voluntario is None and not consultou:
+            # Pode ter acabado de ser cadastrado por outro worker
+            self.refresh(force=True)
+            voluntario = self._by_phone.get(telefone)
+        return voluntario
+
+    def get_by_id(self, voluntario_id):
+        return self._by_phone.get(self._phones.get(voluntario_id))
+
+    def has_area(self, voluntario_id, area_id):
+        consultou = self.refresh()
+        voluntario = self.get_by_id(voluntario_id)
+        if (voluntario is None or not voluntario.has_area(area_id)) and not consultou:
+            self.refresh(force=True)
+            voluntario = self.get_by_id(voluntario_id)
+        return voluntario is not None and voluntario.has_area(area_id)
+
+    def refresh(self, force=False):
+        """Confere a versão no banco se venceu o intervalo (ou force=True). Retorna True se consultou."""
+        with self._lock:
+            now = self._clock()
+            if not force and self._version is not None and now - self._checked_at < self.check_interval:
+                return False
+            self._sync(now)
+        return True
+
+    def invalidate(self, **_):
+        """Faz a próxima leitura conferir a versão no banco (e buscar só o que mudou)."""
+        with self._lock:
+            self._checked_at = float("-inf")
+
+    def clear(self):
+        with self._lock:
+            self._by_phone, self._phones = {}, {}
+            self._version = None
+
+    def _sync(self, now):
+        completa = self._version is None or now - self._loaded_at >= self.ttl
+        conn = connect()
+        try:
+            with conn.cursor() as cursor:
+                current = read_version(cursor, NOME)
+                if not completa and current == self._version:
+                    self._checked_at = now
+                    return
+                query = """
+                    SELECT v.id, v.nome, v.telefone, v.responsavel,
+                           GROUP_CONCAT(va.area_id) AS area_ids
+                    FROM voluntarios v
+                    LEFT JOIN voluntario_areas va ON va.voluntario_id = v.id
+                """
+                params = ()
+                if not completa:
+                    query += " WHERE v.versao > %s"
+                    params = (self._version,)
+                cursor.execute(query + " GROUP BY v.id", params)
+                rows = cursor.fetchall()
+                removidos = []
+                if not completa:
+                    cursor.execute(
+                        "SELECT voluntario_id FROM voluntarios_removidos WHERE versao > %s",
+                        (self._version,),
+                    )
+                    removidos = [row["voluntario_id"] for row in cursor.fetchall()]
+        except Exception as err:
+            logger.exception("Erro ao carregar diretório de voluntários: %s", err)
+            raise RepositoryError("Erro ao buscar voluntário.") from err
+        finally:
+            conn.close()
+
+        # A carga completa monta dicionários novos e troca de uma vez; a incremental
+        # altera no lugar (quem não achar um telefone no meio disso espera a trava)
+        by_phone, phones = ({}, {}) if completa else (self._by_phone, self._phones)
+        for voluntario_id in removidos:
+            _forget(by_phone, phones, voluntario_id)
+        for row in rows:
+            _forget(by_phone, phones, row["id"])
+            voluntario = Voluntario(
+                row["id"], row["nome"], row["telefone"], row["responsavel"] or 0, _area_bits(row["area_ids"])
+            )
+            by_phone[voluntario.telefone] = voluntario
+            phones[voluntario.id] = voluntario.telefone
+        if completa:
+            self._by_phone, self._phones = by_phone, phones
+            self._loaded_at = now
+        # Linhas gravadas depois da leitura da versão podem ter vindo junto; buscá-las de novo não faz mal
+        self._version = current
+        self._checked_at = now
+
+
+def _forget(by_phone, phones, voluntario_id):
+    telefone = phones.pop(voluntario_id, None)
+    # O telefone pode já ser de outro voluntário (trocas aplicadas no mesmo lote)
+    atual = by_phone.get(telefone)
+    if atual is not None and atual.id == voluntario_id:
+        del by_phone[telefone]
+
+
+directory = VoluntariosDirectory()
+events.subscribe("voluntarios_changed", directory.invalidate)
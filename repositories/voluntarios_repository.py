@@ -1,24 +1,22 @@
 import pymysql
 
-from repositories.base import connect, logger
+from repositories import events
+from repositories.areas_repository import list_areas
+from repositories.base import connect, date_range_predicate, logger
+from repositories.dashboard_repository import invalidate_areas, invalidate_voluntario, nao_escalados
 from repositories.errors import DuplicatePhoneError, RepositoryError
+from repositories.ocupacao_repository import adjust_ocupacao
+from repositories.voluntarios_directory import directory, next_version, record_removal
 
 
 def get_voluntario_by_phone(telefone):
-    conn = connect()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT * FROM voluntarios WHERE telefone = %s", (telefone,))
-            return cursor.fetchone()
-    except Exception as err:
-        logger.exception("Erro ao buscar voluntário por telefone: %s", err)
-        raise RepositoryError("Erro ao buscar voluntário.") from err
-    finally:
-        conn.close()
+    """id, nome, telefone e responsavel do voluntário, pelo diretório em memória."""
+    voluntario = directory.get(telefone)
+    return voluntario.as_dict() if voluntario else None
 
 
 def get_voluntario_by_id(voluntario_id):
-    conn = connect()
+    conn = connect(readonly=True)
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT * FROM voluntarios WHERE id = %s", (voluntario_id,))
@@ -31,50 +29,24 @@ def get_voluntario_by_id(voluntario_id):
 
 
 def voluntario_has_area(voluntario_id, area_id):
-    conn = connect()
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT 1 FROM voluntario_areas WHERE voluntario_id = %s AND area_id = %s",
-                (voluntario_id, area_id),
-            )
-            return cursor.fetchone() is not None
-    except Exception as err:
-        logger.exception("Erro ao validar área do voluntário: %s", err)
-        raise RepositoryError("Erro ao validar área do voluntário.") from err
-    finally:
-        conn.close()
+        area_id = int(area_id)
+    except (TypeError, ValueError):
+        return False
+    return directory.has_area(voluntario_id, area_id)
 
 
 def get_voluntario_with_areas_by_phone(telefone):
-    conn = connect()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("SELECT id, nome FROM voluntarios WHERE telefone = %s", (telefone,))
-            voluntario = cursor.fetchone()
-            if not voluntario:
-                return None, []
-
-            cursor.execute(
-                """
-                SELECT a.id, a.nome
-                FROM areas a
-                JOIN voluntario_areas va ON a.id = va.area_id
-                WHERE va.voluntario_id = %s
-                """,
-                (voluntario["id"],),
-            )
-            areas = cursor.fetchall()
-            return voluntario, areas
-    except Exception as err:
-        logger.exception("Erro ao buscar áreas do voluntário: %s", err)
-        raise RepositoryError("Erro ao buscar áreas do voluntário.") from err
-    finally:
-        conn.close()
+    voluntario = directory.get(telefone)
+    if not voluntario:
+        return None, []
+    # O catálogo descarta áreas já excluídas que ainda estejam no bitset
+    areas = [{"id": area["id"], "nome": area["nome"]} for area in list_areas() if voluntario.has_area(area["id"])]
+    return {"id": voluntario.id, "nome": voluntario.nome}, areas
 
 
 def list_voluntarios_with_areas(area_id=None, search_query=None, limit=30, offset=0):
-    conn = connect()
+    conn = connect(readonly=True)
     try:
         with conn.cursor() as cursor:
             # 1. Base conditions
@@ -122,10 +94,7 @@ def list_voluntarios_with_areas(area_id=None, search_query=None, limit=30, offse
             cursor.execute(query, tuple(query_params))
             voluntarios = cursor.fetchall()
 
-            cursor.execute("SELECT * FROM areas ORDER BY nome ASC")
-            areas = cursor.fetchall()
-            
-            return voluntarios, areas, total_count
+            return voluntarios, list_areas(by_name=True), total_count
     except Exception as err:
         logger.exception("Erro ao listar voluntários: %s", err)
         raise RepositoryError("Erro ao listar voluntários.") from err
@@ -137,9 +106,10 @@ def create_voluntario(nome, telefone, responsavel, areas_selecionadas):
     conn = connect()
     try:
         with conn.cursor() as cursor:
+            versao = next_version(cursor)
             cursor.execute(
-                "INSERT INTO voluntarios (nome, telefone, responsavel) VALUES (%s, %s, %s)",
-                (nome, telefone, responsavel),
+                "INSERT INTO voluntarios (nome, telefone, responsavel, versao) VALUES (%s, %s, %s, %s)",
+                (nome, telefone, responsavel, versao),
             )
             voluntario_id = cursor.lastrowid
 
@@ -148,7 +118,9 @@ def create_voluntario(nome, telefone, responsavel, areas_selecionadas):
                     "INSERT INTO voluntario_areas (voluntario_id, area_id) VALUES (%s, %s)",
                     (voluntario_id, int(area_id)),
                 )
+            invalidate_areas(cursor, areas_selecionadas)
         conn.commit()
+        events.publish("voluntarios_changed")
     except pymysql.IntegrityError as err:
         conn.rollback()
         logger.warning("Telefone duplicado ao criar voluntário: %s", err)
@@ -161,14 +133,99 @@ def create_voluntario(nome, telefone, responsavel, areas_selecionadas):
         conn.close()
 
 
+def get_existing_phones(telefones):
+    """Retorna o subconjunto de `telefones` que já está cadastrado (uma consulta)."""
+    telefones = list(dict.fromkeys(telefones))
+    if not telefones:
+        return set()
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            placeholders = ", ".join(["%s"] * len(telefones))
+            cursor.execute(
+                "SELECT telefone FROM voluntarios WHERE telefone IN (" + placeholders + ")",
+                tuple(telefones),
+            )
+            return {row["telefone"] for row in cursor.fetchall()}
+    except Exception as err:
+        logger.exception("Erro ao buscar telefones cadastrados: %s", err)
+        raise RepositoryError("Erro ao buscar voluntários.") from err
+    finally:
+        conn.close()
+
+
+def create_voluntarios(voluntarios):
+    """
+    Cadastra vários voluntários de uma vez: a versão do lote, um INSERT
+    multi-linha para os voluntários, uma consulta para recuperar os ids pelo
+    telefone e um INSERT multi-linha para as áreas, independente da quantidade.
+    `voluntarios` é uma lista de (nome, telefone, responsavel, areas_selecionadas).
+    """
+    if not voluntarios:
+        return 0
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            versao = next_version(cursor)
+            cursor.executemany(
+                "INSERT INTO voluntarios (nome, telefone, responsavel, versao) VALUES (%s, %s, %s, %s)",
+                [(nome, telefone, responsavel, versao) for nome, telefone, responsavel, _ in voluntarios],
+            )
+
+            telefones = [telefone for _, telefone, _, _ in voluntarios]
+            placeholders = ", ".join(["%s"] * len(telefones))
+            cursor.execute(
+                "SELECT id, telefone FROM voluntarios WHERE telefone IN (" + placeholders + ")",
+                tuple(telefones),
+            )
+            ids = {row["telefone"]: row["id"] for row in cursor.fetchall()}
+
+            areas_rows = [
+                (ids[telefone], int(area_id))
+                for _, telefone, _, areas_selecionadas in voluntarios
+                for area_id in dict.fromkeys(areas_selecionadas)
+            ]
+            if areas_rows:
+                cursor.executemany(
+                    "INSERT INTO voluntario_areas (voluntario_id, area_id) VALUES (%s, %s)",
+                    areas_rows,
+                )
+                invalidate_areas(cursor, [area_id for _, area_id in areas_rows])
+        conn.commit()
+        events.publish("voluntarios_changed")
+        return len(voluntarios)
+    except pymysql.IntegrityError as err:
+        conn.rollback()
+        logger.warning("Telefone duplicado ao importar voluntários: %s", err)
+        raise DuplicatePhoneError("Telefone já cadastrado.") from err
+    except Exception as err:
+        conn.rollback()
+        logger.exception("Erro ao importar voluntários: %s", err)
+        raise RepositoryError("Erro ao cadastrar voluntários.") from err
+    finally:
+        conn.close()
+
+
+def _slots_do_voluntario(cursor, voluntario_id):
+    """(area_id, data) das escalas do voluntário, para avisar quem guarda resumos por mês."""
+    cursor.execute("SELECT DISTINCT area_id, data FROM escalas WHERE voluntario_id = %s", (voluntario_id,))
+    return [(row["area_id"], row["data"]) for row in cursor.fetchall()]
+
+
 def delete_voluntario(voluntario_id):
     conn = connect()
     try:
         with conn.cursor() as cursor:
+            afetados = _slots_do_voluntario(cursor, voluntario_id)
+            invalidate_voluntario(cursor, voluntario_id)
+            adjust_ocupacao(cursor, "e.voluntario_id = %s", [voluntario_id], sign=-1)
             cursor.execute("DELETE FROM escalas WHERE voluntario_id = %s", (voluntario_id,))
             cursor.execute("DELETE FROM voluntario_areas WHERE voluntario_id = %s", (voluntario_id,))
             cursor.execute("DELETE FROM voluntarios WHERE id = %s", (voluntario_id,))
+            record_removal(cursor, voluntario_id, next_version(cursor))
         conn.commit()
+        events.publish("escalas_changed", slots=afetados)
+        events.publish("voluntarios_changed")
     except Exception as err:
         conn.rollback()
         logger.exception("Erro ao excluir voluntário: %s", err)
@@ -178,7 +235,7 @@ def delete_voluntario(voluntario_id):
 
 
 def get_voluntario_area_ids(voluntario_id):
-    conn = connect()
+    conn = connect(readonly=True)
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT area_id FROM voluntario_areas WHERE voluntario_id = %s", (voluntario_id,))
@@ -195,10 +252,21 @@ def update_voluntario(voluntario_id, nome, telefone, responsavel, areas_selecion
     conn = connect()
     try:
         with conn.cursor() as cursor:
+            cursor.execute("SELECT responsavel FROM voluntarios WHERE id = %s FOR UPDATE", (voluntario_id,))
+            atual = cursor.fetchone()
+            # Mudou o papel: as escalas dele trocam de contador em slot_ocupacao
+            muda_papel = atual is not None and (atual["responsavel"] == 1) != (int(responsavel or 0) == 1)
+            invalidate_voluntario(cursor, voluntario_id, areas_selecionadas)
+            afetados = []
+            if muda_papel:
+                afetados = _slots_do_voluntario(cursor, voluntario_id)
+                adjust_ocupacao(cursor, "e.voluntario_id = %s", [voluntario_id], sign=-1)
             cursor.execute(
-                "UPDATE voluntarios SET nome = %s, telefone = %s, responsavel = %s WHERE id = %s",
-                (nome, telefone, responsavel, voluntario_id),
+                "UPDATE voluntarios SET nome = %s, telefone = %s, responsavel = %s, versao = %s WHERE id = %s",
+                (nome, telefone, responsavel, next_version(cursor), voluntario_id),
             )
+            if muda_papel:
+                adjust_ocupacao(cursor, "e.voluntario_id = %s", [voluntario_id])
             cursor.execute("DELETE FROM voluntario_areas WHERE voluntario_id = %s", (voluntario_id,))
 
             for area_id in areas_selecionadas:
@@ -207,6 +275,9 @@ def update_voluntario(voluntario_id, nome, telefone, responsavel, areas_selecion
                     (voluntario_id, int(area_id)),
                 )
         conn.commit()
+        if afetados:
+            events.publish("escalas_changed", slots=afetados)
+        events.publish("voluntarios_changed")
     except pymysql.IntegrityError as err:
         conn.rollback()
         logger.warning("Telefone duplicado ao atualizar voluntário: %s", err)
@@ -220,19 +291,20 @@ def update_voluntario(voluntario_id, nome, telefone, responsavel, areas_selecion
 
 
 def count_inativos(data_limite_iso, nome_filter=None, area_id=None):
-    conn = connect()
+    conn = connect(readonly=True)
     try:
         with conn.cursor() as cursor:
+            periodo_sql, periodo_params = date_range_predicate("data", start=data_limite_iso)
             query = """
                 SELECT COUNT(*) as total
                 FROM voluntarios v
                 WHERE v.id NOT IN (
                     SELECT DISTINCT voluntario_id
                     FROM escalas
-                    WHERE data >= %s
+                    WHERE """ + periodo_sql + """
                 )
             """
-            params = [data_limite_iso]
+            params = list(periodo_params)
 
             if nome_filter:
                 query += " AND v.nome LIKE %s"
@@ -259,9 +331,10 @@ def count_inativos(data_limite_iso, nome_filter=None, area_id=None):
 
 
 def list_inativos(data_limite_iso, nome_filter=None, area_id=None, limit=None, offset=0):
-    conn = connect()
+    conn = connect(readonly=True)
     try:
         with conn.cursor() as cursor:
+            periodo_sql, periodo_params = date_range_predicate("data", start=data_limite_iso)
             query = """
                 SELECT v.id, v.nome, v.telefone, v.responsavel,
                        GROUP_CONCAT(DISTINCT a.nome ORDER BY a.nome SEPARATOR ', ') as areas_nomes,
@@ -272,10 +345,10 @@ def list_inativos(data_limite_iso, nome_filter=None, area_id=None, limit=None, o
                 WHERE v.id NOT IN (
                     SELECT DISTINCT voluntario_id
                     FROM escalas
-                    WHERE data >= %s
+                    WHERE """ + periodo_sql + """
                 )
             """
-            params = [data_limite_iso]
+            params = list(periodo_params)
 
             if nome_filter:
                 query += " AND v.nome LIKE %s"
@@ -309,7 +382,7 @@ def list_inativos(data_limite_iso, nome_filter=None, area_id=None, limit=None, o
 
 
 def search_voluntarios(query, area_id=None, is_responsavel=None):
-    conn = connect()
+    conn = connect(readonly=True)
     try:
         with conn.cursor() as cursor:
             search_pattern = f"%{query}%"
@@ -349,24 +422,10 @@ def search_voluntarios(query, area_id=None, is_responsavel=None):
 
 
 def get_voluntarios_nao_escalados(ano, mes, area_id):
-    conn = connect()
+    conn = connect(readonly=True)
     try:
         with conn.cursor() as cursor:
-            query = """
-                SELECT v.id, v.nome, v.telefone
-                FROM voluntarios v
-                JOIN voluntario_areas va ON v.id = va.voluntario_id
-                WHERE va.area_id = %s
-                  AND v.id NOT IN (
-                      SELECT voluntario_id 
-                      FROM escalas 
-                      WHERE data LIKE %s
-                  )
-                ORDER BY v.nome ASC
-            """
-            params = (area_id, f"{ano}-{mes:02d}-%")
-            cursor.execute(query, params)
-            return cursor.fetchall()
+            return nao_escalados(cursor, area_id, ano, mes)
     except Exception as err:
         logger.exception("Erro ao buscar voluntários não escalados: %s", err)
         raise RepositoryError("Erro ao buscar voluntários não escalados.") from err
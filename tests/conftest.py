@@ -1,17 +1,33 @@
 import pytest
 from unittest.mock import patch
 
-# Mock init_db before importing app to avoid DB connection errors at import time
-with patch("database.init_db"):
-    from app import app as flask_app
+from app import app as flask_app
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    # Caches de processo não podem vazar dados de um teste para o outro
+    from repositories import cache_backends
+    from repositories.areas_repository import area_cache
+    from repositories.voluntarios_directory import directory
+
+    area_cache.invalidate()
+    directory.clear()
+    cache_backends.use_backend(cache_backends.LocalBackend())
+    yield
+    area_cache.invalidate()
+    directory.clear()
+    cache_backends.use_backend(None)
 
 @pytest.fixture
 def app():
     flask_app.config.update({
         "TESTING": True,
-        "SECRET_KEY": "test_secret_key"
+        "SECRET_KEY": "test_secret_key",
+        "RATE_LIMIT_ENABLED": False,
     })
-    return flask_app
+    # The schema check would open a real DB connection on the first request
+    with patch("migrations.verify_once"):
+        yield flask_app
 
 @pytest.fixture
 def client(app):
@@ -20,3 +36,11 @@ def client(app):
 @pytest.fixture
 def runner(app):
     return app.test_cli_runner()
+
+@pytest.fixture
+def db_standin():
+    from query_budget import DatabaseStandIn
+
+    standin = DatabaseStandIn()
+    with standin.installed():
+        yield standin
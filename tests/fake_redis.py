@@ -0,0 +1,89 @@
+"""
+Servidor falso do protocolo do Redis, para testar RedisBackend sem Redis.
+
+Implementa só o que o backend usa: PING, AUTH, SELECT, GET, SET (NX, PX),
+DEL, INCRBY, MGET e o EVAL de liberação de trava.
+"""
+import socketserver
+import threading
+import time
+
+from repositories.cache_backends import _RELEASE_SCRIPT, read_reply
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class FakeRedisServer:
+    def __init__(self):
+        self.data = {}
+        self.expira = {}
+        self.commands = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        args = read_reply(self.rfile)
+                    except (ConnectionError, ValueError):
+                        return
+                    self.wfile.write(server.execute(args))
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self.url = f"redis://127.0.0.1:{self.port}/0"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _get(self, key):
+        if key in self.expira and time.monotonic() >= self.expira[key]:
+            self.data.pop(key, None)
+            self.expira.pop(key, None)
+        return self.data.get(key)
+
+    def execute(self, args):
+        comando = args[0].decode().upper()
+        args = args[1:]
+        with self._lock:
+            self.commands.append(comando)
+            if comando in ("PING", "AUTH", "SELECT"):
+                return b"+OK\r\n" if comando != "PING" else b"+PONG\r\n"
+            if comando == "GET":
+                return _bulk(self._get(args[0]))
+            if comando == "MGET":
+                return b"*%d\r\n" % len(args) + b"".join(_bulk(self._get(key)) for key in args)
+            if comando == "SET":
+                key, value, opcoes = args[0], args[1], [a.decode().upper() for a in args[2:]]
+                if "NX" in opcoes and self._get(key) is not None:
+                    return b"$-1\r\n"
+                self.data[key] = value
+                self.expira.pop(key, None)
+                if "PX" in opcoes:
+                    self.expira[key] = time.monotonic() + int(opcoes[opcoes.index("PX") + 1]) / 1000
+                return b"+OK\r\n"
+            if comando == "DEL":
+                removidos = sum(1 for key in args if self.data.pop(key, None) is not None)
+                return b":%d\r\n" % removidos
+            if comando == "INCRBY":
+                valor = int(self._get(args[0]) or 0) + int(args[1])
+                self.data[args[0]] = str(valor).encode()
+                return b":%d\r\n" % valor
+            if comando == "EVAL" and args[0].decode() == _RELEASE_SCRIPT:
+                key, dono = args[2], args[3]
+                if self._get(key) == dono:
+                    del self.data[key]
+                    return b":1\r\n"
+                return b":0\r\n"
+            return b"-ERR comando nao suportado\r\n"
@@ -0,0 +1,130 @@
+"""
+Banco em memória para testes de orçamento de consultas.
+
+DatabaseStandIn substitui database.get_db_connection: as rotas rodam de
+verdade (repositórios, unidade de trabalho, instrumentação), mas cada
+comando SQL é só registrado e respondido pelas regras cadastradas com on().
+budget() falha se a rota abrir mais conexões ou enviar mais comandos do que
+o declarado, mostrando o SQL executado.
+"""
+import re
+from contextlib import contextmanager
+from unittest.mock import patch
+
+
+class FakeCursor:
+    def __init__(self, standin):
+        self._standin = standin
+        self._rows = []
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def close(self):
+        pass
+
+    def execute(self, query, args=None):
+        self._rows = self._standin.respond(query, args)
+        self.rowcount = len(self._rows) if self._rows else 1
+        self.lastrowid = self._standin.next_id()
+        return self.rowcount
+
+    def executemany(self, query, args):
+        args = list(args)
+        self._standin.respond(query, args)
+        self._rows = []
+        self.rowcount = len(args)
+        self.lastrowid = self._standin.next_id()
+        return self.rowcount
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class FakeConnection:
+    def __init__(self, standin):
+        self._standin = standin
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self._standin)
+
+    def commit(self):
+        self._standin.commits += 1
+
+    def rollback(self):
+        self._standin.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+class DatabaseStandIn:
+    def __init__(self):
+        self._rules = []
+        self._ids = 0
+        self.reset()
+
+    def reset(self):
+        self.connections = 0
+        self.statements = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def on(self, pattern, rows=None):
+        """
+        Responde comandos cujo SQL casa com `pattern` (regex, espaços normalizados).
+        `rows` pode ser uma lista de dicts ou uma função (sql, args) -> lista.
+        A última regra cadastrada tem prioridade.
+        """
+        self._rules.insert(0, (re.compile(pattern, re.IGNORECASE), rows))
+        return self
+
+    def respond(self, query, args):
+        sql = " ".join(query.split())
+        self.statements.append(sql)
+        for pattern, rows in self._rules:
+            if pattern.search(sql):
+                return list(rows(sql, args) if callable(rows) else rows or [])
+        return []
+
+    def next_id(self):
+        self._ids += 1
+        return self._ids
+
+    def connect(self, readonly=False):
+        self.connections += 1
+        return FakeConnection(self)
+
+    @contextmanager
+    def budget(self, connections=1, statements=None, commits=None):
+        self.reset()
+        yield self
+        executado = "\n".join(f"  {i + 1}. {sql}" for i, sql in enumerate(self.statements))
+        assert self.connections <= connections, (
+            f"{self.connections} conexões (orçamento {connections})\n{executado}"
+        )
+        if statements is not None:
+            assert len(self.statements) <= statements, (
+                f"{len(self.statements)} comandos SQL (orçamento {statements})\n{executado}"
+            )
+        if commits is not None:
+            assert self.commits <= commits, f"{self.commits} commits (orçamento {commits})"
+
+    @contextmanager
+    def installed(self):
+        with patch("database.get_db_connection", side_effect=self.connect):
+            yield self
@@ -1,4 +1,5 @@
 import io
+import json
 import pytest
 from unittest.mock import patch, MagicMock
 from flask import session
@@ -72,6 +73,23 @@ def test_get_voluntario_areas_success(client):
         assert data["nome"] == "João"
         assert len(data["areas"]) == 1
 
+def test_get_voluntario_areas_conditional_get(client):
+    with patch("app.get_voluntario_with_areas_by_phone") as mock_get:
+        mock_get.return_value = ({"id": 1, "nome": "João"}, [{"id": 1, "nome": "Som"}])
+        response = client.get("/api/voluntario/areas?telefone=123")
+        etag = response.headers["ETag"]
+        assert "private" in response.headers["Cache-Control"]
+        assert "no-cache" in response.headers["Cache-Control"]
+
+        revalidated = client.get("/api/voluntario/areas?telefone=123", headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.data == b""
+
+        mock_get.return_value = ({"id": 1, "nome": "João"}, [])
+        changed = client.get("/api/voluntario/areas?telefone=123", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+
 def test_get_voluntario_areas_not_found(client):
     with patch("app.get_voluntario_with_areas_by_phone") as mock_get:
         mock_get.return_value = (None, [])
@@ -87,11 +105,12 @@ def test_get_voluntario_areas_missing_phone(client):
     assert "não informado" in data["message"]
 
 def test_resumo_vagas_success(client):
-    with patch("app.get_resumo_vagas") as mock_resumo, \
-         patch("app.get_area_by_id") as mock_area:
+    with patch("app.get_resumo_vagas") as mock_resumo:
         
-        mock_resumo.return_value = (10, [{"data": "2024-06-02", "turno": "Manhã", "total": 2}], [])
-        mock_area.return_value = {"id": 1, "nome": "Som", "max_pessoas": 10, "dias_disponiveis": "0_Manhã,0_Noite"}
+        mock_resumo.return_value = {1: (
+            {"id": 1, "nome": "Som", "max_pessoas": 10, "dias_disponiveis": "0_Manhã,0_Noite"},
+            {("2024-06-02", "Manhã"): (2, 0)},
+        )}
         
         # Override today to ensure we know what the next month is
         from datetime import datetime
@@ -115,11 +134,165 @@ def test_resumo_vagas_missing_area_id(client):
 
 def test_resumo_vagas_area_not_found(client):
     with patch("app.get_resumo_vagas") as mock_resumo:
-        mock_resumo.return_value = (None, [], [])
+        mock_resumo.return_value = {}
         response = client.get("/api/resumo_vagas?area_id=999")
         data = response.get_json()
         assert "Area not found" in data["error"]
 
+def resumo_area(equipe, area_id=1):
+    area = {"id": area_id, "nome": "Som", "max_pessoas": 10, "dias_disponiveis": "0_Manhã"}
+    return {area_id: (area, {("2024-06-02", "Manhã"): (equipe, 0)})}
+
+@pytest.fixture
+def resumo_junho():
+    """/api/resumo_vagas com hoje em maio/2024 (resumo de junho) e repositório falso."""
+    from datetime import datetime
+    with patch("app.get_resumo_vagas") as mock_resumo, \
+         patch("app.datetime") as mock_date:
+        mock_date.now.return_value = datetime(2024, 5, 1)
+        mock_date.strptime = datetime.strptime
+        mock_resumo.return_value = resumo_area(equipe=2)
+        yield mock_resumo
+
+def test_resumo_vagas_is_cached(client, resumo_junho):
+    first = client.get("/api/resumo_vagas?area_id=1").get_json()
+    second = client.get("/api/resumo_vagas?area_id=1").get_json()
+    assert first == second
+    assert resumo_junho.call_count == 1
+
+def test_resumo_vagas_revalidation_skips_queries(client, resumo_junho):
+    response = client.get("/api/resumo_vagas?area_id=1")
+    etag = response.headers["ETag"]
+    assert etag.startswith('"')
+    assert "public" in response.headers["Cache-Control"]
+    assert "no-cache" in response.headers["Cache-Control"]
+
+    revalidated = client.get("/api/resumo_vagas?area_id=1", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == etag
+    assert resumo_junho.call_count == 1
+
+    from repositories import events
+    events.publish("escalas_changed", slots=[(1, "2024-06-02")])
+    resumo_junho.return_value = resumo_area(equipe=3)
+    changed = client.get("/api/resumo_vagas?area_id=1", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_resumo_vagas_not_found_is_not_cached(client, resumo_junho):
+    resumo_junho.return_value = {}
+    client.get("/api/resumo_vagas?area_id=1")
+    client.get("/api/resumo_vagas?area_id=1")
+    assert resumo_junho.call_count == 2
+
+def test_resumo_vagas_invalidated_by_escalas_in_same_month(client, resumo_junho):
+    from repositories import events
+
+    client.get("/api/resumo_vagas?area_id=1")
+    # outra área e outro mês não tocam no resumo guardado
+    events.publish("escalas_changed", slots=[(2, "2024-06-02"), (1, "2024-07-07")])
+    client.get("/api/resumo_vagas?area_id=1")
+    assert resumo_junho.call_count == 1
+
+    events.publish("escalas_changed", slots=[(1, "2024-06-02")])
+    resumo_junho.return_value = resumo_area(equipe=3)
+    data = client.get("/api/resumo_vagas?area_id=1").get_json()
+    assert resumo_junho.call_count == 2
+    assert data["datas"][0]["turnos"][0]["vagas_livres"] == 7
+
+def test_resumo_vagas_invalidated_by_area_change(client, resumo_junho):
+    from repositories import events
+
+    client.get("/api/resumo_vagas?area_id=1")
+    events.publish("areas_changed", area_id="1")
+    client.get("/api/resumo_vagas?area_id=1")
+    events.publish("escalas_changed", slots=None)
+    client.get("/api/resumo_vagas?area_id=1")
+    assert resumo_junho.call_count == 3
+
+def test_resumo_vagas_many_areas_and_months(client, resumo_junho):
+    from repositories import events
+
+    resumo_junho.return_value = {**resumo_area(equipe=2), **resumo_area(equipe=0, area_id=2)}
+    data = client.get("/api/resumo_vagas?area_ids=2,1,9,2&meses=2").get_json()
+
+    resumo_junho.assert_called_once_with([2, 1, 9], [(2024, 6), (2024, 7)])
+    assert [area["id"] for area in data["areas"]] == [2, 1]
+    # mesmo formato de ?area_id=, com os domingos de junho e julho
+    area = data["areas"][1]
+    assert area["max_pessoas"] == 10
+    assert [d["iso"] for d in area["datas"]][:2] == ["2024-06-02", "2024-06-09"]
+    assert area["datas"][-1]["iso"] == "2024-07-28"
+    assert area["datas"][0]["turnos"][0]["vagas_livres"] == 8
+
+    client.get("/api/resumo_vagas?area_ids=2,1,9,2&meses=2")
+    assert resumo_junho.call_count == 1
+    # qualquer área e mês do pedido invalida o resumo combinado
+    events.publish("escalas_changed", slots=[(2, "2024-07-07")])
+    client.get("/api/resumo_vagas?area_ids=2,1,9,2&meses=2")
+    assert resumo_junho.call_count == 2
+
+def test_resumo_vagas_single_area_month_range(client, resumo_junho):
+    data = client.get("/api/resumo_vagas?area_id=1&inicio=2024-12&meses=2").get_json()
+    resumo_junho.assert_called_once_with([1], [(2024, 12), (2025, 1)])
+    assert set(data) == {"max_pessoas", "datas"}
+
+@pytest.mark.parametrize("query", [
+    "area_id=1&meses=0",
+    "area_id=1&meses=4",
+    "area_id=1&inicio=2024-13",
+    "area_ids=1,x",
+    "area_ids=" + ",".join(str(i) for i in range(1, 22)),
+])
+def test_resumo_vagas_rejects_invalid_params(client, resumo_junho, query):
+    response = client.get(f"/api/resumo_vagas?{query}")
+    assert response.status_code == 400
+    resumo_junho.assert_not_called()
+
+@pytest.fixture
+def live_vagas():
+    from app import live_vagas
+    with patch.object(live_vagas, "_ensure_pump"):
+        yield live_vagas
+
+def test_resumo_vagas_stream(client, resumo_junho, live_vagas):
+    response = client.get("/api/resumo_vagas/stream?area_id=1&meses=2", buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    corpo = iter(response.response)
+    assert next(corpo) == b"retry: 3000\n\n"
+    assert next(corpo).startswith(b'event: resumo\ndata: {"mes":"2024-06","max_pessoas":10')
+    assert next(corpo).startswith(b'event: resumo\ndata: {"mes":"2024-07"')
+    assert live_vagas.connections == 1
+    response.close()
+    assert live_vagas.connections == 0
+
+def test_resumo_vagas_stream_errors(client, resumo_junho, live_vagas):
+    assert client.get("/api/resumo_vagas/stream?area_id=x").status_code == 404
+    assert client.get("/api/resumo_vagas/stream?area_id=1&meses=4").status_code == 400
+    resumo_junho.return_value = {}
+    assert client.get("/api/resumo_vagas/stream?area_id=1").status_code == 404
+    with patch.object(live_vagas, "max_connections", 0):
+        response = client.get("/api/resumo_vagas/stream?area_id=1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert live_vagas.connections == 0
+
+def test_agendar_ignores_cached_vagas(client, resumo_junho):
+    # O resumo guardado ainda mostra vagas, mas quem decide é book_slots
+    assert client.get("/api/resumo_vagas?area_id=1").get_json()["datas"][0]["turnos"][0]["vagas_livres"] == 8
+    with patch("app.get_voluntario_by_phone", return_value={"id": 1}), \
+         patch("app.voluntario_has_area", return_value=True), \
+         patch("app.book_slots", return_value=[
+             {"data": "2024-06-02", "turno": "Manhã", "status": "lotado"},
+         ]) as mock_book:
+        response = client.post("/agendar", data={
+            "telefone": "123", "area_id": "1", "data": "2024-06-02", "turno": "Manhã"
+        })
+    mock_book.assert_called_once()
+    assert "Vagas esgotadas" in response.get_json()["message"]
+
 def test_format_data_br():
     from app import format_data_br
     assert format_data_br("2024-05-19") == "19/05/2024"
@@ -154,15 +327,15 @@ def test_index_db_error(client):
 def test_admin_dashboard_logged_in(client):
     with client.session_transaction() as sess:
         sess["admin_logged_in"] = True
-    with patch("app.get_dashboard_data") as mock_data:
-        mock_data.return_value = ([], [])
+    with patch("app.get_dashboard_snapshot") as mock_snapshot:
+        mock_snapshot.return_value = grade_vazia()
         response = client.get("/admin")
         assert response.status_code == 200
         assert "Dashboard".encode("utf-8") in response.data or "Escala".encode("utf-8") in response.data
 
 def test_escala_publica(client):
-    with patch("app.get_dashboard_data") as mock_data:
-        mock_data.return_value = ([], [])
+    with patch("app.get_dashboard_snapshot") as mock_snapshot:
+        mock_snapshot.return_value = grade_vazia()
         response = client.get("/escala")
         assert response.status_code == 200
         assert "Escala".encode("utf-8") in response.data
@@ -302,25 +475,233 @@ def test_delete_escala(client):
     with client.session_transaction() as sess:
         sess["admin_logged_in"] = True
     with patch("app.repo_delete_escala") as mock_delete, \
-         patch("app.get_dashboard_data", return_value=([], [])):
+         patch("app.get_dashboard_snapshot", return_value=grade_vazia()):
         response = client.post("/admin/escalas/1/delete", follow_redirects=True)
         assert "Agendamento cancelado".encode("utf-8") in response.data
         mock_delete.assert_called_once_with(1)
 
+def grade_vazia():
+    return {"datas": [], "dias": {}, "max_rows": 2, "nao_escalados": []}
+
+def grade_som():
+    turno = {"responsavel": [], "equipe": []}
+    return {
+        "datas": [{"iso": "2024-05-19", "br": "19/05/2024"}],
+        "dias": {"2024-05-19": {
+            "Manhã": {"responsavel": [{"id": 10, "nome": "João"}], "equipe": []},
+            "Noite": turno,
+        }},
+        "max_rows": 2,
+        "nao_escalados": [{"id": 3, "nome": "Maria", "telefone": "11988887777"}],
+    }
+
+def dados_do_dashboard(html):
+    inicio = html.index('<script type="application/json" class="dashboard-dados">')
+    inicio = html.index(">", inicio) + 1
+    return json.loads(html[inicio:html.index("</script>", inicio)])
+
 def test_admin_dashboard_with_data(client):
     with client.session_transaction() as sess:
         sess["admin_logged_in"] = True
-    with patch("app.get_dashboard_data") as mock_data:
+    with patch("app.get_dashboard_snapshot") as mock_snapshot, \
+         patch("app.list_areas") as mock_list:
         mock_areas = [{"id": 1, "nome": "Som"}]
-        mock_escalas = [{
-            "id": 10, "area_nome": "Som", "data": "2024-05-19", "turno": "Manhã", 
-            "voluntario_nome": "João", "responsavel": 1
-        }]
-        mock_data.return_value = (mock_areas, mock_escalas)
+        mock_list.return_value = mock_areas
+        mock_snapshot.return_value = grade_som()
         response = client.get("/admin?area_id=1&month_year=2024-05")
         assert response.status_code == 200
-        assert "Som".encode("utf-8") in response.data
-        assert "João".encode("utf-8") in response.data
+        assert 'data-area-nome="Som"'.encode("utf-8") in response.data
+        # A grade segue em colunas para o navegador montar; não escalados vêm da mesma grade
+        dados = dados_do_dashboard(response.get_data(as_text=True))
+        assert dados["nomes"] == ["João", "Maria"]
+        assert dados["escalas"] == {"id": [10], "dia": [0], "turno": [0], "nome": [0], "responsavel": [1]}
+        assert dados["nao_escalados"] == {"id": [3], "nome": [1], "telefone": ["11988887777"]}
+        mock_snapshot.assert_called_once_with(mock_areas[0], 2024, 5)
+
+def test_admin_dashboard_streams_shell_before_grid(client):
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    areas = [{"id": 1, "nome": "Som"}, {"id": 2, "nome": "Luz"}]
+    with patch("app.get_dashboard_snapshot", return_value=grade_som()) as mock_snapshot, \
+         patch("app.list_areas", return_value=areas):
+        response = client.get("/admin?area_id=2&month_year=2024-05", buffered=False)
+        assert response.is_streamed
+        corpo = iter(response.response)
+        cabecalho = next(corpo)
+        assert b"Escala Consolidada" in cabecalho
+        # A grade só é lida depois do cabeçalho enviado
+        mock_snapshot.assert_not_called()
+        resto = b"".join(corpo)
+        response.close()
+    mock_snapshot.assert_called_once_with(areas[1], 2024, 5)
+    assert 'data-area-nome="Luz"'.encode("utf-8") in resto
+    assert 'data-area-nome="Som"'.encode("utf-8") not in resto
+    assert dados_do_dashboard(resto.decode("utf-8"))["area_id"] == 2
+
+def test_admin_dashboard_grid_error_is_inline(client):
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    from repositories.errors import RepositoryError
+    with patch("app.get_dashboard_snapshot", side_effect=RepositoryError("fora do ar")), \
+         patch("app.list_areas", return_value=[{"id": 1, "nome": "Som"}]):
+        response = client.get("/admin?month_year=2024-05")
+    assert response.status_code == 200
+    assert "Erro ao carregar dashboard.".encode("utf-8") in response.data
+
+def test_api_admin_dashboard(client):
+    assert client.get("/admin/api/dashboard?area_id=1").status_code == 401
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    area = {"id": 1, "nome": "Som"}
+    with patch("app.get_area_by_id", return_value=area), \
+         patch("app.get_dashboard_snapshot", return_value=grade_som()) as mock_snapshot:
+        response = client.get("/admin/api/dashboard?area_id=1&month_year=2024-05")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["dias"] == ["2024-05-19"] and data["turnos"] == ["Manhã", "Noite"]
+        assert data["mes"] == "2024-05" and data["max_rows"] == 2
+        mock_snapshot.assert_called_once_with(area, 2024, 5)
+
+        repetida = client.get("/admin/api/dashboard?area_id=1&month_year=2024-05",
+                              headers={"If-None-Match": response.headers["ETag"]})
+        assert repetida.status_code == 304
+
+    with patch("app.get_area_by_id", return_value=None):
+        assert client.get("/admin/api/dashboard?area_id=9").status_code == 404
+
+def test_api_admin_dashboard_patch_add_returns_cell(client):
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    area = {"id": 1, "nome": "Som"}
+    with patch("app.get_area_by_id", return_value=area), \
+         patch("app.get_voluntario_by_id", return_value={"id": 10}), \
+         patch("app.voluntario_has_area", return_value=True), \
+         patch("app.escala_exists", return_value=False), \
+         patch("app.create_escala") as mock_create, \
+         patch("app.get_dashboard_snapshot", return_value=grade_som()) as mock_snapshot:
+        response = client.patch("/admin/api/dashboard", json={
+            "op": "add", "voluntario_id": 10, "area_id": 1, "data": "2024-05-19", "turno": "Manhã",
+        })
+    assert response.status_code == 201
+    mock_create.assert_called_once_with(10, 1, "2024-05-19", "Manhã")
+    mock_snapshot.assert_called_once_with(area, 2024, 5)
+    celula = response.get_json()
+    assert celula["dia"] == "2024-05-19" and celula["turno"] == "Manhã"
+    assert celula["nomes"] == ["João", "Maria"]
+    assert celula["escalas"] == {"id": [10], "nome": [0], "responsavel": [1]}
+    assert celula["nao_escalados"]["nome"] == [1]
+
+def test_api_admin_dashboard_patch_add_errors(client):
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    corpo = {"op": "add", "voluntario_id": 10, "area_id": 1, "data": "2024-05-19", "turno": "Manhã"}
+    assert client.patch("/admin/api/dashboard", json={**corpo, "data": "19/05"}).status_code == 400
+    assert client.patch("/admin/api/dashboard", json={**corpo, "turno": "Tarde"}).status_code == 400
+    assert client.patch("/admin/api/dashboard", json={"op": "mover"}).status_code == 400
+    with patch("app.get_area_by_id", return_value={"id": 1}), \
+         patch("app.get_voluntario_by_id", return_value={"id": 10}), \
+         patch("app.voluntario_has_area", return_value=True), \
+         patch("app.escala_exists", return_value=True), \
+         patch("app.create_escala") as mock_create:
+        response = client.patch("/admin/api/dashboard", json=corpo)
+    assert response.status_code == 409
+    mock_create.assert_not_called()
+
+    # Voluntário inexistente ou de outra área: erro do cliente, sem chegar à chave estrangeira
+    with patch("app.get_area_by_id", return_value={"id": 1}), \
+         patch("app.get_voluntario_by_id", return_value=None), \
+         patch("app.create_escala") as mock_create:
+        assert client.patch("/admin/api/dashboard", json=corpo).status_code == 404
+    mock_create.assert_not_called()
+    with patch("app.get_area_by_id", return_value={"id": 1}), \
+         patch("app.get_voluntario_by_id", return_value={"id": 10}), \
+         patch("app.voluntario_has_area", return_value=False) as mock_has_area, \
+         patch("app.create_escala") as mock_create:
+        assert client.patch("/admin/api/dashboard", json=corpo).status_code == 400
+    mock_has_area.assert_called_once_with(10, 1)
+    mock_create.assert_not_called()
+
+def test_api_admin_dashboard_patch_remove(client):
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    from datetime import date
+    removida = {"voluntario_id": 10, "area_id": 1, "data": date(2024, 5, 19), "turno": "Noite"}
+    with patch("app.get_escala_by_id", return_value=removida), \
+         patch("app.repo_delete_escala", return_value=removida) as mock_delete, \
+         patch("app.get_area_by_id", return_value={"id": 1, "nome": "Som"}), \
+         patch("app.get_dashboard_snapshot", return_value=grade_som()):
+        response = client.patch("/admin/api/dashboard", json={"op": "remove", "escala_id": 5})
+    assert response.status_code == 200
+    mock_delete.assert_called_once_with(5)
+    celula = response.get_json()
+    assert celula["turno"] == "Noite" and celula["escalas"]["id"] == []
+
+    with patch("app.get_escala_by_id", return_value=None), \
+         patch("app.repo_delete_escala") as mock_delete:
+        response = client.patch("/admin/api/dashboard", json={"op": "remove", "escala_id": 5})
+    assert response.status_code == 404
+    mock_delete.assert_not_called()
+
+    # Área sumiu: o 404 sai antes da exclusão, que não chega ao commit do after_request
+    with patch("app.get_escala_by_id", return_value=removida), \
+         patch("app.get_area_by_id", return_value=None), \
+         patch("app.repo_delete_escala") as mock_delete:
+        response = client.patch("/admin/api/dashboard", json={"op": "remove", "escala_id": 5})
+    assert response.status_code == 404
+    mock_delete.assert_not_called()
+
+def escalas_exportadas():
+    from datetime import date
+    return [
+        {"area": "Som", "data": date(2024, 6, 2), "turno": "Manhã", "responsavel": 1, "voluntario": "João", "telefone": "111"},
+        {"area": "Som", "data": date(2024, 6, 2), "turno": "Noite", "responsavel": 0, "voluntario": "Maria", "telefone": None},
+    ]
+
+def test_admin_export_escala_csv_streams_rows(client):
+    from datetime import date
+    assert client.get("/admin/export/escala").status_code == 302
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    with patch("app.get_area_by_id", return_value={"id": 1, "nome": "Som"}), \
+         patch("app.iter_escalas_export", return_value=iter(escalas_exportadas())) as mock_export:
+        response = client.get("/admin/export/escala?month_year=2024-06&area_id=1&formato=csv", buffered=False)
+        assert response.is_streamed
+        corpo = response.get_data(as_text=True)
+    mock_export.assert_called_once_with(date(2024, 6, 1), date(2024, 7, 1), 1)
+    assert response.mimetype == "text/csv"
+    assert 'filename=escala_2024-06_Som.csv' in response.headers["Content-Disposition"]
+    assert corpo.splitlines() == [
+        "\ufeffÁrea,Data,Dia,Turno,Função,Voluntário,Telefone",
+        "Som,02/06/2024,domingo,Manhã,Responsável,João,111",
+        "Som,02/06/2024,domingo,Noite,Equipe,Maria,",
+    ]
+
+def test_admin_export_escala_xlsx_whole_year(client):
+    from datetime import date
+    from openpyxl import load_workbook
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    with patch("app.iter_escalas_export", return_value=iter(escalas_exportadas())) as mock_export:
+        response = client.get("/admin/export/escala?month_year=2024")
+    mock_export.assert_called_once_with(date(2024, 1, 1), date(2025, 1, 1), None)
+    assert 'filename=escala_2024.xlsx' in response.headers["Content-Disposition"]
+    linhas = list(load_workbook(io.BytesIO(response.data)).active.iter_rows(values_only=True))
+    assert linhas[0] == ("Área", "Data", "Dia", "Turno", "Função", "Voluntário", "Telefone")
+    assert linhas[1][0] == "Som" and linhas[1][1].date() == date(2024, 6, 2)
+    assert linhas[2][4:] == ("Equipe", "Maria", None)
+
+def test_admin_export_escala_errors(client):
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    assert client.get("/admin/export/escala?formato=pdf").status_code == 400
+    assert client.get("/admin/export/escala?month_year=junho").status_code == 400
+    assert client.get("/admin/export/escala?area_id=som").status_code == 400
+    with patch("app.get_area_by_id", return_value=None):
+        assert client.get("/admin/export/escala?area_id=9").status_code == 404
+    from repositories.errors import RepositoryError
+    # A consulta roda antes dos cabeçalhos: erro de banco ainda é um 500
+    with patch("app.iter_escalas_export", side_effect=RepositoryError("fora do ar")):
+        assert client.get("/admin/export/escala?month_year=2024-06").status_code == 500
 
 def test_admin_voluntarios_duplicate_phone(client):
     with client.session_transaction() as sess:
@@ -348,8 +729,9 @@ def test_agendar_not_enabled(client):
 def test_agendar_lotado(client):
     with patch("app.get_voluntario_by_phone", return_value={"id": 1}), \
          patch("app.voluntario_has_area", return_value=True), \
-         patch("app.get_area_by_id", return_value={"max_pessoas": 2}), \
-         patch("app.count_agendados_non_responsavel", return_value=2):
+         patch("app.book_slots", return_value=[
+             {"data": "2024-05-19", "turno": "Manhã", "status": "lotado"},
+         ]):
         response = client.post("/agendar", data={
             "telefone": "123", "area_id": "1", "data": "2024-05-19", "turno": "Manhã"
         })
@@ -360,9 +742,9 @@ def test_agendar_lotado(client):
 def test_agendar_already_scheduled(client):
     with patch("app.get_voluntario_by_phone", return_value={"id": 1}), \
          patch("app.voluntario_has_area", return_value=True), \
-         patch("app.get_area_by_id", return_value={"max_pessoas": 5}), \
-         patch("app.count_agendados_non_responsavel", return_value=0), \
-         patch("app.escala_exists", return_value=True):
+         patch("app.book_slots", return_value=[
+             {"data": "2024-05-19", "turno": "Manhã", "status": "duplicado"},
+         ]):
         response = client.post("/agendar", data={
             "telefone": "123", "area_id": "1", "data": "2024-05-19", "turno": "Manhã"
         })
@@ -370,13 +752,23 @@ def test_agendar_already_scheduled(client):
         data = response.get_json()
         assert "já está escalado" in data["message"]
 
+def test_agendar_area_not_found(client):
+    with patch("app.get_voluntario_by_phone", return_value={"id": 1}), \
+         patch("app.voluntario_has_area", return_value=True), \
+         patch("app.book_slots", return_value=None):
+        response = client.post("/agendar", data={
+            "telefone": "123", "area_id": "99", "data": "2024-05-19", "turno": "Manhã"
+        })
+        assert response.status_code == 400
+        assert "Área inválida" in response.get_json()["message"]
+
 def test_agendar_multiple_slots_success(client):
     with patch("app.get_voluntario_by_phone", return_value={"id": 1}), \
          patch("app.voluntario_has_area", return_value=True), \
-         patch("app.get_area_by_id", return_value={"max_pessoas": 5}), \
-         patch("app.count_agendados_non_responsavel", return_value=0), \
-         patch("app.escala_exists", return_value=False), \
-         patch("app.create_escala") as mock_create:
+         patch("app.book_slots", return_value=[
+             {"data": "2024-05-19", "turno": "Manhã", "status": "agendado"},
+             {"data": "2024-05-26", "turno": "Noite", "status": "agendado"},
+         ]) as mock_book:
         
         response = client.post("/agendar", data={
             "telefone": "123", 
@@ -386,26 +778,45 @@ def test_agendar_multiple_slots_success(client):
         assert response.status_code == 200
         data = response.get_json()
         assert "2 agendamento(s) realizado(s)" in data["message"]
-        assert mock_create.call_count == 2
+        mock_book.assert_called_once_with(1, "1", [("2024-05-19", "Manhã"), ("2024-05-26", "Noite")])
 
 def test_agendar_multiple_slots_partial_success(client):
     with patch("app.get_voluntario_by_phone", return_value={"id": 1}), \
          patch("app.voluntario_has_area", return_value=True), \
-         patch("app.get_area_by_id", return_value={"max_pessoas": 5}), \
-         patch("app.count_agendados_non_responsavel", return_value=0), \
-         patch("app.escala_exists", side_effect=[False, True]), \
-         patch("app.create_escala") as mock_create:
+         patch("app.book_slots", return_value=[
+             {"data": "2024-05-19", "turno": "Manhã", "status": "agendado"},
+             {"data": "2024-05-26", "turno": "Noite", "status": "duplicado"},
+         ]):
         
         response = client.post("/agendar", data={
             "telefone": "123", 
             "area_id": "1", 
-            "slots": ["2024-05-19|Manhã", "2024-05-26|Noite"]
+            "slots": ["2024-05-19|Manhã", "2024-05-26|Noite", "sem-turno"]
         })
         assert response.status_code == 200
         data = response.get_json()
         assert "1 agendamento(s) realizado(s)" in data["message"]
         assert "já está escalado" in data["message"]
-        assert mock_create.call_count == 1
+        assert "Formato de horário inválido: sem-turno" in data["message"]
+
+def test_agendar_normalizes_slots_before_checking_capacity(client):
+    with patch("app.get_voluntario_by_phone", return_value={"id": 1}), \
+         patch("app.voluntario_has_area", return_value=True), \
+         patch("app.book_slots", return_value=[
+             {"data": "2024-06-02", "turno": "Manhã", "status": "lotado"},
+         ]) as mock_book:
+        response = client.post("/agendar", data={
+            "telefone": "123",
+            "area_id": "1",
+            "slots": ["2024-06-2|Manhã", "2024-06-02|manhã", "20240602|Manhã", "2024-06-02|Manhã"],
+        })
+    assert response.status_code == 400
+    data = response.get_json()
+    # Só a forma canônica chega às vagas, uma vez: o horário lotado não passa por outra grafia
+    mock_book.assert_called_once_with(1, "1", [("2024-06-02", "Manhã")])
+    assert "Vagas esgotadas para 2024-06-02 (Manhã)" in data["message"]
+    assert "Formato de horário inválido: 2024-06-2|Manhã" in data["message"]
+    assert "Formato de horário inválido: 2024-06-02|manhã" in data["message"]
 
 def test_admin_voluntarios_import_csv(client):
     with client.session_transaction() as sess:
@@ -417,18 +828,18 @@ def test_admin_voluntarios_import_csv(client):
     }
     
     with patch("app.list_areas", return_value=[{"id": 1, "nome": "Som"}]), \
-         patch("app.get_voluntario_by_phone", side_effect=[None, None]), \
-         patch("app.create_voluntario") as mock_create:
+         patch("app.get_existing_phones", return_value=set()), \
+         patch("app.create_voluntarios", side_effect=len) as mock_create:
         
         response = client.post("/admin/voluntarios/import", data=data, content_type='multipart/form-data', follow_redirects=True)
         
         assert response.status_code == 200
         assert "2 importados".encode("utf-8") in response.data
-        assert mock_create.call_count == 2
-        # João
-        mock_create.assert_any_call("João", "11999999999", 1, ["1"])
-        # Maria
-        mock_create.assert_any_call("Maria", "11888888888", 0, [])
+        # A single batch for the whole file
+        mock_create.assert_called_once_with([
+            ("João", "11999999999", 1, ["1"]),
+            ("Maria", "11888888888", 0, []),
+        ])
 
 def test_admin_voluntarios_import_duplicate(client):
     with client.session_transaction() as sess:
@@ -440,14 +851,41 @@ def test_admin_voluntarios_import_duplicate(client):
     }
     
     with patch("app.list_areas", return_value=[]), \
-         patch("app.get_voluntario_by_phone", return_value={"id": 1, "nome": "Pedro"}), \
-         patch("app.create_voluntario") as mock_create:
+         patch("app.get_existing_phones", return_value={"11777777777"}), \
+         patch("app.create_voluntarios", side_effect=len) as mock_create:
         
         response = client.post("/admin/voluntarios/import", data=data, content_type='multipart/form-data', follow_redirects=True)
         
         assert response.status_code == 200
         assert "1 já existiam".encode("utf-8") in response.data
-        assert mock_create.call_count == 0
+        mock_create.assert_called_once_with([])
+
+def test_admin_voluntarios_import_counts_bad_rows_as_errors(client):
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+
+    csv_content = (
+        "Nome,Telefone\n"
+        f"{'A' * 101},11999999999\n"
+        f"Bia,{'1' * 21}\n"
+        "Caio,11777777777\n"
+        "Davi,11666666666\n"
+        "Eva,11555555555\n"
+    )
+    data = {'file': (io.BytesIO(csv_content.encode('utf-8')), 'test.csv')}
+    from repositories.errors import DuplicatePhoneError
+    # O lote falha (telefone cadastrado por outro admin); refeito um a um, só o Davi falha
+    efeitos = [DuplicatePhoneError("x"), 1, DuplicatePhoneError("x"), 1]
+
+    with patch("app.list_areas", return_value=[]), \
+         patch("app.get_existing_phones", return_value=set()), \
+         patch("app.create_voluntarios", side_effect=efeitos) as mock_create:
+        response = client.post("/admin/voluntarios/import", data=data, content_type='multipart/form-data', follow_redirects=True)
+
+    assert response.status_code == 200
+    assert "2 importados, 0 já existiam, 3 com erro".encode("utf-8") in response.data
+    lote = [("Caio", "11777777777", 0, []), ("Davi", "11666666666", 0, []), ("Eva", "11555555555", 0, [])]
+    assert [call.args[0] for call in mock_create.call_args_list] == [lote] + [[c] for c in lote]
 
 def test_admin_voluntarios_import_invalid_file(client):
     with client.session_transaction() as sess:
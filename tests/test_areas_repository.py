@@ -5,37 +5,74 @@ from repositories.errors import RepositoryError
 
 @pytest.fixture
 def mock_db_conn():
-    with patch("repositories.areas_repository.connect") as mock_connect:
+    with patch("repositories.areas_repository.connect") as mock_connect, \
+         patch("repositories.cache.connect", new=mock_connect):
         mock_conn = MagicMock()
         mock_connect.return_value = mock_conn
         yield mock_conn
 
 def test_list_areas(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = {"versao": 1}
     mock_cursor.fetchall.return_value = [{"id": 1, "nome": "Som", "max_pessoas": 2}]
     
     areas = list_areas()
     
     assert len(areas) == 1
     assert areas[0]["nome"] == "Som"
-    mock_cursor.execute.assert_called_once_with("SELECT * FROM areas")
+    mock_cursor.execute.assert_called_with("SELECT * FROM areas ORDER BY id")
 
 def test_get_area_by_id(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    mock_cursor.fetchone.return_value = {"id": 1, "nome": "Som", "max_pessoas": 2}
+    mock_cursor.fetchone.return_value = {"versao": 1}
+    mock_cursor.fetchall.return_value = [{"id": 1, "nome": "Som", "max_pessoas": 2}]
     
-    area = get_area_by_id(1)
+    area = get_area_by_id("1")
     
     assert area["id"] == 1
     assert area["nome"] == "Som"
-    mock_cursor.execute.assert_called_once_with("SELECT * FROM areas WHERE id = %s", (1,))
+    assert get_area_by_id(2) is None
+    assert get_area_by_id("abc") is None
+
+def test_area_cache_serves_repeated_reads(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = {"versao": 1}
+    mock_cursor.fetchall.return_value = [
+        {"id": 2, "nome": "Zeladoria", "max_pessoas": 2},
+        {"id": 1, "nome": "Ãrea Kids", "max_pessoas": 4},
+    ]
+
+    list_areas()
+    get_area_by_id(1)
+    by_name = list_areas(by_name=True)
+
+    # versão + carga uma vez só
+    assert mock_cursor.execute.call_count == 2
+    assert [a["nome"] for a in by_name] == ["Ãrea Kids", "Zeladoria"]
+    # callers recebem cópias
+    by_name[0]["nome"] = "alterado"
+    assert get_area_by_id(1)["nome"] == "Ãrea Kids"
+
+def test_area_write_bumps_version_and_invalidates(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = {"versao": 1}
+    mock_cursor.fetchall.return_value = [{"id": 1, "nome": "Som", "max_pessoas": 2}]
+    list_areas()
+
+    update_area(1, "Som Editado", 4, "0_Manhã")
+    mock_cursor.fetchone.return_value = {"versao": 2}
+    mock_cursor.fetchall.return_value = [{"id": 1, "nome": "Som Editado", "max_pessoas": 4}]
+
+    assert "dashboard_snapshots" in mock_cursor.execute.call_args_list[3].args[0]
+    assert "cache_versions" in mock_cursor.execute.call_args_list[4].args[0]
+    assert get_area_by_id(1)["nome"] == "Som Editado"
 
 def test_create_area(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
     
     create_area("Mídia", 3, "0_Manhã,0_Noite,4_Noite")
     
-    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_count == 2
     mock_db_conn.commit.assert_called_once()
 
 def test_update_area(mock_db_conn):
@@ -43,7 +80,7 @@ def test_update_area(mock_db_conn):
     
     update_area(1, "Som Editado", 4, "0_Manhã,0_Noite,4_Noite")
     
-    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_count == 3
     mock_db_conn.commit.assert_called_once()
 
 def test_delete_area(mock_db_conn):
@@ -51,7 +88,8 @@ def test_delete_area(mock_db_conn):
     
     delete_area(1)
     
-    assert mock_cursor.execute.call_count == 3
+    assert mock_cursor.execute.call_count == 6
+    assert "slot_ocupacao" in mock_cursor.execute.call_args_list[0].args[0]
     mock_db_conn.commit.assert_called_once()
 
 def test_list_areas_error(mock_db_conn):
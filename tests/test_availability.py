@@ -0,0 +1,68 @@
+import calendar
+
+import pytest
+
+from availability import AreaAvailability, availability_for, compile_availability
+from app import get_dates_for_area
+
+
+def reference_dates(area_config, ano, mes):
+    """Algoritmo anterior de get_dates_for_area, para comparação."""
+    allowed = {}
+    for part in area_config.split(","):
+        d_idx, shift = part.split("_")
+        allowed.setdefault(int(d_idx), []).append(shift)
+    dates = []
+    for week in calendar.monthcalendar(ano, mes):
+        for day_idx_in_week, day in enumerate(week):
+            ui_idx = (day_idx_in_week + 1) % 7
+            if day and ui_idx in allowed:
+                dates.append({"iso": f"{ano}-{mes:02d}-{day:02d}", "br": f"{day:02d}/{mes:02d}/{ano}",
+                              "turnos": allowed[ui_idx]})
+    return sorted(dates, key=lambda x: x["iso"])
+
+
+@pytest.mark.parametrize("config", ["0_Manhã,0_Noite", "0_Noite,3_Noite", "6_Manhã,1_Manhã,1_Noite"])
+@pytest.mark.parametrize("ano,mes", [(2024, 2), (2024, 6), (2025, 12)])
+def test_dates_match_previous_algorithm(config, ano, mes):
+    datas = get_dates_for_area(config, ano, mes)
+    esperado = reference_dates(config, ano, mes)
+    assert [(d["iso"], d["br"]) for d in datas] == [(d["iso"], d["br"]) for d in esperado]
+    for data, ref in zip(datas, esperado):
+        assert set(data["turnos"]) == set(ref["turnos"])
+
+
+def test_compiled_once_per_config():
+    primeira = compile_availability("0_Manhã,3_Noite")
+    assert compile_availability("0_Manhã,3_Noite") is primeira
+    assert primeira.dates(2024, 6) is primeira.dates(2024, 6)
+    # Configurações equivalentes compartilham as datas memorizadas
+    assert compile_availability("3_Noite,0_Manhã").dates(2024, 6) is primeira.dates(2024, 6)
+
+
+def test_bitmask_and_labels():
+    disponibilidade = compile_availability("0_Manhã,3_Noite")
+    assert disponibilidade.allows(0, "Manhã")
+    assert not disponibilidade.allows(0, "Noite")
+    assert disponibilidade.turnos(3) == ("Noite",)
+    assert disponibilidade.turnos(5) == ()
+
+    primeira = disponibilidade.dates(2024, 6)[0]
+    assert dict(primeira) == {"iso": "2024-06-02", "br": "02/06/2024", "dia_semana": "domingo", "turnos": ("Manhã",)}
+    assert disponibilidade.dates(2024, 6)[1]["dia_semana"] == "quarta"
+
+
+def test_dates_are_read_only():
+    disponibilidade = compile_availability("0_Manhã")
+    with pytest.raises(TypeError):
+        disponibilidade.dates(2024, 6)[0]["iso"] = "x"
+    with pytest.raises(AttributeError):
+        disponibilidade.mask = 0
+
+
+def test_empty_and_malformed_configs():
+    assert compile_availability(None) == AreaAvailability("", 0)
+    assert get_dates_for_area("", 2024, 6) == []
+    assert compile_availability("x_Manhã,9_Noite,0_Tarde,0Manhã").mask == 0
+    assert availability_for({"id": 1}) == compile_availability("0_Manhã,0_Noite")
+    assert availability_for({"id": 1, "dias_disponiveis": None}).dates(2024, 6) == ()
@@ -0,0 +1,147 @@
+import json
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+import booking_queue
+from repositories.errors import RepositoryError
+from repositories.fila_repository import claim_bookings, get_booking_ticket
+
+FORM = {"telefone": "11999999999", "area_id": "1", "slots": ["2024-06-02|Manhã"]}
+
+
+@pytest.fixture
+def fila_mode():
+    with patch("booking_queue.BOOKING_MODE", "fila"), \
+         patch("booking_queue.start_workers") as mock_start, \
+         patch("booking_queue.notify"):
+        yield mock_start
+
+
+def test_agendar_enqueues_in_fila_mode(client, fila_mode):
+    with patch("app.enqueue_booking", return_value="abc123") as mock_enqueue, \
+         patch("app.get_voluntario_by_phone") as mock_phone:
+        response = client.post("/agendar", data=FORM)
+
+    assert response.status_code == 202
+    data = response.get_json()
+    assert data["ticket"] == "abc123"
+    assert data["status_url"] == "/api/agendar/abc123"
+    mock_enqueue.assert_called_once_with("11999999999", 1, ["2024-06-02|Manhã"])
+    mock_phone.assert_not_called()
+    fila_mode.assert_called_once()
+
+
+def test_agendar_fila_mode_rejects_invalid_area(client, fila_mode):
+    with patch("app.enqueue_booking") as mock_enqueue:
+        response = client.post("/agendar", data=dict(FORM, area_id="x"))
+    assert response.status_code == 400
+    mock_enqueue.assert_not_called()
+
+
+def test_agendar_status_pending(client):
+    with patch("app.get_booking_ticket", return_value={"id": 9, "status": "pendente", "posicao": 3}):
+        response = client.get("/api/agendar/abc123")
+    assert response.status_code == 202
+    assert response.get_json() == {"status": "pendente", "ticket": "abc123", "posicao": 3}
+
+
+def test_agendar_status_done_returns_stored_response(client):
+    stored = {"status": "success", "message": "1 agendamento(s) realizado(s) com sucesso!"}
+    with patch("app.get_booking_ticket", return_value={
+        "id": 9, "status": "concluido", "status_code": 200, "resposta": json.dumps(stored),
+    }):
+        response = client.get("/api/agendar/abc123")
+    assert response.status_code == 200
+    assert response.get_json() == stored
+
+
+def test_agendar_status_not_found(client):
+    with patch("app.get_booking_ticket", return_value=None):
+        assert client.get("/api/agendar/nada").status_code == 404
+
+
+def pedido(pedido_id):
+    return {"id": pedido_id, "ticket": f"t{pedido_id}", "telefone": "1199", "area_id": 1, "slots": ["2024-06-02|Manhã"]}
+
+
+@pytest.fixture
+def queue_db():
+    conn = MagicMock()
+    with patch("database.get_db_connection", return_value=conn), \
+         patch("booking_queue.claim_bookings") as mock_claim, \
+         patch("booking_queue.complete_bookings") as mock_complete:
+        yield conn, mock_claim, mock_complete
+
+
+def test_process_batch_uses_one_transaction(app, queue_db):
+    conn, mock_claim, mock_complete = queue_db
+    mock_claim.return_value = [pedido(1), pedido(2), pedido(3)]
+    processor = MagicMock(return_value=({"status": "success", "message": "ok"}, 200))
+
+    assert booking_queue.process_batch(app, processor) == 3
+
+    assert processor.call_count == 3
+    mock_complete.assert_called_once()
+    assert [r[0] for r in mock_complete.call_args.args[0]] == [1, 2, 3]
+
+
+def test_process_batch_retries_items_alone_after_failure(app, queue_db):
+    conn, mock_claim, mock_complete = queue_db
+    mock_claim.return_value = [pedido(1), pedido(2)]
+    ok = ({"status": "success", "message": "ok"}, 200)
+    # lote: o pedido 2 falha; depois, sozinhos: 1 ok, 2 falha de novo
+    processor = MagicMock(side_effect=[ok, RepositoryError("x"), ok, RepositoryError("x")])
+
+    booking_queue.process_batch(app, processor)
+
+    gravados = [call.args[0] for call in mock_complete.call_args_list]
+    assert [(r[0], r[1]) for lote in gravados for r in lote] == [(1, 200), (2, 500)]
+
+
+def test_process_batch_retries_items_alone_after_unexpected_error(app, queue_db):
+    conn, mock_claim, mock_complete = queue_db
+    mock_claim.return_value = [pedido(1), pedido(2)]
+    ok = ({"status": "success", "message": "ok"}, 200)
+    # lote: erro inesperado no pedido 2 (escapa do _run_in_unit_of_work); sozinhos, os dois passam
+    processor = MagicMock(side_effect=[ok, ValueError("x"), ok, ok])
+
+    assert booking_queue.process_batch(app, processor) == 2
+
+    gravados = [call.args[0] for call in mock_complete.call_args_list]
+    assert [(r[0], r[1]) for lote in gravados for r in lote] == [(1, 200), (2, 200)]
+
+
+def test_process_batch_empty_queue(app, queue_db):
+    _, mock_claim, mock_complete = queue_db
+    mock_claim.return_value = []
+    assert booking_queue.process_batch(app, MagicMock()) == 0
+    mock_complete.assert_not_called()
+
+
+@pytest.fixture
+def mock_db_conn():
+    with patch("repositories.fila_repository.connect") as mock_connect:
+        mock_conn = MagicMock()
+        mock_connect.return_value = mock_conn
+        yield mock_conn
+
+
+def test_claim_bookings_skips_locked_rows_in_arrival_order(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [{"id": 4, "ticket": "t", "telefone": "1", "area_id": 1, "slots": '["2024-06-02|Manhã"]'}]
+
+    pedidos = claim_bookings(10)
+
+    select, update = [call.args for call in mock_cursor.execute.call_args_list]
+    assert "ORDER BY id" in select[0] and "FOR UPDATE SKIP LOCKED" in select[0]
+    assert update[1] == ["processando", 4]
+    assert pedidos[0]["slots"] == ["2024-06-02|Manhã"]
+    mock_db_conn.commit.assert_called_once()
+
+
+def test_get_booking_ticket_reports_position(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.side_effect = [{"id": 10, "status": "pendente", "status_code": None, "resposta": None}, {"total": 4}]
+
+    assert get_booking_ticket("t")["posicao"] == 5
@@ -0,0 +1,219 @@
+import pytest
+from flask import Flask
+from unittest.mock import MagicMock, patch
+
+from repositories import events, unit_of_work
+from repositories.cache import SharedCache, VersionedCache
+from repositories.cache_backends import LocalBackend
+from repositories.errors import RepositoryError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def versao():
+    """Conexão falsa cuja linha em cache_versions é state["versao"]."""
+    state = {"versao": 1}
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.side_effect = lambda: {"versao": state["versao"]}
+    with patch("repositories.cache.connect", return_value=conn) as mock_connect:
+        state["connect"] = mock_connect
+        yield state
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def make_cache(clock, loader=None):
+    loader = loader or MagicMock(side_effect=lambda cursor: {"carga": loader.call_count})
+    backend = LocalBackend(clock=clock)
+    return VersionedCache("areas", loader, ttl=60, check_interval=2, clock=clock, backend=backend), loader
+
+
+def test_get_within_check_interval_skips_database(versao, clock):
+    cache, loader = make_cache(clock)
+    assert cache.get() == {"carga": 1}
+    clock.now += 1
+    assert cache.get() == {"carga": 1}
+    assert versao["connect"].call_count == 1
+    assert loader.call_count == 1
+
+
+def test_unchanged_version_keeps_value(versao, clock):
+    cache, loader = make_cache(clock)
+    cache.get()
+    clock.now += 5
+    assert cache.get() == {"carga": 1}
+    assert versao["connect"].call_count == 2
+    assert loader.call_count == 1
+
+
+def test_changed_version_reloads(versao, clock):
+    cache, loader = make_cache(clock)
+    cache.get()
+    versao["versao"] = 2
+    clock.now += 5
+    assert cache.get() == {"carga": 2}
+
+
+def test_ttl_expiry_reloads_without_version_change(versao, clock):
+    cache, loader = make_cache(clock)
+    cache.get()
+    clock.now += 61
+    assert cache.get() == {"carga": 2}
+
+
+def test_invalidate_rechecks_version_immediately(versao, clock):
+    cache, loader = make_cache(clock)
+    cache.get()
+    # A escrita sobe a versão na mesma transação e invalida depois do commit
+    versao["versao"] = 2
+    cache.invalidate()
+    assert cache.get() == {"carga": 2}
+    assert versao["connect"].call_count == 2
+
+
+def test_load_overlapped_by_invalidate_is_not_stored(versao, clock):
+    cache = None
+
+    def loader(cursor):
+        # Uma escrita termina enquanto esta carga ainda está lendo o banco
+        versao["versao"] += 1
+        cache.invalidate()
+        loader.calls += 1
+        return {"carga": loader.calls}
+
+    loader.calls = 0
+    cache = VersionedCache("areas", loader, ttl=60, check_interval=2, clock=clock, backend=LocalBackend(clock=clock))
+    assert cache.get() == {"carga": 1}
+    assert cache.get() == {"carga": 2}
+
+
+def test_load_error_raises_repository_error(versao, clock):
+    cache, _ = make_cache(clock, MagicMock(side_effect=Exception("DB Error")))
+    with pytest.raises(RepositoryError):
+        cache.get()
+
+
+@pytest.fixture
+def shared():
+    return SharedCache("teste", ttl=60, backend=LocalBackend())
+
+
+def test_shared_cache_loads_once(shared):
+    loader = MagicMock(return_value=["valor"])
+    assert shared.get_or_load((1, 2024, 6), loader, stamps=("a",)) == ["valor"]
+    assert shared.get_or_load((1, 2024, 6), loader, stamps=("a",)) == ["valor"]
+    assert loader.call_count == 1
+
+
+def test_shared_cache_bump_invalidates_dependent_entries(shared):
+    shared.get_or_load("x", lambda: "x1", stamps=("todos", "area:1"))
+    shared.get_or_load("y", lambda: "y1", stamps=("todos", "area:2"))
+    shared.bump("area:1")
+    assert shared.get_or_load("x", lambda: "x2", stamps=("todos", "area:1")) == "x2"
+    assert shared.get_or_load("y", lambda: "y2", stamps=("todos", "area:2")) == "y1"
+    shared.bump("todos")
+    assert shared.get_or_load("y", lambda: "y3", stamps=("todos", "area:2")) == "y3"
+
+
+def test_shared_cache_does_not_store_none(shared):
+    loader = MagicMock(return_value=None)
+    shared.get_or_load("x", loader)
+    shared.get_or_load("x", loader)
+    assert loader.call_count == 2
+
+
+def test_shared_cache_survives_backend_outage():
+    backend = MagicMock()
+    backend.counters.side_effect = ConnectionError("fora do ar")
+    backend.incr.side_effect = ConnectionError("fora do ar")
+    cache = SharedCache("teste", ttl=60, backend=backend)
+    assert cache.get_or_load("x", lambda: "direto", stamps=("a",)) == "direto"
+    cache.bump("a")
+
+    backend.counters.side_effect = None
+    backend.counters.return_value = [0]
+    backend.get.side_effect = ConnectionError("fora do ar")
+    backend.lock.side_effect = ConnectionError("fora do ar")
+    assert cache.get_or_load("x", lambda: "direto", stamps=("a",)) == "direto"
+
+
+def test_shared_cache_loader_errors_propagate(shared):
+    with pytest.raises(RepositoryError):
+        shared.get_or_load("x", MagicMock(side_effect=RepositoryError("falhou")))
+
+
+def test_versioned_cache_reuses_load_from_shared_backend(versao, clock):
+    backend = LocalBackend()
+    loader = MagicMock(return_value=[{"id": 1}])
+    primeiro = VersionedCache("areas", loader, ttl=60, check_interval=2, clock=clock, backend=backend)
+    segundo = VersionedCache("areas", loader, ttl=60, check_interval=2, clock=clock, backend=backend)
+    # Dois workers com o mesmo backend: a versão 1 é carregada do banco uma vez só
+    assert primeiro.get() == segundo.get() == [{"id": 1}]
+    assert loader.call_count == 1
+
+    versao["versao"] = 2
+    segundo.invalidate()
+    segundo.get()
+    assert loader.call_count == 2
+
+
+@pytest.fixture
+def listener():
+    calls = []
+    handler = events.subscribe("teste_changed", lambda **payload: calls.append(payload))
+    yield calls
+    events._subscribers["teste_changed"].remove(handler)
+
+
+def test_publish_outside_request_dispatches_immediately(listener):
+    events.publish("teste_changed", area_id=1)
+    assert listener == [{"area_id": 1}]
+
+
+def test_publish_in_request_waits_for_commit(listener):
+    app = Flask(__name__)
+    unit_of_work.init_app(app)
+    seen_before_commit = []
+
+    @app.route("/write")
+    def write():
+        unit_of_work.current_unit_of_work().connection()
+        events.publish("teste_changed", area_id=1)
+        seen_before_commit.extend(listener)
+        return "ok"
+
+    @app.route("/fail")
+    def fail():
+        unit_of_work.current_unit_of_work().connection()
+        events.publish("teste_changed", area_id=2)
+        return "erro", 500
+
+    with patch("database.get_db_connection", return_value=MagicMock()):
+        app.test_client().get("/write")
+        app.test_client().get("/fail")
+
+    assert seen_before_commit == []
+    assert listener == [{"area_id": 1}]
+
+
+def test_failing_subscriber_does_not_break_publish(listener):
+    def broken(**payload):
+        raise RuntimeError("boom")
+
+    events.subscribe("teste_changed", broken)
+    try:
+        events.publish("teste_changed", area_id=1)
+    finally:
+        events._subscribers["teste_changed"].remove(broken)
+    assert listener == [{"area_id": 1}]
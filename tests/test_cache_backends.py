@@ -0,0 +1,191 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from repositories.cache_backends import (
+    LocalBackend,
+    RedisBackend,
+    SQLiteBackend,
+    backend_from_url,
+    get_backend,
+    use_backend,
+)
+
+
+@pytest.fixture
+def redis_server():
+    from fake_redis import FakeRedisServer
+
+    server = FakeRedisServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=["local", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "local":
+        return LocalBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "cache.db"))
+    return RedisBackend(request.getfixturevalue("redis_server").url)
+
+
+def test_get_set_delete(backend):
+    assert backend.get("a") is None
+    backend.set("a", ["corpo", "etag"])
+    backend.set("b", {"id": 1, "nome": "Som"})
+    assert list(backend.get("a")) == ["corpo", "etag"]
+    assert backend.get("b") == {"id": 1, "nome": "Som"}
+    backend.delete("a")
+    assert backend.get("a") is None
+
+
+def test_entries_expire(backend):
+    backend.set("curta", "valor", ttl=0.05)
+    backend.set("longa", "valor", ttl=60)
+    time.sleep(0.1)
+    assert backend.get("curta") is None
+    assert backend.get("longa") == "valor"
+
+
+def test_incr_is_atomic(backend):
+    assert backend.counters(["versao", "outra"]) == [0, 0]
+
+    def worker():
+        for _ in range(50):
+            backend.incr("versao")
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backend.counters(["versao", "outra"]) == [200, 0]
+    assert backend.incr("versao", 5) == 205
+
+
+def test_lock_is_single_flight(backend):
+    with backend.lock("carga", wait=1) as primeiro:
+        assert primeiro is True
+        resultado = {}
+        thread = threading.Thread(target=lambda: resultado.update(
+            segundo=backend.lock("carga", wait=0.05).__enter__()
+        ))
+        thread.start()
+        thread.join()
+        assert resultado["segundo"] is False
+    with backend.lock("carga", wait=0.05) as depois:
+        assert depois is True
+
+
+def test_lock_expires_when_holder_disappears(backend):
+    if isinstance(backend, LocalBackend):
+        pytest.skip("no mesmo processo a trava é sempre liberada pelo finally")
+    # Um worker morto no meio da carga não trava a chave para sempre
+    trava = backend.lock("carga", ttl=0.05)
+    assert trava.__enter__() is True
+    time.sleep(0.1)
+    with backend.lock("carga", wait=0.05) as acquired:
+        assert acquired is True
+
+
+def test_local_backend_evicts_least_recently_used():
+    backend = LocalBackend(max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+    assert len(backend) == 2
+    assert backend.get("a") == 1
+    assert backend.get("b") is None
+
+
+def test_local_backend_nested_single_flight_on_colliding_keys():
+    from repositories.cache import load_shared
+
+    backend = LocalBackend()
+    # Duas chaves que caíam na mesma faixa das antigas 64 travas
+    externa = "resumo:1"
+    interna = next(
+        f"areas:{i}" for i in range(10000)
+        if hash(f"areas:{i}:trava") % 64 == hash(externa + ":trava") % 64
+    )
+
+    inicio = time.monotonic()
+    valor = load_shared(
+        backend, externa, lambda: {"areas": load_shared(backend, interna, lambda: [1], ttl=60)}, ttl=60
+    )
+
+    assert valor == {"areas": [1]}
+    # Sem esperar LOCK_WAIT_SECONDS pela própria trava
+    assert time.monotonic() - inicio < 0.5
+    assert backend._key_locks == {}
+
+
+def test_sqlite_backend_caps_entries(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.db"), max_entries=3)
+    backend.PURGE_INTERVAL_SECONDS = 0
+    for i in range(5):
+        backend.set(f"k{i}", i)
+    assert backend.get("k0") is None
+    assert backend.get("k4") == 4
+
+
+def _incr_in_child(path, quantos):
+    backend = SQLiteBackend(path)
+    for _ in range(quantos):
+        backend.incr("versao")
+    backend.set("filho", "ok")
+
+
+def test_sqlite_backend_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = SQLiteBackend(path)
+    ctx = multiprocessing.get_context("fork")
+    processos = [ctx.Process(target=_incr_in_child, args=(path, 25)) for _ in range(2)]
+    for processo in processos:
+        processo.start()
+    for processo in processos:
+        processo.join(10)
+
+    assert [processo.exitcode for processo in processos] == [0, 0]
+    assert backend.counters(["versao"]) == [50]
+    assert backend.get("filho") == "ok"
+
+
+def test_redis_backend_shares_between_clients(redis_server):
+    primeiro, segundo = RedisBackend(redis_server.url), RedisBackend(redis_server.url)
+    primeiro.set("a", {"x": 1}, ttl=10)
+    primeiro.incr("versao")
+    assert segundo.get("a") == {"x": 1}
+    assert segundo.counters(["versao"]) == [1]
+
+
+def test_redis_backend_reconnects_after_failure(redis_server):
+    backend = RedisBackend(redis_server.url)
+    backend.set("a", 1)
+    # Conexão derrubada no meio do caminho
+    sock, rfile = backend._local.conn
+    rfile.close()
+    sock.close()
+    with pytest.raises(OSError):
+        backend.get("a")
+    assert backend.get("a") == 1
+
+
+def test_backend_from_url(tmp_path):
+    assert isinstance(backend_from_url("local"), LocalBackend)
+    assert isinstance(backend_from_url(f"sqlite:///{tmp_path}/cache.db"), SQLiteBackend)
+    redis = backend_from_url("redis://:s%40nha@cache.internal:6380/2")
+    assert (redis.host, redis.port, redis.db, redis.password) == ("cache.internal", 6380, 2, "s@nha")
+    with pytest.raises(ValueError):
+        backend_from_url("memcached://localhost")
+
+
+def test_use_backend_overrides_process_backend():
+    backend = LocalBackend()
+    use_backend(backend)
+    assert get_backend() is backend
@@ -0,0 +1,117 @@
+import json
+from datetime import date
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from repositories.dashboard_repository import (
+    get_dashboard_snapshot,
+    invalidate_areas,
+    invalidate_slots,
+    invalidate_voluntario,
+)
+from repositories.errors import RepositoryError
+
+AREA = {"id": 1, "nome": "Som", "max_pessoas": 3, "dias_disponiveis": "0_Manhã,0_Noite"}
+
+
+@pytest.fixture
+def mock_db_conn():
+    with patch("repositories.dashboard_repository.connect") as mock_connect:
+        mock_conn = MagicMock()
+        mock_connect.return_value = mock_conn
+        yield mock_conn
+
+
+def test_snapshot_hit_skips_rebuild(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    grade = {"datas": [], "dias": {}, "max_rows": 2, "nao_escalados": []}
+    mock_cursor.fetchone.return_value = {"versao": 4, "grade": json.dumps(grade)}
+
+    assert get_dashboard_snapshot(AREA, 2024, 6) == grade
+    assert mock_cursor.execute.call_count == 1
+    mock_db_conn.close.assert_called_once()
+
+
+def test_snapshot_miss_builds_and_inserts(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = None
+    mock_cursor.fetchall.side_effect = [
+        [
+            {"id": 10, "voluntario_nome": "Ana", "responsavel": 1, "data": date(2024, 6, 2), "turno": "Manhã"},
+            {"id": 11, "voluntario_nome": "Bia", "responsavel": 0, "data": date(2024, 6, 2), "turno": "Manhã"},
+            # Fora da disponibilidade atual da área
+            {"id": 12, "voluntario_nome": "Caio", "responsavel": 0, "data": date(2024, 6, 5), "turno": "Noite"},
+        ],
+        [{"id": 7, "nome": "Davi", "telefone": "11999999999"}],
+    ]
+
+    grade = get_dashboard_snapshot(AREA, 2024, 6)
+
+    assert [d["iso"] for d in grade["datas"]] == [
+        "2024-06-02", "2024-06-05", "2024-06-09", "2024-06-16", "2024-06-23", "2024-06-30",
+    ]
+    assert grade["dias"]["2024-06-02"]["Manhã"] == {
+        "responsavel": [{"id": 10, "nome": "Ana"}], "equipe": [{"id": 11, "nome": "Bia"}],
+    }
+    assert grade["dias"]["2024-06-05"]["Noite"]["equipe"] == [{"id": 12, "nome": "Caio"}]
+    assert grade["max_rows"] == 3
+    assert grade["nao_escalados"] == [{"id": 7, "nome": "Davi", "telefone": "11999999999"}]
+
+    sql, params = mock_cursor.execute.call_args.args
+    assert sql.startswith("INSERT IGNORE INTO dashboard_snapshots")
+    assert params[:3] == (1, 2024, 6)
+    assert json.loads(params[3]) == grade
+    mock_db_conn.commit.assert_called_once()
+
+
+def test_stale_snapshot_is_saved_only_if_version_unchanged(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = {"versao": 5, "grade": None}
+    mock_cursor.fetchall.return_value = []
+
+    get_dashboard_snapshot(AREA, 2024, 6)
+
+    sql, params = mock_cursor.execute.call_args.args
+    assert sql.startswith("UPDATE dashboard_snapshots SET grade = %s")
+    assert "versao = %s" in sql
+    assert params[1:] == (1, 2024, 6, 5)
+
+
+def test_snapshot_error_raises_repository_error(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.execute.side_effect = Exception("DB Error")
+
+    with pytest.raises(RepositoryError):
+        get_dashboard_snapshot(AREA, 2024, 6)
+    mock_db_conn.rollback.assert_called_once()
+    mock_db_conn.close.assert_called_once()
+
+
+def test_invalidate_slots_covers_slot_and_volunteer_areas():
+    cursor = MagicMock()
+    invalidate_slots(cursor, 7, [(2, "2024-06-02"), ("1", date(2024, 7, 7)), (2, "2024-06-09")])
+
+    sql, params = cursor.execute.call_args.args
+    assert "FROM voluntario_areas WHERE voluntario_id = %s" in sql
+    assert "versao = versao + 1, grade = NULL" in sql
+    assert params == [7, 1, 2, 2024, 6, 2024, 7]
+
+    cursor.reset_mock()
+    invalidate_slots(cursor, 7, [])
+    cursor.execute.assert_not_called()
+
+
+def test_invalidate_voluntario_and_areas():
+    cursor = MagicMock()
+    invalidate_voluntario(cursor, 7, ["3", 1])
+    escalas, areas = [call.args for call in cursor.execute.call_args_list]
+    assert "FROM escalas e" in escalas[0] and escalas[1] == (7,)
+    assert areas[0].endswith("OR area_id IN (%s, %s)")
+    assert areas[1] == [7, 1, 3]
+
+    cursor.reset_mock()
+    invalidate_areas(cursor, [])
+    cursor.execute.assert_not_called()
+    invalidate_areas(cursor)
+    assert "WHERE" not in cursor.execute.call_args.args[0]
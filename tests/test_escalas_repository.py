@@ -1,21 +1,29 @@
 import pytest
 from unittest.mock import MagicMock, patch
 from repositories.escalas_repository import (
+    book_slots,
     create_escala, 
     delete_escala, 
     escala_exists, 
     get_dashboard_data, 
+    get_escala_by_id,
     count_agendados_non_responsavel,
-    get_resumo_vagas
+    get_resumo_vagas,
+    iter_escalas_export,
 )
 from repositories.errors import RepositoryError
 from datetime import date
 
 @pytest.fixture
 def mock_db_conn():
-    with patch("repositories.escalas_repository.connect") as mock_connect:
+    with patch("repositories.escalas_repository.connect") as mock_connect, \
+         patch("repositories.escalas_repository.get_area_by_id") as mock_area, \
+         patch("repositories.escalas_repository.list_areas") as mock_list_areas:
         mock_conn = MagicMock()
         mock_connect.return_value = mock_conn
+        mock_area.return_value = {"id": 1, "nome": "Som", "max_pessoas": 10}
+        mock_list_areas.return_value = [{"id": 1, "nome": "Som"}]
+        mock_conn.get_area_by_id = mock_area
         yield mock_conn
 
 def test_escala_exists(mock_db_conn):
@@ -32,7 +40,12 @@ def test_create_escala(mock_db_conn):
     
     create_escala(1, 2, "2024-05-19", "Noite")
     
-    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_count == 3
+    assert "INSERT INTO slot_ocupacao" in mock_cursor.execute.call_args_list[1].args[0]
+    # grade do dashboard do mês na área da escala e nas áreas do voluntário
+    sql, params = mock_cursor.execute.call_args_list[2].args
+    assert "INSERT INTO dashboard_snapshots" in sql
+    assert params == [1, 2, 2024, 5]
     mock_db_conn.commit.assert_called_once()
 
 def test_count_agendados_non_responsavel(mock_db_conn):
@@ -44,30 +57,71 @@ def test_count_agendados_non_responsavel(mock_db_conn):
 
 def test_delete_escala(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    delete_escala(1)
-    mock_cursor.execute.assert_called_once()
+    removida = {"voluntario_id": 7, "area_id": 2, "data": date(2024, 5, 19), "turno": "Manhã"}
+    mock_cursor.fetchall.return_value = [removida]
+    with patch("repositories.escalas_repository.events.publish") as mock_publish:
+        assert delete_escala(1) == removida
+    # horário lido para o evento e a grade, contador ajustado antes de apagar a escala
+    queries = [call.args for call in mock_cursor.execute.call_args_list]
+    assert len(queries) == 4
+    assert queries[0][0].startswith("SELECT voluntario_id, area_id, data, turno FROM escalas")
+    assert "dashboard_snapshots" in queries[1][0] and queries[1][1] == [7, 2, 2024, 5]
+    assert "slot_ocupacao" in queries[2][0] and queries[2][1] == [-1, -1, 1]
+    assert queries[3][0].startswith("DELETE FROM escalas")
     mock_db_conn.commit.assert_called_once()
+    mock_publish.assert_called_once_with("escalas_changed", slots=[(2, date(2024, 5, 19))])
+
+def test_get_escala_by_id(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    escala = {"voluntario_id": 7, "area_id": 2, "data": date(2024, 5, 19), "turno": "Manhã"}
+    mock_cursor.fetchone.return_value = escala
+    assert get_escala_by_id(1) == escala
+    sql, params = mock_cursor.execute.call_args.args
+    assert sql.startswith("SELECT voluntario_id, area_id, data, turno FROM escalas") and params == (1,)
+    mock_db_conn.close.assert_called_once()
 
 def test_get_resumo_vagas(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    # 1. Area found
-    mock_cursor.fetchone.return_value = {"max_pessoas": 10}
-    mock_cursor.fetchall.side_effect = [[{"data": date(2024, 5, 19), "turno": "Manhã", "total": 2}], []]
+    mock_cursor.fetchall.return_value = [
+        {"area_id": 1, "data": date(2024, 5, 19), "turno": "Manhã", "equipe": 2, "responsaveis": 0},
+        {"area_id": 1, "data": date(2024, 6, 2), "turno": "Noite", "equipe": 0, "responsaveis": 1},
+    ]
     
-    max_p, agr, agr_resp = get_resumo_vagas(1, 2024, 5)
-    assert max_p == 10
-    assert len(agr) == 1
-    assert len(agr_resp) == 0
+    resumo = get_resumo_vagas([1], [(2024, 5), (2024, 6)])
+    area, ocupacao = resumo[1]
+    assert area["max_pessoas"] == 10
+    assert ocupacao == {("2024-05-19", "Manhã"): (2, 0), ("2024-06-02", "Noite"): (0, 1)}
+    # max_pessoas vem do cache de áreas; equipe e responsáveis numa consulta só
+    assert mock_cursor.execute.call_count == 1
+    sql, params = mock_cursor.execute.call_args.args
+    assert "area_id IN (%s)" in sql
+    assert params == [1, date(2024, 5, 1), date(2024, 7, 1)]
 
-def test_get_resumo_vagas_not_found(mock_db_conn):
+def test_get_resumo_vagas_many_areas_one_query(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    mock_cursor.fetchone.return_value = None
-    max_p, agr, agr_resp = get_resumo_vagas(999, 2024, 5)
-    assert max_p is None
+    mock_cursor.fetchall.return_value = [
+        {"area_id": 2, "data": "2024-12-01", "turno": "Manhã", "equipe": 1, "responsaveis": 1},
+    ]
+    mock_db_conn.get_area_by_id.side_effect = lambda area_id: (
+        {"id": int(area_id), "nome": "Som", "max_pessoas": 10} if int(area_id) != 9 else None
+    )
+
+    resumo = get_resumo_vagas([2, 9, 1], [(2024, 12), (2025, 1)])
+    assert sorted(resumo) == [1, 2]
+    assert resumo[1][1] == {}
+    assert resumo[2][1] == {("2024-12-01", "Manhã"): (1, 1)}
+    sql, params = mock_cursor.execute.call_args.args
+    assert params == [1, 2, date(2024, 12, 1), date(2025, 2, 1)]
+    assert mock_cursor.execute.call_count == 1
+
+def test_get_resumo_vagas_not_found(mock_db_conn):
+    mock_db_conn.get_area_by_id.return_value = None
+    assert get_resumo_vagas([999], [(2024, 5)]) == {}
+    mock_db_conn.cursor.assert_not_called()
 
 def test_get_dashboard_data(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    mock_cursor.fetchall.side_effect = [[{"id": 1, "nome": "Som"}], [{"id": 10, "voluntario_nome": "João"}]]
+    mock_cursor.fetchall.return_value = [{"id": 10, "voluntario_nome": "João"}]
     areas, escalas = get_dashboard_data(2024, 5)
     assert len(areas) == 1
     assert len(escalas) == 1
@@ -81,16 +135,16 @@ def test_repository_error_handling(mock_db_conn):
         count_agendados_non_responsavel(1, "2024-05-19", "Manhã")
     
     with pytest.raises(RepositoryError):
-        get_resumo_vagas(1, 2024, 5)
+        get_resumo_vagas([1], [(2024, 5)])
     
     with pytest.raises(RepositoryError):
         delete_escala(1)
 
 def test_get_dashboard_data_filtered(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    mock_cursor.fetchall.side_effect = [[], []]
+    mock_cursor.fetchall.return_value = []
     areas, escalas = get_dashboard_data(2024, 5, area_filter="1")
-    assert mock_cursor.execute.call_count == 2
+    assert mock_cursor.execute.call_count == 1
     args, kwargs = mock_cursor.execute.call_args
     assert "area_id = %s" in args[0]
 
@@ -110,3 +164,135 @@ def test_create_escala_error(mock_db_conn):
     mock_cursor.execute.side_effect = Exception("Insert Error")
     with pytest.raises(RepositoryError):
         create_escala(1, 1, "2024-05-19", "Manhã")
+
+def test_month_filters_are_sargable(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = {"max_pessoas": 10}
+    mock_cursor.fetchall.return_value = []
+
+    get_resumo_vagas([1], [(2024, 12)])
+    get_dashboard_data(2024, 12)
+
+    filtered = [call.args for call in mock_cursor.execute.call_args_list if "data >=" in call.args[0]]
+    assert len(filtered) == 2
+    for query, params in filtered:
+        assert "LIKE" not in query
+        assert date(2024, 12, 1) in params and date(2025, 1, 1) in params
+
+
+def test_book_slots_validates_and_inserts_in_one_statement(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [
+        [
+            {"max_pessoas": 2, "data": date(2024, 5, 19), "turno": "Manhã", "equipe": 2},
+            {"max_pessoas": 2, "data": date(2024, 5, 26), "turno": "Manhã", "equipe": 0},
+            {"max_pessoas": 2, "data": date(2024, 6, 2), "turno": "Noite", "equipe": 1},
+        ],
+        [{"responsavel": 0, "data": date(2024, 5, 26), "turno": "Manhã"}],
+    ]
+    slots = [("2024-06-02", "Noite"), ("2024-05-19", "Manhã"), ("2024-05-26", "Manhã"), ("2024-06-02", "Noite")]
+
+    with patch("repositories.escalas_repository.events.publish") as mock_publish:
+        resultados = book_slots(7, 1, slots)
+
+    assert [r["status"] for r in resultados] == ["agendado", "lotado", "duplicado", "duplicado"]
+    # só os horários gravados invalidam resumos
+    mock_publish.assert_called_once_with("escalas_changed", slots=[(1, "2024-06-02")])
+    assert [(r["data"], r["turno"]) for r in resultados] == slots
+    queries = [call.args for call in mock_cursor.execute.call_args_list]
+    assert len(queries) == 6
+    # contadores criados e travados em ordem determinística
+    assert queries[0][0].lstrip().startswith("INSERT IGNORE INTO slot_ocupacao")
+    assert queries[0][1][:6] == ["2024-05-19", "Manhã", "2024-05-26", "Manhã", "2024-06-02", "Noite"]
+    assert "FOR UPDATE" in queries[1][0]
+    assert queries[3][0].startswith("INSERT INTO escalas")
+    assert queries[3][1] == [7, 1, "2024-06-02", "Noite"]
+    assert queries[4][0].startswith("UPDATE slot_ocupacao SET equipe = equipe + 1")
+    assert queries[4][1] == [1, "2024-06-02", "Noite"]
+    assert "INSERT INTO dashboard_snapshots" in queries[5][0]
+    assert queries[5][1] == [7, 1, 2024, 6]
+    mock_db_conn.commit.assert_called_once()
+
+
+def test_book_slots_counts_responsavel_separately(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [
+        [{"max_pessoas": 1, "data": date(2024, 5, 19), "turno": "Manhã", "equipe": 0}],
+        [{"responsavel": 1, "data": None, "turno": None}],
+    ]
+
+    resultados = book_slots(7, 1, [("2024-05-19", "Manhã")])
+
+    assert resultados[0]["status"] == "agendado"
+    assert mock_cursor.execute.call_args_list[-2].args[0].startswith(
+        "UPDATE slot_ocupacao SET responsaveis = responsaveis + 1"
+    )
+
+
+def test_book_slots_area_not_found(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = []
+
+    assert book_slots(7, 99, [("2024-05-19", "Manhã")]) is None
+    assert mock_cursor.execute.call_count == 2
+    mock_db_conn.commit.assert_not_called()
+
+
+def test_book_slots_rolls_back_on_error(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [
+        [{"max_pessoas": 5, "data": date(2024, 5, 19), "turno": "Manhã", "equipe": 0}],
+        [{"responsavel": 0, "data": None, "turno": None}],
+    ]
+    mock_cursor.execute.side_effect = [None, None, None, Exception("Duplicate entry")]
+
+    with pytest.raises(RepositoryError):
+        book_slots(7, 1, [("2024-05-19", "Manhã")])
+    mock_db_conn.rollback.assert_called_once()
+    mock_db_conn.commit.assert_not_called()
+
+@pytest.fixture
+def export_conn():
+    conn = MagicMock()
+    with patch("repositories.escalas_repository.connect_dedicated", return_value=conn) as mock_connect:
+        conn.connect = mock_connect
+        yield conn
+
+def test_iter_escalas_export_reads_unbuffered_in_batches(export_conn):
+    import pymysql.cursors
+    cursor = export_conn.cursor.return_value
+    linha = {"area": "Som", "data": date(2024, 6, 2), "turno": "Manhã", "responsavel": 1,
+             "voluntario": "Ana", "telefone": "111"}
+    cursor.fetchmany.side_effect = [[linha, linha], [linha], []]
+
+    with patch("repositories.escalas_repository.EXPORT_FETCH_ROWS", 2):
+        assert list(iter_escalas_export(date(2024, 1, 1), date(2025, 1, 1), area_id=3)) == [linha] * 3
+
+    # Conexão própria, nunca a da requisição, e cursor sem buffer
+    export_conn.connect.assert_called_once_with(readonly=True)
+    export_conn.cursor.assert_called_once_with(pymysql.cursors.SSDictCursor)
+    sql, params = cursor.execute.call_args.args
+    assert "e.data >= %s AND e.data < %s AND e.area_id = %s" in sql
+    assert params == [date(2024, 1, 1), date(2025, 1, 1), 3]
+    cursor.fetchmany.assert_called_with(2)
+    export_conn.close.assert_called_once()
+    export_conn.invalidate.assert_not_called()
+
+def test_iter_escalas_export_interrupted_discards_connection(export_conn):
+    cursor = export_conn.cursor.return_value
+    cursor.fetchmany.return_value = [{"area": "Som"}] * 3
+
+    linhas = iter_escalas_export(date(2024, 6, 1), date(2024, 7, 1))
+    next(linhas)
+    linhas.close()
+
+    # Com linhas pendentes no socket a conexão não pode voltar ao pool
+    export_conn.invalidate.assert_called_once()
+    export_conn.close.assert_not_called()
+    assert "e.area_id = %s" not in cursor.execute.call_args.args[0]
+
+def test_iter_escalas_export_error(export_conn):
+    export_conn.cursor.return_value.execute.side_effect = Exception("DB Error")
+    with pytest.raises(RepositoryError):
+        next(iter_escalas_export(date(2024, 6, 1), date(2024, 7, 1)))
+    export_conn.invalidate.assert_called_once()
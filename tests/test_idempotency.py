@@ -0,0 +1,101 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from repositories import idempotency
+from repositories.unit_of_work import UnitOfWork
+
+FORM = {"telefone": "11999999999", "area_id": "1", "slots": ["2024-06-02|Manhã"]}
+
+
+@pytest.fixture
+def keyed_db(db_standin):
+    """Banco em memória que guarda as respostas gravadas em idempotencia."""
+    gravadas = {}
+
+    def store(sql, args):
+        rota, chave, fingerprint, status_code, resposta, _ = args
+        gravadas[(rota, chave)] = {"fingerprint": fingerprint, "status_code": status_code, "resposta": resposta}
+        return []
+
+    db_standin.on(r"GET_LOCK", [{"locked": 1}])
+    db_standin.on(r"INSERT INTO idempotencia", store)
+    db_standin.on(r"SELECT .* FROM idempotencia", lambda sql, args: [gravadas[tuple(args)]] if tuple(args) in gravadas else [])
+    db_standin.gravadas = gravadas
+    return db_standin
+
+
+def post(client, key="chave-1", **form):
+    return client.post("/agendar", data=dict(FORM, **form), headers={"Idempotency-Key": key})
+
+
+def test_replay_returns_stored_response_without_running_view(client, keyed_db):
+    with patch("app.get_voluntario_by_phone", return_value={"id": 1}), \
+         patch("app.voluntario_has_area", return_value=True), \
+         patch("app.book_slots", return_value=[
+             {"data": "2024-06-02", "turno": "Manhã", "status": "agendado"},
+         ]) as mock_book:
+        first = post(client)
+        replay = post(client)
+
+    assert first.status_code == replay.status_code == 200
+    assert replay.get_json() == first.get_json()
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    mock_book.assert_called_once()
+    # lock liberado antes de a conexão voltar ao pool
+    assert any("RELEASE_LOCK" in sql for sql in keyed_db.statements)
+    assert not any("escalas" in sql for sql in keyed_db.statements)
+
+
+def test_error_responses_are_replayed_too(client, keyed_db):
+    with patch("app.get_voluntario_by_phone", return_value=None) as mock_phone:
+        first = post(client)
+        replay = post(client)
+    assert first.status_code == replay.status_code == 400
+    assert mock_phone.call_count == 1
+
+
+def test_key_reused_with_other_payload_is_rejected(client, keyed_db):
+    with patch("app.get_voluntario_by_phone", return_value=None):
+        post(client)
+        response = post(client, area_id="2")
+    assert response.status_code == 422
+
+
+def test_server_errors_are_not_stored(client, keyed_db):
+    with patch("app.get_voluntario_by_phone", side_effect=idempotency.RepositoryError("falhou")):
+        response = post(client)
+    assert response.status_code == 500
+    assert keyed_db.gravadas == {}
+
+
+def test_concurrent_duplicate_times_out_waiting(client, keyed_db):
+    keyed_db.on(r"GET_LOCK", [{"locked": 0}])
+    with patch("app.get_voluntario_by_phone") as mock_phone:
+        response = post(client)
+    assert response.status_code == 409
+    mock_phone.assert_not_called()
+    assert not any("RELEASE_LOCK" in sql for sql in keyed_db.statements)
+
+
+def test_requests_without_key_skip_idempotency(client, keyed_db):
+    with patch("app.get_voluntario_by_phone", return_value=None):
+        client.post("/agendar", data=FORM)
+    assert not any("idempotencia" in sql or "GET_LOCK" in sql for sql in keyed_db.statements)
+
+
+def test_release_failure_discards_connection():
+    raw = MagicMock()
+    raw.cursor.side_effect = Exception("gone away")
+    idempotency._release_lock(raw, "idem:x")
+    raw.invalidate.assert_called_once()
+
+
+def test_unit_of_work_close_callbacks_see_open_connection():
+    conn = MagicMock()
+    uow = UnitOfWork(connection_factory=lambda readonly=False: conn)
+    uow.connection()
+    seen = []
+    uow.on_close(lambda raw: seen.append(raw.close.called))
+    uow.close()
+    assert seen == [False]
+    conn.close.assert_called_once()
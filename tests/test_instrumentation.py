@@ -0,0 +1,87 @@
+import json
+import logging
+
+import pytest
+from flask import Flask
+from unittest.mock import MagicMock, patch
+
+from repositories import instrumentation, unit_of_work
+from repositories.voluntarios_repository import get_voluntario_area_ids, get_voluntario_by_id
+from repositories.instrumentation import normalize_sql, redact_params
+
+
+@pytest.fixture
+def timed_app():
+    app = Flask(__name__)
+    instrumentation.init_app(app)
+    unit_of_work.init_app(app)
+
+    @app.route("/areas")
+    def areas():
+        get_voluntario_by_id(1)
+        get_voluntario_area_ids(3)
+        return "ok"
+
+    return app
+
+
+@pytest.fixture
+def mock_conn():
+    conn = MagicMock()
+    with patch("database.get_db_connection", return_value=conn):
+        yield conn
+
+
+def test_normalize_sql():
+    sql = """
+        SELECT * FROM escalas
+        WHERE area_id = %s AND turno = 'Manhã' AND id IN (%s, %s, %s) LIMIT 50
+    """
+    assert normalize_sql(sql) == "SELECT * FROM escalas WHERE area_id = ? AND turno = ? AND id IN (?+) LIMIT ?"
+    assert normalize_sql("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)") == \
+        "INSERT INTO t (a, b) VALUES (?, ?), ..."
+
+
+def test_redact_params_hides_values():
+    assert redact_params(("11999999999", 3)) == {"count": 2, "types": ["str", "int"]}
+    assert redact_params([(1, "a"), (2, "b")], many=True) == {"rows": 2, "types": ["int", "str"]}
+    assert redact_params(None) is None
+
+
+def test_server_timing_header(timed_app, mock_conn):
+    response = timed_app.test_client().get("/areas")
+
+    header = response.headers["Server-Timing"]
+    assert 'desc="2 queries"' in header
+    assert header.startswith("db;dur=")
+    assert "db-slowest;dur=" in header
+    assert 'desc="SELECT ' in header.split("db-slowest")[1]
+
+
+def test_server_timing_slowest_desc_is_normalized_and_truncated():
+    stats = instrumentation.QueryStats()
+    stats.record("SELECT id FROM voluntarios WHERE telefone = '11999999999'", 3.0)
+    assert 'db-slowest;dur=3.0;desc="SELECT id FROM voluntarios WHERE telefone = ?"' in stats.server_timing()
+
+    stats.record('SELECT "função", ' + ", ".join(f"c{i}" for i in range(100)) + " FROM areas", 9.0)
+    desc = stats.server_timing().split('db-slowest;dur=9.0;desc="')[1][:-1]
+    assert len(desc) <= instrumentation.SERVER_TIMING_SQL_CHARS + 2
+    assert desc.startswith('SELECT \\"fun??o\\", c0') and desc.endswith("...")
+
+
+def test_slow_query_log(timed_app, mock_conn, caplog):
+    with patch("repositories.instrumentation.SLOW_QUERY_MS", 0), \
+         caplog.at_level(logging.WARNING, logger="pronto.slow_query"):
+        timed_app.test_client().get("/areas")
+
+    entries = [json.loads(r.getMessage()) for r in caplog.records if r.name == "pronto.slow_query"]
+    assert len(entries) == 2
+    assert entries[1]["sql"] == "SELECT area_id FROM voluntario_areas WHERE voluntario_id = ?"
+    assert entries[1]["params"] == {"count": 1, "types": ["int"]}
+    assert entries[1]["route"] == "areas"
+
+
+def test_fast_queries_are_not_logged(timed_app, mock_conn, caplog):
+    with caplog.at_level(logging.WARNING, logger="pronto.slow_query"):
+        timed_app.test_client().get("/areas")
+    assert not [r for r in caplog.records if r.name == "pronto.slow_query"]
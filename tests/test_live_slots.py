@@ -0,0 +1,193 @@
+import json
+
+import pytest
+
+from live_slots import CLOSED, RESYNC, LiveSlots, Subscription, diff, sse
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def resumo(escalados=0, max_pessoas=3, datas=("2024-06-02",)):
+    return {
+        "max_pessoas": max_pessoas,
+        "datas": [
+            {"iso": iso, "br": iso[8:] + "/" + iso[5:7], "dia_semana": "domingo", "turnos": [
+                {"nome": "Manhã", "escalados": escalados, "responsavel": 0,
+                 "vagas_livres": max(0, max_pessoas - escalados)},
+            ]}
+            for iso in datas
+        ],
+    }
+
+
+class Banco:
+    """Resumos por (area_id, ano, mes), no formato de montar_resumos_vagas."""
+
+    def __init__(self):
+        self.resumos = {}
+        self.cargas = []
+        self.carimbos = {}
+
+    def load(self, area_ids, meses):
+        self.cargas.append((list(area_ids), list(meses)))
+        return {
+            area_id: self.resumos[(area_id, *meses[0])]
+            for area_id in area_ids if (area_id, *meses[0]) in self.resumos
+        }
+
+    def stamps(self, area_id, ano, mes):
+        return ["todos", f"area:{area_id}", f"{area_id}:{ano}-{mes:02d}"]
+
+    def counters(self, nomes):
+        return [self.carimbos.get(nome, 0) for nome in nomes]
+
+
+@pytest.fixture
+def banco():
+    banco = Banco()
+    banco.resumos[(1, 2024, 6)] = resumo(escalados=1)
+    banco.resumos[(1, 2024, 7)] = resumo(escalados=0, datas=("2024-07-07",))
+    return banco
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def live(banco, clock):
+    live = LiveSlots(banco.load, banco.stamps, banco.counters, max_connections=2,
+                     queue_size=2, resync_interval=15, clock=clock)
+    # Nos testes o pump roda na mão
+    live._ensure_pump = lambda: None
+    return live
+
+
+def test_diff_reports_changed_turnos_or_none_for_new_dates():
+    assert diff(resumo(1), resumo(1)) == []
+    assert diff(resumo(1), resumo(2)) == [
+        {"iso": "2024-06-02", "nome": "Manhã", "escalados": 2, "responsavel": 0, "vagas_livres": 1},
+    ]
+    assert diff(resumo(1), resumo(1, datas=("2024-06-02", "2024-06-09"))) is None
+
+
+def test_subscription_overflow_turns_into_resync():
+    sub = Subscription([(1, 2024, 6)], limit=2)
+    sub.push("a")
+    sub.push("b")
+    sub.push("c")
+    assert sub.next(0) is RESYNC
+    assert sub.next(0) is None
+    sub.push("d")
+    sub.close()
+    assert sub.next(0) is CLOSED
+
+
+def test_subscribe_loads_each_channel_once(live, banco):
+    primeira = live.subscribe(1, [(2024, 6), (2024, 7)])
+    segunda = live.subscribe(1, [(2024, 6)])
+    assert banco.cargas == [([1], [(2024, 6)]), ([1], [(2024, 7)])]
+    assert [dados["mes"] for _, dados in live.snapshot(primeira)] == ["2024-06", "2024-07"]
+    assert live.connections == 2
+
+    # No limite do processo; área inexistente
+    assert live.subscribe(1, [(2024, 6)]) is None
+    live.unsubscribe(segunda)
+    assert live.subscribe(9, [(2024, 6)]) is False
+    assert live.connections == 1
+
+
+def test_unsubscribe_drops_unused_channels(live):
+    sub = live.subscribe(1, [(2024, 6), (2024, 7)])
+    live.unsubscribe(sub)
+    live.unsubscribe(sub)
+    assert live.connections == 0
+    assert not live._subs and not live._payloads and not live._versions
+
+
+def test_local_event_sends_only_changed_turnos(live, banco):
+    sub = live.subscribe(1, [(2024, 6), (2024, 7)])
+    banco.resumos[(1, 2024, 6)] = resumo(escalados=3)
+    live.escalas_changed(slots=[(1, "2024-06-02"), (2, "2024-06-02")])
+    live.pump()
+
+    assert banco.cargas[-1] == ([1], [(2024, 6)])
+    evento, dados = sub.next(0)
+    assert evento == "vagas"
+    assert dados["mes"] == "2024-06"
+    assert dados["turnos"] == [
+        {"iso": "2024-06-02", "nome": "Manhã", "escalados": 3, "responsavel": 0, "vagas_livres": 0},
+    ]
+    assert sub.next(0) is None
+
+
+def test_stamp_change_from_other_worker_marks_channel(live, banco):
+    sub = live.subscribe(1, [(2024, 6)])
+    live.pump()
+    cargas = len(banco.cargas)
+    live.pump()
+    assert len(banco.cargas) == cargas
+
+    banco.resumos[(1, 2024, 6)] = resumo(escalados=1, datas=("2024-06-02", "2024-06-09"))
+    banco.carimbos["area:1"] = 1
+    live.pump()
+    evento, dados = sub.next(0)
+    assert evento == "resumo"
+    assert [d["iso"] for d in dados["datas"]] == ["2024-06-02", "2024-06-09"]
+
+
+def test_periodic_resync_and_deleted_area(live, banco, clock):
+    sub = live.subscribe(1, [(2024, 6)])
+    live.pump()
+    cargas = len(banco.cargas)
+
+    clock.now += 15
+    live.pump()
+    assert len(banco.cargas) == cargas + 1
+    assert sub.next(0) is None
+
+    del banco.resumos[(1, 2024, 6)]
+    live.areas_changed(area_id="1")
+    live.pump()
+    assert sub.next(0) is CLOSED
+
+
+def test_stream_output_and_cleanup(live, banco, clock):
+    sub = live.subscribe(1, [(2024, 6)])
+    corpo = live.stream(sub, heartbeat=0, max_seconds=10)
+
+    assert next(corpo) == "retry: 3000\n\n"
+    evento = next(corpo)
+    assert evento.startswith("event: resumo\n")
+    assert json.loads(evento.split("data: ", 1)[1])["mes"] == "2024-06"
+    assert next(corpo) == ": ping\n\n"
+
+    banco.resumos[(1, 2024, 6)] = resumo(escalados=2)
+    live.escalas_changed(slots=None)
+    live.pump()
+    assert next(corpo).startswith("event: vagas\n")
+
+    clock.now += 10
+    with pytest.raises(StopIteration):
+        next(corpo)
+    assert live.connections == 0
+
+
+def test_stream_closed_by_client_unsubscribes(live):
+    sub = live.subscribe(1, [(2024, 6)])
+    corpo = live.stream(sub, heartbeat=0)
+    next(corpo)
+    corpo.close()
+    assert live.connections == 0
+
+
+def test_sse_format():
+    assert sse("fim", {}) == "event: fim\ndata: {}\n\n"
+    assert sse("vagas", {"nome": "Manhã"}) == 'event: vagas\ndata: {"nome":"Manhã"}\n\n'
@@ -0,0 +1,147 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+import migrations
+from migrations import MigrationError, create_index, discover, upgrade
+
+
+@pytest.fixture
+def mock_db_conn():
+    with patch("migrations.get_db_connection") as mock_connect:
+        mock_conn = MagicMock()
+        mock_connect.return_value = mock_conn
+        yield mock_conn
+
+
+def executed_sql(cursor):
+    return [" ".join(c.args[0].split()) for c in cursor.execute.call_args_list]
+
+
+def test_discover_is_ordered_and_starts_at_one():
+    versions = [version for version, _ in discover()]
+    assert versions == sorted(versions)
+    assert versions[:3] == [1, 2, 3]
+    assert migrations.latest_version() == versions[-1]
+
+
+def test_upgrade_applies_only_pending(mock_db_conn):
+    cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = {"locked": 1}
+    cursor.fetchall.return_value = [{"version": v} for v, _ in discover() if v != 2]
+
+    with patch("migrations.importlib.import_module") as mock_import:
+        mock_import.return_value.DESCRIPTION = "teste"
+        aplicadas = upgrade()
+
+    assert aplicadas == [2]
+    mock_import.assert_called_once_with("migrations.0002_escalas_indexes")
+    mock_import.return_value.upgrade.assert_called_once_with(cursor)
+    assert "INSERT INTO schema_version (version, description) VALUES (%s, %s)" in executed_sql(cursor)
+    assert executed_sql(cursor)[-1] == "SELECT RELEASE_LOCK(%s)"
+
+
+def test_upgrade_is_noop_when_up_to_date(mock_db_conn):
+    cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = {"locked": 1}
+    cursor.fetchall.return_value = [{"version": v} for v, _ in discover()]
+
+    assert upgrade() == []
+    assert not any(sql.startswith("INSERT INTO schema_version") for sql in executed_sql(cursor))
+
+
+def test_upgrade_respects_target(mock_db_conn):
+    cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = {"locked": 1}
+    cursor.fetchall.return_value = []
+
+    with patch("migrations.importlib.import_module") as mock_import:
+        mock_import.return_value.DESCRIPTION = "teste"
+        assert upgrade(target=1) == [1]
+
+
+def test_upgrade_requires_lock(mock_db_conn):
+    cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = {"locked": 0}
+    with pytest.raises(MigrationError):
+        upgrade()
+
+
+def test_upgrade_wraps_errors(mock_db_conn):
+    cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = {"locked": 1}
+    cursor.fetchall.side_effect = Exception("DB Error")
+    with pytest.raises(MigrationError):
+        upgrade()
+    mock_db_conn.rollback.assert_called_once()
+    mock_db_conn.close.assert_called_once()
+
+
+def test_upgrade_without_connection():
+    with patch("migrations.get_db_connection", return_value=None):
+        with pytest.raises(MigrationError):
+            upgrade()
+
+
+def test_create_index_is_idempotent():
+    cursor = MagicMock()
+    cursor.fetchone.return_value = {"1": 1}
+    assert create_index(cursor, "escalas", "idx_x", ["data"]) is False
+    assert cursor.execute.call_count == 1
+
+    cursor = MagicMock()
+    cursor.fetchone.return_value = None
+    assert create_index(cursor, "escalas", "uq_x", ["voluntario_id", "data"], unique=True) is True
+    assert cursor.execute.call_args.args[0] == "CREATE UNIQUE INDEX uq_x ON escalas (voluntario_id, data)"
+
+
+def test_verify_once_checks_version_a_single_time():
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = {"version": migrations.latest_version()}
+    connect = MagicMock(return_value=conn)
+
+    with patch("migrations._verified", False):
+        assert migrations.verify_once(connect) is True
+        assert migrations.verify_once(connect) is True
+
+    connect.assert_called_once()
+    conn.close.assert_called_once()
+
+
+def test_verify_once_reports_outdated_schema():
+    conn = MagicMock()
+    conn.cursor.return_value.__enter__.return_value.fetchone.return_value = {"version": 1}
+
+    with patch("migrations._verified", False), patch("migrations.latest_version", return_value=3):
+        assert migrations.verify_once(MagicMock(return_value=conn)) is False
+
+
+
+def test_unique_slot_migration_backs_up_and_logs_duplicates(caplog):
+    from datetime import date
+    import importlib
+
+    migration = importlib.import_module("migrations.0003_escalas_unique_slot")
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [
+        {"id": 8, "voluntario_id": 3, "data": date(2024, 6, 2), "turno": "Manhã", "mantida": 5},
+        {"id": 9, "voluntario_id": 3, "data": date(2024, 6, 2), "turno": "Manhã", "mantida": 5},
+    ]
+    cursor.fetchone.return_value = None
+
+    with caplog.at_level("WARNING", logger=migration.__name__):
+        migration.upgrade(cursor)
+
+    sql = executed_sql(cursor)
+    assert sql[1] == "CREATE TABLE IF NOT EXISTS escalas_duplicadas LIKE escalas"
+    assert sql[2] == "INSERT IGNORE INTO escalas_duplicadas SELECT * FROM escalas WHERE id IN (%s, %s)"
+    assert sql[3] == "DELETE FROM escalas WHERE id IN (%s, %s)"
+    assert cursor.execute.call_args_list[3].args[1] == [8, 9]
+    assert sql[-1].startswith("CREATE UNIQUE INDEX uq_escalas_voluntario_data_turno")
+    assert "id 8 (voluntário 3, 2024-06-02 Manhã, mantida 5); id 9" in caplog.text
+
+    cursor = MagicMock()
+    cursor.fetchall.return_value = []
+    cursor.fetchone.return_value = None
+    migration.upgrade(cursor)
+    assert not any("escalas_duplicadas" in s or s.startswith("DELETE") for s in executed_sql(cursor))
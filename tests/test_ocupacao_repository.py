@@ -0,0 +1,89 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from datetime import date
+
+from repositories.errors import RepositoryError
+from repositories.ocupacao_repository import adjust_ocupacao, lock_slots, rebuild_ocupacao, verify_ocupacao
+
+
+@pytest.fixture
+def mock_db_conn():
+    with patch("repositories.ocupacao_repository.connect") as mock_connect:
+        mock_conn = MagicMock()
+        mock_connect.return_value = mock_conn
+        yield mock_conn
+
+
+def test_adjust_ocupacao_subtracts_matching_escalas():
+    cursor = MagicMock()
+    adjust_ocupacao(cursor, "e.voluntario_id = %s", [7], sign=-1)
+
+    sql, params = cursor.execute.call_args.args
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert "WHERE e.voluntario_id = %s" in sql
+    assert params == [-1, -1, 7]
+
+
+def test_lock_slots_locks_in_sorted_order():
+    cursor = MagicMock()
+    cursor.fetchall.return_value = [
+        {"max_pessoas": 3, "data": date(2024, 5, 19), "turno": "Manhã", "equipe": 1},
+        {"max_pessoas": 3, "data": date(2024, 5, 26), "turno": "Noite", "equipe": 0},
+    ]
+
+    max_pessoas, ocupacao = lock_slots(cursor, 1, [("2024-05-26", "Noite"), ("2024-05-19", "Manhã")])
+
+    assert max_pessoas == 3
+    assert ocupacao == {("2024-05-19", "Manhã"): 1, ("2024-05-26", "Noite"): 0}
+    insert, select = [call.args for call in cursor.execute.call_args_list]
+    assert insert[1] == ["2024-05-19", "Manhã", "2024-05-26", "Noite", 1]
+    assert "FOR UPDATE" in select[0] and "ORDER BY s.data, s.turno" in select[0]
+
+
+def test_rebuild_ocupacao(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.execute.side_effect = [1, 0, 12]
+
+    assert rebuild_ocupacao() == 12
+    assert mock_cursor.execute.call_args_list[1].args[0] == "DELETE FROM slot_ocupacao"
+    mock_db_conn.commit.assert_called_once()
+
+
+def test_rebuild_ocupacao_error(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.execute.side_effect = Exception("DB Error")
+
+    with pytest.raises(RepositoryError):
+        rebuild_ocupacao()
+    mock_db_conn.rollback.assert_called_once()
+
+
+def test_verify_ocupacao_reports_drift(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.side_effect = [
+        [
+            {"area_id": 1, "data": date(2024, 5, 19), "turno": "Manhã", "equipe": 2, "responsaveis": 1},
+            {"area_id": 1, "data": date(2024, 5, 26), "turno": "Manhã", "equipe": 1, "responsaveis": 0},
+        ],
+        [
+            {"area_id": 1, "data": date(2024, 5, 19), "turno": "Manhã", "equipe": 2, "responsaveis": 1},
+            {"area_id": 2, "data": date(2024, 5, 19), "turno": "Noite", "equipe": 1, "responsaveis": 0},
+        ],
+    ]
+
+    divergencias = verify_ocupacao()
+
+    assert [(d["area_id"], d["data"], d["equipe"]) for d in divergencias] == [
+        (1, "2024-05-26", (1, 0)),
+        (2, "2024-05-19", (0, 1)),
+    ]
+
+
+def test_manage_slots_verify_exit_code():
+    import manage
+
+    with patch("repositories.ocupacao_repository.verify_ocupacao", return_value=[]):
+        assert manage.main(["slots", "verify"]) == 0
+    drift = [{"area_id": 1, "data": "2024-05-19", "turno": "Manhã", "equipe": (1, 0), "responsaveis": (0, 0)}]
+    with patch("repositories.ocupacao_repository.verify_ocupacao", return_value=drift):
+        assert manage.main(["slots", "verify"]) == 1
@@ -0,0 +1,168 @@
+"""
+Orçamento de consultas por rota.
+
+Cada rota declara quantas conexões e comandos SQL pode usar. As rotas rodam
+contra o DatabaseStandIn (tests/query_budget.py), então uma mudança que troque
+um número constante de consultas por um laço por item falha aqui.
+"""
+import io
+import json
+
+import pytest
+
+VOLUNTARIO = {"id": 7, "nome": "João", "telefone": "11999999999", "responsavel": 0}
+AREA = {"id": 1, "nome": "Som", "max_pessoas": 5, "dias_disponiveis": "0_Manhã,0_Noite"}
+
+
+@pytest.fixture
+def seeded(db_standin):
+    db_standin.on(r"FROM areas", [AREA])
+    db_standin.on(r"FROM cache_versions", [{"versao": 1}])
+    # Carga do diretório de voluntários
+    db_standin.on(r"FROM voluntarios v LEFT JOIN voluntario_areas", [dict(VOLUNTARIO, area_ids="1")])
+    db_standin.on(r"MAX\(version\)", [{"version": 999}])
+    return db_standin
+
+
+@pytest.fixture
+def admin_client(client):
+    with client.session_transaction() as sess:
+        sess["admin_logged_in"] = True
+    return client
+
+
+# (rota, método, url, form, conexões, comandos SQL)
+# Orçamentos com os caches frios: quem lê áreas ou o diretório de voluntários
+# paga versão + carga de cada um.
+ROUTE_BUDGETS = [
+    ("index", "GET", "/", None, 1, 2),
+    ("voluntario_areas", "GET", "/api/voluntario/areas?telefone=11999999999", None, 1, 4),
+    ("vagas", "GET", "/api/vagas?area_id=1&data=2024-06-02&turno=Manhã", None, 1, 3),
+    ("resumo_vagas", "GET", "/api/resumo_vagas?area_id=1", None, 1, 3),
+    ("resumo_vagas_areas", "GET", "/api/resumo_vagas?area_ids=1,2,3&meses=2", None, 1, 3),
+]
+
+
+@pytest.mark.parametrize("name,method,url,form,connections,statements", ROUTE_BUDGETS,
+                         ids=[b[0] for b in ROUTE_BUDGETS])
+def test_public_route_budget(client, seeded, name, method, url, form, connections, statements):
+    with seeded.budget(connections=connections, statements=statements):
+        response = client.open(url, method=method, data=form)
+    assert response.status_code < 500
+
+
+# (rota, url, conexões, comandos SQL)
+ADMIN_BUDGETS = [
+    # list_areas (versão + carga) + grade fria: leitura, escalas, não escalados, gravação.
+    # A grade é montada enquanto o corpo é enviado, depois da requisição: conexão do pool
+    ("dashboard", "/admin?month_year=2024-06", 2, 6),
+    # Mesma grade em colunas, sem streaming: tudo na conexão da requisição
+    ("dashboard_api", "/admin/api/dashboard?area_id=1&month_year=2024-06", 1, 6),
+    ("voluntarios", "/admin/voluntarios", 1, 4),
+    ("inativos", "/admin/inativos", 1, 4),
+    ("areas", "/admin/areas", 1, 2),
+]
+
+
+@pytest.mark.parametrize("name,url,connections,statements", ADMIN_BUDGETS, ids=[b[0] for b in ADMIN_BUDGETS])
+def test_admin_route_budget(admin_client, seeded, name, url, connections, statements):
+    seeded.on(r"COUNT\(\*\) as total", [{"total": 0}])
+    with seeded.budget(connections=connections, statements=statements):
+        response = admin_client.get(url)
+        # O dashboard é enviado em partes: as consultas da grade rodam durante a leitura do corpo
+        response.get_data()
+    assert response.status_code == 200
+
+
+def test_dashboard_with_snapshot_skips_grid_queries(admin_client, seeded):
+    grade = {"datas": [], "dias": {}, "max_rows": 2, "nao_escalados": []}
+    seeded.on(r"FROM dashboard_snapshots", [{"versao": 3, "grade": json.dumps(grade)}])
+
+    # list_areas (versão + carga) + leitura da grade pela chave
+    with seeded.budget(connections=2, statements=3, commits=1):
+        response = admin_client.get("/admin?month_year=2024-06")
+        response.get_data()
+
+    assert response.status_code == 200
+    assert not any("FROM escalas" in sql for sql in seeded.statements)
+
+
+@pytest.mark.parametrize("rows", [2, 40])
+def test_import_budget_does_not_grow_with_rows(admin_client, seeded, rows):
+    csv_content = "Nome,Telefone,Area\n" + "".join(
+        f"Voluntário {i},1198{i:07d},Som\n" for i in range(rows)
+    )
+    data = {"file": (io.BytesIO(csv_content.encode("utf-8")), "voluntarios.csv")}
+    seeded.on(r"SELECT id, telefone FROM voluntarios", lambda sql, args: [
+        {"id": i, "telefone": telefone} for i, telefone in enumerate(args)
+    ])
+
+    # list_areas (versão + carga) + telefones existentes + versão dos voluntários
+    # + INSERT voluntários + ids + INSERT áreas + grades das áreas; o lote usa
+    # conexão e commit próprios, para que um lote com erro não desfaça os outros
+    with seeded.budget(connections=2, statements=8, commits=2):
+        response = admin_client.post("/admin/voluntarios/import", data=data, content_type="multipart/form-data")
+
+    assert response.status_code == 302
+
+
+@pytest.mark.parametrize("url,statements", [
+    ("/", 0),
+    # resumo pronto no resumo_cache
+    ("/api/resumo_vagas?area_id=1", 0),
+    # voluntário e áreas vêm do diretório em memória
+    ("/api/voluntario/areas?telefone=11999999999", 0),
+])
+def test_warm_area_cache_skips_catalog_queries(client, seeded, url, statements):
+    client.get(url)
+    with seeded.budget(connections=1, statements=statements):
+        response = client.get(url)
+    assert response.status_code == 200
+    assert not any("FROM areas" in sql for sql in seeded.statements)
+
+
+def test_budget_reports_overrun(client, seeded):
+    with pytest.raises(AssertionError, match="orçamento 0"):
+        with seeded.budget(connections=1, statements=0):
+            client.get("/")
+
+
+@pytest.mark.parametrize("slots", [1, 8])
+def test_agendar_budget_does_not_grow_with_slots(client, seeded, slots):
+    form = {
+        "telefone": "11999999999",
+        "area_id": "1",
+        "slots": [f"2024-06-{day:02d}|Manhã" for day in range(1, slots + 1)],
+    }
+
+    seeded.on(r"FROM slot_ocupacao s JOIN areas", lambda sql, args: [
+        {"max_pessoas": 5, "data": data, "turno": turno, "equipe": 0}
+        for data, turno in zip(args[1::2], args[2::2])
+    ])
+
+    # voluntário + habilitação + contadores (cria, trava) + escalas do voluntário + INSERT + UPDATE
+    # + grades do mês
+    with seeded.budget(connections=1, statements=8, commits=1):
+        response = client.post("/agendar", data=form)
+
+    assert response.status_code == 200
+    assert f"{slots} agendamento(s)" in response.get_json()["message"]
+
+
+def test_agendar_with_warm_directory_skips_volunteer_queries(client, seeded):
+    form = {"telefone": "11999999999", "area_id": "1", "slots": ["2024-06-02|Manhã"]}
+    seeded.on(r"FROM slot_ocupacao s JOIN areas", [
+        {"max_pessoas": 5, "data": "2024-06-02", "turno": "Manhã", "equipe": 0},
+    ])
+    client.post("/agendar", data=form)
+
+    # contadores (cria, trava) + escalas do voluntário + INSERT + UPDATE + grades do mês
+    with seeded.budget(connections=1, statements=6, commits=1):
+        response = client.post("/agendar", data=form)
+
+    assert response.status_code == 200
+    # só a leitura de escalas do próprio agendamento toca voluntarios
+    assert not any(
+        "cache_versions" in sql or "voluntario_areas" in sql
+        for sql in seeded.statements if "dashboard_snapshots" not in sql
+    )
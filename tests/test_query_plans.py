@@ -0,0 +1,215 @@
+"""
+Regressão de planos de consulta.
+
+Roda EXPLAIN em cada consulta dos repositórios contra um MySQL local semeado e
+falha se uma consulta quente voltar a fazer full scan ou filesort. Só roda
+quando TEST_DB_HOST está definido, por exemplo:
+
+    TEST_DB_HOST=127.0.0.1 TEST_DB_PASSWORD=password python -m pytest tests/test_query_plans.py
+"""
+import os
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import pytest
+
+import database
+import migrations
+from repositories.dashboard_repository import get_dashboard_snapshot
+from repositories.escalas_repository import (
+    book_slots,
+    count_agendados_non_responsavel,
+    escala_exists,
+    get_dashboard_data,
+    get_resumo_vagas,
+    iter_escalas_export,
+)
+from repositories.ocupacao_repository import rebuild_ocupacao
+from repositories.voluntarios_directory import directory
+from repositories.voluntarios_repository import (
+    count_inativos,
+    get_voluntarios_nao_escalados,
+    list_inativos,
+)
+
+pytestmark = pytest.mark.skipif(not os.environ.get("TEST_DB_HOST"), reason="TEST_DB_HOST não definido")
+
+AREAS = 12
+VOLUNTARIOS = 3000
+ESCALAS = 40000
+INICIO = date(2023, 1, 1)
+DIAS = 730
+
+FULL_SCANS = {"ALL", "index"}
+
+
+def _test_config():
+    config = dict(database.DB_CONFIG)
+    config.update({
+        "host": os.environ.get("TEST_DB_HOST"),
+        "port": int(os.environ.get("TEST_DB_PORT", 3306)),
+        "user": os.environ.get("TEST_DB_USER", "root"),
+        "password": os.environ.get("TEST_DB_PASSWORD", "password"),
+        "database": os.environ.get("TEST_DB_NAME", "pronto_plan_test"),
+        "ssl_disabled": True,
+    })
+    config.pop("ssl", None)
+    return config
+
+
+def _seed(cursor):
+    cursor.executemany(
+        "INSERT INTO areas (nome, max_pessoas, dias_disponiveis) VALUES (%s, %s, %s)",
+        [(f"Área {i:02d}", 4, "0_Manhã,0_Noite,3_Noite") for i in range(1, AREAS + 1)],
+    )
+    cursor.executemany(
+        "INSERT INTO voluntarios (nome, telefone, responsavel) VALUES (%s, %s, %s)",
+        [(f"Voluntário {i:04d}", f"1199{i:07d}", 1 if i % 10 == 0 else 0) for i in range(1, VOLUNTARIOS + 1)],
+    )
+    cursor.executemany(
+        "INSERT INTO voluntario_areas (voluntario_id, area_id) VALUES (%s, %s)",
+        [(v, a) for v in range(1, VOLUNTARIOS + 1) for a in {v % AREAS + 1, (v * 7) % AREAS + 1}],
+    )
+
+    vistos = set()
+    escalas = []
+    for i in range(ESCALAS):
+        voluntario_id = i % VOLUNTARIOS + 1
+        dia = INICIO + timedelta(days=(i * 7 + i // VOLUNTARIOS) % DIAS)
+        turno = "Manhã" if i % 2 else "Noite"
+        if (voluntario_id, dia, turno) in vistos:
+            continue
+        vistos.add((voluntario_id, dia, turno))
+        escalas.append((voluntario_id, voluntario_id % AREAS + 1, dia, turno))
+    cursor.executemany(
+        "INSERT INTO escalas (voluntario_id, area_id, data, turno) VALUES (%s, %s, %s, %s)", escalas
+    )
+    for tabela in ("areas", "voluntarios", "voluntario_areas", "escalas"):
+        cursor.execute(f"ANALYZE TABLE {tabela}")
+        cursor.fetchall()
+
+
+@pytest.fixture(scope="module")
+def plan_db():
+    import pymysql
+
+    config = _test_config()
+    nome_banco = config.pop("database")
+    admin = pymysql.connect(**config)
+    with admin.cursor() as cursor:
+        cursor.execute(f"DROP DATABASE IF EXISTS {nome_banco}")
+        cursor.execute(f"CREATE DATABASE {nome_banco} CHARACTER SET utf8mb4")
+    config["database"] = nome_banco
+
+    with patch.dict(database.DB_CONFIG, config, clear=True):
+        database.close_pool()
+        migrations.upgrade()
+        conn = pymysql.connect(**config)
+        with conn.cursor() as cursor:
+            _seed(cursor)
+        conn.commit()
+        rebuild_ocupacao()
+        with conn.cursor() as cursor:
+            cursor.execute("ANALYZE TABLE slot_ocupacao")
+            cursor.fetchall()
+        try:
+            yield conn
+        finally:
+            conn.close()
+            database.close_pool()
+            with admin.cursor() as cursor:
+                cursor.execute(f"DROP DATABASE IF EXISTS {nome_banco}")
+            admin.close()
+
+
+class _RecordingCursor:
+    def __init__(self, cursor, statements):
+        self._cursor = cursor
+        self._statements = statements
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+    def execute(self, query, args=None):
+        self._statements.append((query, args))
+        return self._cursor.execute(query, args)
+
+
+class _RecordingConnection:
+    def __init__(self, conn, statements):
+        self._conn = conn
+        self._statements = statements
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return _RecordingCursor(self._conn.cursor(*args, **kwargs), self._statements)
+
+
+def capture(fn, *args, **kwargs):
+    """Executa a função de repositório e devolve os SELECTs que ela enviou."""
+    statements = []
+    real_get_connection = database.get_db_connection
+    def recording_connection(readonly=False):
+        return _RecordingConnection(real_get_connection(readonly=readonly), statements)
+
+    with patch("database.get_db_connection", recording_connection):
+        fn(*args, **kwargs)
+    return [(sql, args) for sql, args in statements if sql.lstrip().upper().startswith("SELECT")]
+
+
+def explain(conn, sql, args):
+    with conn.cursor() as cursor:
+        cursor.execute("EXPLAIN " + sql, args)
+        return cursor.fetchall()
+
+
+# (nome, chamada, tabelas/aliases que podem ser varridos, filesort permitido)
+HOT_QUERIES = [
+    ("count_agendados_non_responsavel",
+     lambda: count_agendados_non_responsavel(3, "2024-06-02", "Manhã"), set(), False),
+    ("escala_exists", lambda: escala_exists(42, "2024-06-02", "Manhã"), set(), False),
+    # Data fora da faixa semeada para o INSERT não alterar as outras consultas
+    ("book_slots", lambda: book_slots(42, 3, [("2030-01-06", "Manhã"), ("2030-01-13", "Noite")]), set(), True),
+    ("get_resumo_vagas", lambda: get_resumo_vagas([3], [(2024, 6)]), set(), False),
+    # ORDER BY mistura colunas de areas e voluntarios: o filesort é inevitável, o scan de escalas não
+    ("get_dashboard_data", lambda: get_dashboard_data(2024, 6), {"areas", "a"}, True),
+    ("get_dashboard_data (área)", lambda: get_dashboard_data(2024, 6, 3), {"areas", "a"}, True),
+    ("get_voluntarios_nao_escalados", lambda: get_voluntarios_nao_escalados(2024, 6, 3), set(), True),
+    # Grade do dashboard sem snapshot: escalas da área no mês + não escalados
+    ("get_dashboard_snapshot",
+     lambda: get_dashboard_snapshot({"id": 3, "max_pessoas": 5, "dias_disponiveis": "0_Manhã,0_Noite"}, 2024, 6),
+     set(), True),
+    # Exportação: ORDER BY pelo nome da área, filesort inevitável; escalas só pela faixa da área
+    ("iter_escalas_export",
+     lambda: list(iter_escalas_export(date(2024, 6, 1), date(2024, 7, 1), 3)), {"areas", "a"}, True),
+    # Telefone e áreas vêm do diretório em memória; a carga completa percorre voluntarios por definição
+    ("diretório de voluntários", lambda: (directory.clear(), directory.get("11990000042")), {"v"}, False),
+    # Inativos percorrem todos os voluntários por definição; escalas só por faixa de datas
+    ("count_inativos", lambda: count_inativos("2024-11-01"), {"v"}, False),
+    ("list_inativos", lambda: list_inativos("2024-11-01", limit=30), {"v", "va", "a"}, True),
+]
+
+
+@pytest.mark.parametrize("name,call,allow_scan,allow_filesort", HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_plan(plan_db, name, call, allow_scan, allow_filesort):
+    statements = capture(call)
+    assert statements, f"{name} não executou nenhum SELECT"
+
+    for sql, args in statements:
+        for row in explain(plan_db, sql, args):
+            table = row.get("table") or ""
+            if table.startswith("<"):
+                # tabela derivada/materializada pelo próprio MySQL
+                continue
+            if table not in allow_scan:
+                assert row["type"] not in FULL_SCANS, f"{name}: full scan em {table}\n{sql}\n{row}"
+            if not allow_filesort:
+                assert "Using filesort" not in (row.get("Extra") or ""), f"{name}: filesort em {table}\n{sql}\n{row}"
@@ -0,0 +1,115 @@
+import pytest
+from flask import Flask, jsonify
+from unittest.mock import patch
+
+import rate_limit
+from rate_limit import ConcurrencyLimiter, RateLimiter, parse_limits
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+
+    assert [limiter.hit("k", 3, 60) for _ in range(3)] == [0, 0, 0]
+    assert limiter.hit("k", 3, 60) == pytest.approx(20)
+    clock.now = 20
+    assert limiter.hit("k", 3, 60) == 0
+
+
+def test_idle_buckets_are_evicted_lru():
+    limiter = RateLimiter(max_buckets=2, clock=FakeClock())
+    limiter.hit("a", 1, 60)
+    limiter.hit("b", 1, 60)
+    limiter.hit("a", 1, 60)  # "a" usado por último
+    limiter.hit("c", 1, 60)
+
+    assert len(limiter) == 2
+    assert limiter.hit("b", 1, 60) == 0  # "b" foi descartado e recomeça cheio
+
+
+def test_parse_limits():
+    assert parse_limits("ip=30/60, telefone=5/10") == {"ip": (30, 60.0), "telefone": (5, 10.0)}
+    assert parse_limits("") == {}
+
+
+@pytest.fixture
+def limited_app():
+    app = Flask(__name__)
+    clock = FakeClock()
+    concurrency = ConcurrencyLimiter(1)
+    rate_limit.init_app(
+        app,
+        limits={"vagas": {"ip": (2, 60)}, "areas": {"telefone": (1, 60)}},
+        limiter=RateLimiter(clock=clock),
+        concurrency=concurrency,
+    )
+
+    @app.route("/vagas")
+    def vagas():
+        return jsonify({"ok": True})
+
+    @app.route("/areas")
+    def areas():
+        return jsonify({"ok": True})
+
+    @app.route("/livre")
+    def livre():
+        return "ok"
+
+    app.clock = clock
+    app.concurrency = concurrency
+    return app
+
+
+def test_returns_429_with_retry_after(limited_app):
+    client = limited_app.test_client()
+    assert client.get("/vagas").status_code == 200
+    assert client.get("/vagas").status_code == 200
+
+    response = client.get("/vagas")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "30"
+    assert client.get("/livre").status_code == 200
+
+
+def test_limits_are_per_phone(limited_app):
+    client = limited_app.test_client()
+    assert client.get("/areas?telefone=111").status_code == 200
+    assert client.get("/areas?telefone=111").status_code == 429
+    assert client.get("/areas?telefone=222").status_code == 200
+
+
+def test_ip_header_is_used_when_configured(limited_app):
+    client = limited_app.test_client()
+    with patch("rate_limit.RATE_LIMIT_IP_HEADER", "Fly-Client-IP"):
+        for _ in range(2):
+            client.get("/vagas", headers={"Fly-Client-IP": "10.0.0.1"})
+        assert client.get("/vagas", headers={"Fly-Client-IP": "10.0.0.1"}).status_code == 429
+        assert client.get("/vagas", headers={"Fly-Client-IP": "10.0.0.2"}).status_code == 200
+
+
+def test_concurrency_cap_sheds_load(limited_app):
+    client = limited_app.test_client()
+    limited_app.concurrency.try_acquire()  # outra requisição em andamento
+
+    response = client.get("/vagas")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    limited_app.concurrency.release()
+    assert client.get("/vagas").status_code == 200
+    assert limited_app.concurrency.active == 0
+
+
+def test_disabled_by_config(limited_app):
+    limited_app.config["RATE_LIMIT_ENABLED"] = False
+    client = limited_app.test_client()
+    assert all(client.get("/vagas").status_code == 200 for _ in range(5))
@@ -0,0 +1,188 @@
+import pytest
+from flask import Flask, jsonify, stream_with_context
+from unittest.mock import MagicMock, patch
+
+from repositories import unit_of_work
+from repositories.voluntarios_repository import get_voluntario_area_ids, get_voluntario_by_id
+from repositories.errors import RepositoryError
+from repositories.escalas_repository import create_escala
+
+
+@pytest.fixture
+def uow_app():
+    app = Flask(__name__)
+    unit_of_work.init_app(app)
+    stats = {}
+
+    @app.route("/reads")
+    def reads():
+        get_voluntario_by_id(1)
+        get_voluntario_area_ids(1)
+        stats["uow"] = unit_of_work.current_unit_of_work()
+        return "ok"
+
+    @app.route("/writes")
+    def writes():
+        create_escala(1, 1, "2024-05-19", "Manhã")
+        create_escala(1, 1, "2024-05-26", "Manhã")
+        stats["uow"] = unit_of_work.current_unit_of_work()
+        return "ok"
+
+    @app.route("/failed-write")
+    def failed_write():
+        try:
+            create_escala(1, 1, "2024-05-19", "Manhã")
+        except RepositoryError:
+            pass
+        return jsonify({"status": "error"}), 400
+
+    @app.route("/server-error")
+    def server_error():
+        create_escala(1, 1, "2024-05-19", "Manhã")
+        return "erro", 500
+
+    @app.route("/stream-write")
+    def stream_write():
+        def corpo():
+            yield "a"
+            create_escala(1, 1, "2024-05-19", "Manhã")
+            yield "b"
+        return app.response_class(stream_with_context(corpo()))
+
+    @app.route("/no-db")
+    def no_db():
+        return "ok"
+
+    app.stats = stats
+    return app
+
+
+@pytest.fixture
+def mock_conn():
+    conn = MagicMock()
+    with patch("database.get_db_connection", return_value=conn) as factory:
+        conn.factory = factory
+        yield conn
+
+
+def test_request_uses_single_connection(uow_app, mock_conn):
+    response = uow_app.test_client().get("/reads")
+
+    assert response.status_code == 200
+    assert mock_conn.factory.call_count == 1
+    assert mock_conn.cursor.call_count == 2
+    mock_conn.close.assert_called_once()
+    uow = uow_app.stats["uow"]
+    assert uow.connections == 1
+    assert uow.statements == 2
+
+
+def test_writes_commit_once_at_end_of_request(uow_app, mock_conn):
+    uow_app.test_client().get("/writes")
+
+    mock_conn.commit.assert_called_once()
+    mock_conn.rollback.assert_not_called()
+    mock_conn.close.assert_called_once()
+
+
+def test_write_while_streaming_commits_on_its_own(uow_app, mock_conn):
+    # O corpo é gerado depois do fim da requisição: o repositório usa o pool e faz o próprio commit
+    response = uow_app.test_client().get("/stream-write")
+
+    assert response.data == b"ab"
+    mock_conn.commit.assert_called_once()
+    mock_conn.close.assert_called_once()
+
+
+def test_participant_rollback_rolls_back_request(uow_app, mock_conn):
+    cursor = mock_conn.cursor.return_value.__enter__.return_value
+    cursor.execute.side_effect = Exception("Insert Error")
+
+    uow_app.test_client().get("/failed-write")
+
+    mock_conn.commit.assert_not_called()
+    assert mock_conn.rollback.call_count >= 1
+    mock_conn.close.assert_called_once()
+
+
+def test_server_error_response_is_rolled_back(uow_app, mock_conn):
+    uow_app.test_client().get("/server-error")
+    mock_conn.commit.assert_not_called()
+    mock_conn.rollback.assert_called_once()
+
+
+def test_no_connection_when_route_skips_database(uow_app, mock_conn):
+    uow_app.test_client().get("/no-db")
+    mock_conn.factory.assert_not_called()
+
+
+def test_commit_failure_returns_500(uow_app, mock_conn):
+    mock_conn.commit.side_effect = Exception("lost connection")
+    response = uow_app.test_client().get("/writes")
+    assert response.status_code == 500
+    mock_conn.close.assert_called_once()
+
+
+def test_outside_request_connects_directly(mock_conn):
+    create_escala(1, 1, "2024-05-19", "Manhã")
+    mock_conn.commit.assert_called_once()
+    mock_conn.close.assert_called_once()
+
+
+@pytest.fixture
+def replica_conns():
+    primary, replica = MagicMock(name="primary"), MagicMock(name="replica")
+
+    def factory(readonly=False):
+        return replica if readonly else primary
+
+    with patch("database.DB_REPLICAS", [{"host": "replica"}]), \
+         patch("database.get_db_connection", side_effect=factory):
+        yield primary, replica
+
+
+def test_reads_go_to_replica(uow_app, replica_conns):
+    primary, replica = replica_conns
+    uow_app.test_client().get("/reads")
+    assert replica.cursor.call_count == 2
+    primary.cursor.assert_not_called()
+    replica.close.assert_called_once()
+
+
+def test_write_pins_session_to_primary(uow_app, replica_conns):
+    primary, replica = replica_conns
+    client = uow_app.test_client()
+    uow_app.secret_key = "test"
+
+    client.get("/writes")
+    primary.commit.assert_called_once()
+    with client.session_transaction() as sess:
+        assert unit_of_work.PIN_SESSION_KEY in sess
+
+    client.get("/reads")
+    replica.cursor.assert_not_called()
+    assert primary.cursor.call_count == 4
+
+
+def test_reads_after_write_in_same_request_use_primary(replica_conns):
+    primary, replica = replica_conns
+    uow = unit_of_work.UnitOfWork()
+    uow.connection()
+    assert uow.connection(readonly=True)._conn is primary
+    uow.close()
+
+
+def test_after_commit_callbacks_run_only_after_commit(mock_conn):
+    calls = []
+    uow = unit_of_work.UnitOfWork()
+    uow.connection()
+    uow.after_commit(lambda: calls.append("commit"))
+    assert calls == []
+    uow.commit()
+    assert calls == ["commit"]
+
+    uow.after_commit(lambda: calls.append("descartado"))
+    uow.rollback()
+    uow.commit()
+    assert calls == ["commit"]
+    uow.close()
@@ -31,3 +31,22 @@ def test_format_data_br():
     # Current implementation: if len == 10 and 3 parts, it flips it.
     # "20-05-2024" -> "2024/05/20"
     assert format_data_br("20-05-2024") == "2024/05/20"
+
+def test_month_range():
+    from datetime import date
+    from repositories.base import month_range
+
+    assert month_range(2024, 2) == (date(2024, 2, 1), date(2024, 3, 1))
+    assert month_range(2024, 12) == (date(2024, 12, 1), date(2025, 1, 1))
+
+def test_date_range_predicate():
+    from datetime import date
+    from repositories.base import date_range_predicate, month_predicate
+
+    sql, params = month_predicate("e.data", 2024, 5)
+    assert sql == "e.data >= %s AND e.data < %s"
+    assert params == [date(2024, 5, 1), date(2024, 6, 1)]
+
+    sql, params = date_range_predicate("data", start="2024-03-01")
+    assert sql == "data >= %s"
+    assert params == ["2024-03-01"]
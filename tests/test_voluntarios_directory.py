@@ -0,0 +1,153 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from repositories import events
+from repositories.errors import RepositoryError
+from repositories.voluntarios_directory import VoluntariosDirectory, next_version
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Banco:
+    """voluntarios (com versao e área por linha) e voluntarios_removidos, para o cursor falso."""
+
+    def __init__(self):
+        self.versao = 0
+        self.voluntarios = {}
+        self.removidos = {}
+        self.queries = []
+
+    def grava(self, id, nome, telefone, areas=(), responsavel=0):
+        self.versao += 1
+        self.voluntarios[id] = {
+            "id": id, "nome": nome, "telefone": telefone, "responsavel": responsavel,
+            "area_ids": ",".join(str(a) for a in areas) or None, "versao": self.versao,
+        }
+
+    def remove(self, id):
+        self.versao += 1
+        del self.voluntarios[id]
+        self.removidos[id] = self.versao
+
+    def responde(self, sql, params=()):
+        self.queries.append(sql)
+        if "cache_versions" in sql:
+            return [{"versao": self.versao}]
+        if "voluntarios_removidos" in sql:
+            return [{"voluntario_id": id} for id, versao in self.removidos.items() if versao > params[0]]
+        desde = params[0] if params else -1
+        return [dict(row) for row in self.voluntarios.values() if row["versao"] > desde]
+
+
+@pytest.fixture
+def banco():
+    banco = Banco()
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    estado = {}
+    cursor.execute.side_effect = lambda sql, params=(): estado.update(rows=banco.responde(sql, params))
+    cursor.fetchone.side_effect = lambda: estado["rows"][0] if estado["rows"] else None
+    cursor.fetchall.side_effect = lambda: estado["rows"]
+    with patch("repositories.voluntarios_directory.connect", return_value=conn):
+        yield banco
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def directory(clock):
+    return VoluntariosDirectory(ttl=60, check_interval=2, clock=clock)
+
+
+def test_lookup_and_membership_from_memory(banco, directory):
+    banco.grava(1, "Ana", "111", areas=[1, 3])
+    assert directory.get("111").nome == "Ana"
+    assert directory.has_area(1, 3)
+    assert len(banco.queries) == 2
+
+    assert directory.get("111").id == 1
+    assert directory.has_area(1, 1)
+    assert len(banco.queries) == 2
+
+
+def test_misses_recheck_version_before_answering(banco, directory, clock):
+    banco.grava(1, "Ana", "111", areas=[1])
+    directory.get("111")
+    clock.now += 1
+    # Cadastrado por outro worker dentro do intervalo de conferência
+    banco.grava(2, "Bia", "222", areas=[2])
+    assert directory.get("222").nome == "Bia"
+    assert directory.get("333") is None
+    assert directory.has_area(1, 2) is False
+    # Bia: versão + mudanças + removidos; cada negativa seguinte confere só a versão
+    assert len(banco.queries) == 2 + 3 + 1 + 1
+
+
+def test_incremental_refresh_fetches_only_changes(banco, directory, clock):
+    banco.grava(1, "Ana", "111", areas=[1])
+    banco.grava(2, "Bia", "222", areas=[1])
+    directory.get("111")
+
+    banco.grava(1, "Ana Maria", "111", areas=[2])
+    banco.remove(2)
+    clock.now += 5
+    assert directory.get("111").nome == "Ana Maria"
+    assert not directory.has_area(1, 1) and directory.has_area(1, 2)
+    assert directory.get("222") is None
+    assert "WHERE v.versao > %s" in banco.queries[-4]
+    assert "voluntarios_removidos" in banco.queries[-3]
+
+
+def test_phone_swap_in_one_batch(banco, directory, clock):
+    banco.grava(1, "Ana", "111")
+    banco.grava(2, "Bia", "222")
+    directory.get("111")
+
+    banco.grava(1, "Ana", "222")
+    banco.grava(2, "Bia", "111")
+    clock.now += 5
+    assert directory.get("222").id == 1
+    assert directory.get("111").id == 2
+
+
+def test_event_invalidates_and_ttl_reloads(banco, directory, clock):
+    events.subscribe("voluntarios_changed", directory.invalidate)
+    try:
+        banco.grava(1, "Ana", "111")
+        directory.get("111")
+        banco.grava(1, "Ana Paula", "111")
+        events.publish("voluntarios_changed")
+        assert directory.get("111").nome == "Ana Paula"
+    finally:
+        events._subscribers["voluntarios_changed"].remove(directory.invalidate)
+
+    # Alteração feita fora do app, sem subir a versão: aparece na carga completa
+    banco.voluntarios[1]["nome"] = "Ana P."
+    clock.now += 61
+    assert directory.get("111").nome == "Ana P."
+    assert "WHERE" not in banco.queries[-1]
+
+
+def test_database_error_raises_repository_error(directory):
+    conn = MagicMock()
+    conn.cursor.return_value.__enter__.return_value.execute.side_effect = Exception("fora do ar")
+    with patch("repositories.voluntarios_directory.connect", return_value=conn):
+        with pytest.raises(RepositoryError):
+            directory.get("111")
+
+
+def test_next_version_reserves_with_last_insert_id():
+    cursor = MagicMock(lastrowid=42)
+    assert next_version(cursor) == 42
+    sql, params = cursor.execute.call_args.args
+    assert "LAST_INSERT_ID(versao + 1)" in sql
+    assert params == ("voluntarios",)
@@ -17,29 +17,43 @@ from repositories.errors import RepositoryError, DuplicatePhoneError
 
 @pytest.fixture
 def mock_db_conn():
-    with patch("repositories.voluntarios_repository.connect") as mock_connect:
-        mock_conn = MagicMock()
-        mock_connect.return_value = mock_conn
+    mock_conn = MagicMock()
+    # As buscas por telefone passam pelo diretório em memória, que tem a própria conexão
+    with patch("repositories.voluntarios_repository.connect", return_value=mock_conn), \
+            patch("repositories.voluntarios_directory.connect", return_value=mock_conn):
         yield mock_conn
 
+def seed_directory(mock_cursor):
+    mock_cursor.fetchone.return_value = {"versao": 1}
+    mock_cursor.fetchall.return_value = [
+        {"id": 1, "nome": "João", "telefone": "123456789", "responsavel": 0, "area_ids": "1,3"},
+    ]
+
 def test_get_voluntario_by_phone(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    mock_cursor.fetchone.return_value = {"id": 1, "nome": "João", "telefone": "123456789"}
+    seed_directory(mock_cursor)
     
     v = get_voluntario_by_phone("123456789")
     
-    assert v["nome"] == "João"
-    mock_cursor.execute.assert_called_once()
+    assert v == {"id": 1, "nome": "João", "telefone": "123456789", "responsavel": 0}
+    # versão + carga completa; a segunda busca é só memória
+    assert mock_cursor.execute.call_count == 2
+    assert get_voluntario_by_phone("123456789")["id"] == 1
+    assert mock_cursor.execute.call_count == 2
 
 def test_create_voluntario(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
     mock_cursor.lastrowid = 1
     
-    create_voluntario("Maria", "987654321", 0, ["1", "2"])
+    with patch("repositories.voluntarios_repository.events.publish") as mock_publish:
+        create_voluntario("Maria", "987654321", 0, ["1", "2"])
     
-    # One for voluntarios table, two for voluntario_areas relations
-    assert mock_cursor.execute.call_count == 3
+    # Version, voluntarios table, two for voluntario_areas relations, dashboard snapshots
+    assert mock_cursor.execute.call_count == 5
+    assert "dashboard_snapshots" in mock_cursor.execute.call_args_list[4].args[0]
+    assert "LAST_INSERT_ID" in mock_cursor.execute.call_args_list[0].args[0]
     mock_db_conn.commit.assert_called_once()
+    mock_publish.assert_called_once_with("voluntarios_changed")
 
 def test_create_voluntario_duplicate_phone(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
@@ -56,28 +70,56 @@ def test_get_voluntario_by_id(mock_db_conn):
 
 def test_voluntario_has_area(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    mock_cursor.fetchone.return_value = {"1": 1}
+    seed_directory(mock_cursor)
     assert voluntario_has_area(1, 1) is True
+    assert voluntario_has_area(1, "3") is True
+    assert voluntario_has_area(1, 2) is False
+    assert voluntario_has_area(2, 1) is False
+    assert voluntario_has_area(1, "x") is False
 
 def test_list_voluntarios_with_areas(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    mock_cursor.fetchall.side_effect = [[{"id": 1, "nome": "João"}], [{"id": 1, "nome": "Som"}]]
+    mock_cursor.fetchall.return_value = [{"id": 1, "nome": "João"}]
     mock_cursor.fetchone.return_value = {"total": 1}
-    voluntarios, areas, total_count = list_voluntarios_with_areas()
+    with patch("repositories.voluntarios_repository.list_areas", return_value=[{"id": 1, "nome": "Som"}]) as mock_areas:
+        voluntarios, areas, total_count = list_voluntarios_with_areas()
+    mock_areas.assert_called_once_with(by_name=True)
     assert len(voluntarios) == 1
     assert len(areas) == 1
 
 def test_delete_voluntario(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    delete_voluntario(1)
-    assert mock_cursor.execute.call_count == 3
+    mock_cursor.fetchall.return_value = [{"area_id": 1, "data": "2024-05-19"}]
+    with patch("repositories.voluntarios_repository.events.publish") as mock_publish:
+        delete_voluntario(1)
+    assert mock_cursor.execute.call_count == 10
+    assert "dashboard_snapshots" in mock_cursor.execute.call_args_list[1].args[0]
+    assert "slot_ocupacao" in mock_cursor.execute.call_args_list[3].args[0]
+    assert "voluntarios_removidos" in mock_cursor.execute.call_args_list[8].args[0]
     mock_db_conn.commit.assert_called_once()
+    mock_publish.assert_any_call("escalas_changed", slots=[(1, "2024-05-19")])
+    mock_publish.assert_any_call("voluntarios_changed")
 
 def test_update_voluntario(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    update_voluntario(1, "João Mod", "123", 1, ["1"])
-    assert mock_cursor.execute.call_count == 3
+    mock_cursor.fetchone.return_value = {"responsavel": 1}
+    with patch("repositories.voluntarios_repository.events.publish") as mock_publish:
+        update_voluntario(1, "João Mod", "123", 1, ["1"])
+    assert mock_cursor.execute.call_count == 7
     mock_db_conn.commit.assert_called_once()
+    # mesmo papel: os resumos de vagas não mudam
+    mock_publish.assert_called_once_with("voluntarios_changed")
+
+def test_update_voluntario_role_change_moves_counters(mock_db_conn):
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchone.return_value = {"responsavel": 0}
+    update_voluntario(1, "João Mod", "123", 1, [])
+    queries = [call.args for call in mock_cursor.execute.call_args_list]
+    ajustes = [params[:2] for sql, params in queries if "INSERT INTO slot_ocupacao" in sql]
+    # sai do contador antigo antes do UPDATE e entra no novo depois
+    assert ajustes == [[-1, -1], [1, 1]]
+    assert "cache_versions" in queries[5][0]
+    assert queries[6][0].startswith("UPDATE voluntarios")
 
 def test_list_inativos(mock_db_conn):
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
@@ -128,15 +170,15 @@ def test_voluntarios_repository_errors(mock_db_conn):
 def test_get_voluntario_with_areas_by_phone(mock_db_conn):
     from repositories.voluntarios_repository import get_voluntario_with_areas_by_phone
     mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
-    # 1. Voluntário encontrado
-    mock_cursor.fetchone.return_value = {"id": 1, "nome": "João"}
-    mock_cursor.fetchall.return_value = [{"id": 1, "nome": "Som"}]
-    v, areas = get_voluntario_with_areas_by_phone("123")
-    assert v["id"] == 1
-    assert len(areas) == 1
+    seed_directory(mock_cursor)
+    catalogo = [{"id": 1, "nome": "Som"}, {"id": 2, "nome": "Luz"}]
+    # 1. Voluntário encontrado (a área 3 já foi excluída do catálogo)
+    with patch("repositories.voluntarios_repository.list_areas", return_value=catalogo):
+        v, areas = get_voluntario_with_areas_by_phone("123456789")
+    assert v == {"id": 1, "nome": "João"}
+    assert areas == [{"id": 1, "nome": "Som"}]
     
     # 2. Voluntário não encontrado
-    mock_cursor.fetchone.return_value = None
     v, areas = get_voluntario_with_areas_by_phone("999")
     assert v is None
     assert areas == []
@@ -173,3 +215,42 @@ def test_update_voluntario_duplicate(mock_db_conn):
     mock_cursor.execute.side_effect = pymysql.IntegrityError(1062, "Duplicate")
     with pytest.raises(DuplicatePhoneError):
         update_voluntario(1, "N", "T", 0, [])
+
+def test_get_existing_phones(mock_db_conn):
+    from repositories.voluntarios_repository import get_existing_phones
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [{"telefone": "222"}]
+
+    assert get_existing_phones(["111", "222", "111"]) == {"222"}
+    args, _ = mock_cursor.execute.call_args
+    assert args[1] == ("111", "222")
+    assert get_existing_phones([]) == set()
+    assert mock_cursor.execute.call_count == 1
+
+def test_create_voluntarios_uses_constant_statements(mock_db_conn):
+    from repositories.voluntarios_repository import create_voluntarios
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [{"id": 10, "telefone": "111"}, {"id": 11, "telefone": "222"}]
+
+    total = create_voluntarios([
+        ("Ana", "111", 0, ["1", "2", "1"]),
+        ("Bia", "222", 1, []),
+    ])
+
+    assert total == 2
+    assert mock_cursor.executemany.call_count == 2
+    # versão do lote + ids pelo telefone + grades das áreas
+    assert mock_cursor.execute.call_count == 3
+    mock_cursor.executemany.assert_any_call(
+        "INSERT INTO voluntario_areas (voluntario_id, area_id) VALUES (%s, %s)", [(10, 1), (10, 2)]
+    )
+    mock_db_conn.commit.assert_called_once()
+
+def test_create_voluntarios_duplicate_phone(mock_db_conn):
+    import pymysql
+    from repositories.voluntarios_repository import create_voluntarios
+    mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+    mock_cursor.executemany.side_effect = pymysql.IntegrityError("Duplicate")
+    with pytest.raises(DuplicatePhoneError):
+        create_voluntarios([("Ana", "111", 0, [])])
+    mock_db_conn.rollback.assert_called_once()